@@ -0,0 +1,213 @@
+import re
+import sqlite3
+
+from connection_manager import ConnectionManager
+from loader import BatchInserter, SQLiteInserter
+from sql_queries import postgres_vacuum_stats_select, redshift_vacuum_stats_select, table_columns_select
+
+
+# Remove the Redshift distribution styles, sort keys and column encodings from table definitions
+PHYSICAL_DESIGN_REPLACEMENTS = [
+    (r'\s*DISTSTYLE \w+', ''),
+    (r'\s*DISTKEY\(\w+\)', ''),
+    (r'\s*(COMPOUND |INTERLEAVED )?SORTKEY\([^)]*\)', ''),
+    (r' ENCODE \w+', ''),
+]
+
+
+class Backend():
+    """ Database the ETL loads into. The queries in sql_queries are written for Redshift,
+    each backend translates them into its dialect with its replacements. """
+
+    # (pattern, replacement) pairs applied to every query in this order, see translate
+    replacements = []
+    # Whether tables can be loaded with COPY, else the rows are inserted in batches with the inserter
+    supports_copy = True
+    # Whether COPY can read the staging files from STDIN, else they are copied from the S3_STAGING_BUCKET
+    copy_from_stdin = True
+    inserter = BatchInserter
+    # Query of the (table, column) pairs of the existing tables, see table_columns
+    columns_query = table_columns_select
+    # Query of the (table, percentage of unsorted or deleted rows) pairs, None if it is unknown, see tables_to_vacuum
+    vacuum_stats_query = redshift_vacuum_stats_select
+
+    def __init__(self, config):
+        """
+        Args:
+            config (configparser.ConfigParser): Config with the DWH section
+        """
+        self.config = config
+
+    def translate(self, query):
+        """Translate a Redshift query into the dialect of the backend
+
+        Args:
+            query (str): SQL query, e.g. from sql_queries
+
+        Returns:
+            str: The translated query, empty if the backend does not support the statements
+        """
+        for pattern, replacement in self.replacements:
+            query = re.sub(pattern, replacement, query)
+        return query
+
+    def execute(self, cur, query):
+        """ Translate and execute a query, queries without translation are skipped """
+        query = self.translate(query)
+        if query.strip():
+            cur.execute(query)
+
+    def execute_outside_transaction(self, conn, cur, query):
+        """ Commit and execute a query that cannot run inside a transaction, e.g. VACUUM """
+        conn.commit()
+        conn.autocommit = True
+        try:
+            self.execute(cur, query)
+        finally:
+            conn.autocommit = False
+
+    def execute_in_transaction(self, conn, cur, query):
+        """ Execute the statements of a query in one transaction, including DDL, and commit it """
+        try:
+            self.execute(cur, query)
+        except Exception:
+            conn.rollback()
+            raise
+        conn.commit()
+
+    def table_columns(self, cur):
+        """Get the tables in the database
+
+        Args:
+            cur (Cursor): Cursor for the database
+
+        Returns:
+            dict: Column names per table name
+        """
+        cur.execute(self.columns_query)
+        columns = {}
+        for table, column in cur.fetchall():
+            columns.setdefault(table, []).append(column)
+        return columns
+
+    def prepare(self):
+        """ Start opening the database in the background, if that takes long """
+
+    def connect(self):
+        """Open a connection to the database
+
+        Returns:
+            tuple of (Connection, Cursor): The connection and a new cursor
+        """
+        raise NotImplementedError
+
+    def release(self, conn):
+        """ Release a connection from connect """
+        conn.close()
+
+    def close(self):
+        """ Close all connections that are kept open by the backend """
+
+
+class RedshiftBackend(Backend):
+    """ Redshift cluster set up by the ClusterConnector, connections come from the shared pool """
+
+    copy_from_stdin = False
+
+    def prepare(self):
+        ConnectionManager.get(self.config).prepare()
+
+    def connect(self):
+        return ConnectionManager.get(self.config).connect()
+
+    def release(self, conn):
+        ConnectionManager.get(self.config).release(conn)
+
+    def close(self):
+        ConnectionManager.get(self.config).close()
+
+
+class PostgresBackend(RedshiftBackend):
+    """ PostgreSQL server at DWH_HOST, e.g. a local one for tests and benchmarks """
+
+    replacements = PHYSICAL_DESIGN_REPLACEMENTS + [
+        (r'\bdatetime\b', 'timestamp'),
+        (r'varchar\(max\)', 'text'),
+        (r'int IDENTITY\(0,1\)', 'serial'),
+    ]
+    copy_from_stdin = True
+    vacuum_stats_query = postgres_vacuum_stats_select
+
+    def __init__(self, config):
+        """
+        Args:
+            config (configparser.ConfigParser): Config with the DWH section, DWH_HOST is required
+        """
+        # Without a host, the ConnectionManager would set up a Redshift cluster instead
+        if not config.get('DWH', 'DWH_HOST', fallback=''):
+            raise ValueError("BACKEND=postgres needs the DWH_HOST of the server in the DWH section.")
+        super().__init__(config)
+
+
+class SQLiteBackend(Backend):
+    """ Embedded SQLite database in the file DWH_DB_FILE. SQLite cannot add constraints
+    to existing tables, so the foreign keys are left out. """
+
+    replacements = PHYSICAL_DESIGN_REPLACEMENTS + [
+        (r'varchar\(max\)', 'text'),
+        (r'int IDENTITY\(0,1\) PRIMARY KEY', 'INTEGER PRIMARY KEY'),
+        (r' CASCADE', ''),
+        (r'\s*ALTER TABLE \w+\s+ADD CONSTRAINT \w+\s+FOREIGN KEY [^;]*;', ''),
+        (r'information_schema\.tables WHERE table_name', "sqlite_master WHERE type = 'table' AND name"),
+        # VACUUM rebuilds the whole database file in SQLite, not a single table
+        (r'VACUUM \w+;', ''),
+    ]
+    supports_copy = False
+    inserter = SQLiteInserter
+    vacuum_stats_query = None
+    columns_query = ("SELECT m.name, p.name FROM sqlite_master m JOIN pragma_table_info(m.name) p "
+                     "WHERE m.type = 'table' ORDER BY m.name, p.cid;")
+
+    def execute(self, cur, query):
+        """ Translate and execute a query, the sqlite3 module only executes one statement at a time """
+        for statement in self.translate(query).split(';'):
+            if statement.strip():
+                cur.execute(statement)
+
+    def execute_outside_transaction(self, conn, cur, query):
+        """ Commit and execute a query, sqlite3 only opens transactions for data changes """
+        conn.commit()
+        self.execute(cur, query)
+
+    def execute_in_transaction(self, conn, cur, query):
+        """ Execute the statements of a query in one transaction, sqlite3 does not open one for DDL by itself """
+        conn.commit()
+        cur.execute('BEGIN')
+        super().execute_in_transaction(conn, cur, query)
+
+    def connect(self):
+        conn = sqlite3.connect(self.config.get('DWH', 'DWH_DB_FILE', fallback='dwh.sqlite'),
+                               timeout=60, check_same_thread=False)
+        return conn, conn.cursor()
+
+
+BACKENDS = {
+    'redshift': RedshiftBackend,
+    'postgres': PostgresBackend,
+    'sqlite': SQLiteBackend,
+}
+
+
+def create_backend(config):
+    """Create the backend named by BACKEND in the ETL section, Redshift by default
+
+    Args:
+        config (configparser.ConfigParser): Config with the ETL and DWH sections
+
+    Returns:
+        Backend: The backend
+    """
+    name = config.get('ETL', 'BACKEND', fallback='redshift')
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend {name}, choose one of {', '.join(BACKENDS)}.")
+    return BACKENDS[name](config)
@@ -0,0 +1,122 @@
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow.compute as pc
+
+from data_parser import RECIPES_COLUMNS, REVIEWS_COLUMNS
+from transforms import list_array
+
+# Key and hashed columns of each source, the columns the ETL loads
+SOURCE_COLUMNS = {
+    'recipes': ('RecipeId', [column for column in RECIPES_COLUMNS if column != 'RecipeId']),
+    'reviews': ('ReviewId', [column for column in REVIEWS_COLUMNS if column != 'ReviewId']),
+}
+LIST_COLUMNS = ['Images', 'Keywords', 'RecipeIngredientQuantities', 'RecipeIngredientParts']
+# Separator of the list values in the hashed strings, it does not occur in the data
+LIST_SEPARATOR = '\x1f'
+
+
+def normalize_column(col):
+    """ Get a column in the same representation in the default and the compact mode of the DataParser,
+    lists as joined strings and timestamps as naive nanoseconds """
+    if col.name in LIST_COLUMNS:
+        joined = pc.binary_join(list_array(col), LIST_SEPARATOR)
+        return pd.Series(joined.to_numpy(zero_copy_only=False), index=col.index, name=col.name)
+    if isinstance(col.dtype, pd.DatetimeTZDtype):
+        col = col.dt.tz_convert(None)
+    if pd.api.types.is_datetime64_dtype(col.dtype):
+        return col.astype('datetime64[ns]')
+    if isinstance(col.dtype, pd.StringDtype):
+        return col.astype(object)
+    return col
+
+
+def row_hashes(data, columns):
+    """Get a 64-bit hash of each row over the columns
+
+    Args:
+        data (pd.DataFrame): Prepared recipes or reviews
+        columns (list of str): Hashed columns, the ones missing in the data are skipped
+
+    Returns:
+        np.ndarray: uint64 hash per row
+    """
+    hashed = pd.DataFrame({column: normalize_column(data[column]) for column in columns if column in data},
+                          index=data.index)
+    # Most strings are distinct, factorizing them before hashing does not pay off
+    return pd.util.hash_pandas_object(hashed, index=False, categorize=False).to_numpy()
+
+
+class ChangeDetector():
+    """ Find the inserted, updated and deleted rows of the full dumps of the input files by comparing a hash
+    of each row with the manifest of the last run. The manifest keeps the key and hash of each row per source. """
+
+    def __init__(self, manifest_dir):
+        """
+        Args:
+            manifest_dir (pathlib.Path or str): Directory of the manifests, it is created when they are saved
+        """
+        self.manifest_dir = Path(manifest_dir)
+        self.manifests = {}
+        # Keys and hashes of the rows seen in this run, they become the next manifest
+        self.seen = {source: [] for source in SOURCE_COLUMNS}
+
+    def path(self, source):
+        return self.manifest_dir / f"{source}.parquet"
+
+    def manifest(self, source):
+        """ Get the hashes of the last run as Series indexed by key, empty if there is no manifest """
+        if source not in self.manifests:
+            if self.path(source).exists():
+                manifest = pd.read_parquet(self.path(source))
+                self.manifests[source] = pd.Series(manifest['hash'].to_numpy(), index=manifest['key'].to_numpy())
+            else:
+                self.manifests[source] = pd.Series([], index=np.array([], dtype=np.int64), dtype=np.uint64)
+        return self.manifests[source]
+
+    def select_changed_rows(self, data, source):
+        """Keep the rows that are new or whose hash differs from the manifest and remember all keys and hashes.
+        Can be called per chunk of a source.
+
+        Args:
+            data (pd.DataFrame): Prepared recipes or reviews
+            source (str): Either recipes or reviews
+
+        Returns:
+            pd.DataFrame: The inserted and updated rows
+        """
+        key, columns = SOURCE_COLUMNS[source]
+        keys = data[key].to_numpy(dtype=np.int64)
+        hashes = row_hashes(data, columns)
+        self.seen[source].append(pd.DataFrame({'key': keys, 'hash': hashes}))
+
+        manifest = self.manifest(source)
+        positions = manifest.index.get_indexer(keys)
+        inserted = positions == -1
+        updated = ~inserted & (manifest.to_numpy()[np.maximum(positions, 0)] != hashes) if len(manifest) else ~inserted
+        print(f"{source}: {inserted.sum()} inserted, {updated.sum()} updated of {len(data)} rows")
+        return data[inserted | updated]
+
+    def deleted_keys(self, source):
+        """ Get the keys of the manifest that were not seen in this run, call it after all chunks of the source.
+        Nothing is deleted if the source was not read in this run. """
+        if not self.seen[source]:
+            return np.array([], dtype=np.int64)
+        manifest = self.manifest(source)
+        seen = pd.concat(self.seen[source])['key']
+        deleted = manifest.index[~manifest.index.isin(seen)].to_numpy(dtype=np.int64)
+        print(f"{source}: {len(deleted)} deleted")
+        return deleted
+
+    def save(self):
+        """ Replace the manifests with the keys and hashes of this run, e.g. after the rows were loaded """
+        self.manifest_dir.mkdir(parents=True, exist_ok=True)
+        for source, seen in self.seen.items():
+            if not seen:
+                continue
+            path = self.path(source)
+            tmp_path = path.with_suffix('.tmp')
+            pd.concat(seen, ignore_index=True).to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, path)
@@ -0,0 +1,117 @@
+import json
+import os
+import shutil
+from pathlib import Path
+from threading import Lock
+
+import pandas as pd
+
+from parse_cache import file_digest
+
+# File of the completed stages in the checkpoint directory
+STATE_FILE = 'checkpoints.json'
+
+
+def run_fingerprint(input_files, **options):
+    """Get the fingerprint of a run, a resumed run has to have the same one
+
+    Args:
+        input_files (list of pathlib.Path or str): Input files, their content is hashed
+        options: Everything else that changes the stages of the run, e.g. the chunk size
+
+    Returns:
+        dict: SHA-256 of each input file and the options
+    """
+    return {'inputs': [file_digest(input_file) for input_file in input_files], **options}
+
+
+class RunCheckpoints():
+    """ Record the completed stages of a run, e.g. each table load, with their row counts in a directory,
+    so that a failed run can be resumed after the stages it completed. The records are only resumed
+    if the fingerprint of the input files and options is the same, and discarded after a successful run. """
+
+    def __init__(self, checkpoint_dir=None):
+        """
+        Args:
+            checkpoint_dir (pathlib.Path or str, optional): Directory of the records, None keeps them in memory only
+        """
+        self.checkpoint_dir = Path(checkpoint_dir) if checkpoint_dir else None
+        self.fingerprint = None
+        self.stages = {}
+        self.lock = Lock()
+
+    def state_path(self):
+        return self.checkpoint_dir / STATE_FILE
+
+    def start(self, fingerprint=None, resume=False):
+        """Start a run. With resume, the completed stages of the last run are kept if it has the same fingerprint.
+
+        Args:
+            fingerprint (dict, optional): Fingerprint of the run, see run_fingerprint
+            resume (bool): Resume the last run instead of starting from the first stage
+
+        Returns:
+            bool: Whether the last run is resumed
+        """
+        if resume and self.checkpoint_dir and self.state_path().is_file():
+            state = json.loads(self.state_path().read_text())
+            if state['fingerprint'] == fingerprint:
+                self.fingerprint, self.stages = fingerprint, state['stages']
+                print(f"Resuming the last run after {len(self.stages)} completed stages.")
+                return True
+            print("The input files or options changed since the last run, starting from the first stage.")
+        elif resume:
+            print("No run to resume, starting from the first stage.")
+        self.fingerprint, self.stages = fingerprint, {}
+        if self.checkpoint_dir:
+            shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
+            self.write_state()
+        return False
+
+    def write_state(self):
+        """ Replace the state file, a run that fails while writing it keeps the previous one """
+        self.checkpoint_dir.mkdir(parents=True, exist_ok=True)
+        path = self.state_path()
+        tmp_path = path.with_suffix('.tmp')
+        tmp_path.write_text(json.dumps({'fingerprint': self.fingerprint, 'stages': self.stages}, indent=1))
+        os.replace(tmp_path, path)
+
+    def done(self, stage):
+        """ Whether the stage was completed in this run or in the resumed one """
+        with self.lock:
+            return stage in self.stages
+
+    def complete(self, stage, rows=None, value=None, frame=None):
+        """Record a completed stage
+
+        Args:
+            stage (str): Name of the stage, e.g. load recipes
+            rows (int, optional): Rows processed by the stage, e.g. the loaded rows
+            value (optional): JSON-serializable result that a resumed run needs instead of running the stage again
+            frame (pd.DataFrame, optional): Result frame that a resumed run needs, e.g. the rows replaced by a load
+        """
+        with self.lock:
+            record = {'rows': rows, 'value': value, 'frame': None}
+            if frame is not None and self.checkpoint_dir:
+                record['frame'] = f"{len(self.stages)}.parquet"
+                frame.to_parquet(self.checkpoint_dir / record['frame'], index=False)
+            self.stages[stage] = record
+            if self.checkpoint_dir:
+                self.write_state()
+
+    def value(self, stage):
+        """ Get the value recorded with a completed stage """
+        with self.lock:
+            return self.stages[stage]['value']
+
+    def frame(self, stage):
+        """ Get the frame recorded with a completed stage, None if it has none """
+        with self.lock:
+            frame = self.stages[stage]['frame']
+        return pd.read_parquet(self.checkpoint_dir / frame) if frame else None
+
+    def finish(self):
+        """ Discard the records after a successful run, so that the next run starts from the first stage """
+        self.stages = {}
+        if self.checkpoint_dir:
+            shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
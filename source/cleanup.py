@@ -15,6 +15,7 @@ def main():
     connector = ClusterConnector(config)
     print("Get cluster endpoint.")
     try:
+        connector.create_clients()
         connector.get_cluster_endpoint_arn()
 
         # Delete Redshift cluster and IAM role
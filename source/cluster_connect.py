@@ -1,7 +1,8 @@
+import asyncio
 import boto3
 from botocore.exceptions import ClientError
 import json
-import time
+from pathlib import Path
 import pandas as pd
 
 class ClusterConnector():
@@ -22,10 +23,14 @@ class ClusterConnector():
         self.DWH_PORT               = config.get("DWH","DWH_PORT")
 
         self.DWH_IAM_ROLE_NAME      = config.get("DWH", "DWH_IAM_ROLE_NAME")
-    
-    def setup_resources(self):
-        """ Create the necessary resources and clients for working with Redshift """
 
+        # Waiting for the cluster
+        self.DWH_WAIT_TIMEOUT       = config.getfloat("DWH", "DWH_WAIT_TIMEOUT", fallback=600)
+        self.DWH_ENDPOINT_CACHE     = Path(config.get("DWH", "DWH_ENDPOINT_CACHE", fallback=".dwh_endpoint.json"))
+        self.roleArn = None
+
+    def create_clients(self):
+        """ Create the IAM and Redshift clients """
         self.iam = boto3.client('iam',aws_access_key_id=self.KEY,
                              aws_secret_access_key=self.SECRET,
                              region_name='us-west-2'
@@ -36,7 +41,10 @@ class ClusterConnector():
                                aws_access_key_id=self.KEY,
                                aws_secret_access_key=self.SECRET
                                )
-        self.roleArn = None
+    
+    def setup_resources(self):
+        """ Create the necessary resources and clients for working with Redshift """
+        self.create_clients()
         self.create_iam_role()
         self.create_cluster()
 
@@ -58,6 +66,10 @@ class ClusterConnector():
         except Exception as e:
             print(e)
 
+        # Allow Redshift to read the COPY staging files from S3
+        self.iam.attach_role_policy(RoleName=self.DWH_IAM_ROLE_NAME,
+                                    PolicyArn="arn:aws:iam::aws:policy/AmazonS3ReadOnlyAccess")
+
         print("1.2 Get the IAM role ARN")
         self.roleArn = self.iam.get_role(RoleName=self.DWH_IAM_ROLE_NAME)['Role']['Arn']
         print(f'Role ARN: {self.roleArn}')
@@ -79,7 +91,9 @@ class ClusterConnector():
                 ClusterIdentifier=self.DWH_CLUSTER_IDENTIFIER,
                 MasterUsername=self.DWH_DB_USER,
                 MasterUserPassword=self.DWH_DB_PASSWORD,
-                
+
+                #Roles (for s3 access)
+                IamRoles=[self.roleArn]
             )
         except ClientError as e:
             if e.response['Error']['Code'] == 'ClusterAlreadyExists':
@@ -93,30 +107,93 @@ class ClusterConnector():
         props = self.redshift.describe_clusters(ClusterIdentifier=self.DWH_CLUSTER_IDENTIFIER)['Clusters'][0]
         return props
     
-    def get_cluster_endpoint_arn(self):
-        """ Get cluster endpoint and IAMRoleArn. Wait at max. 2 minutes until the cluster is available.
+    async def wait_until_available(self, timeout, initial_delay=2, max_delay=30):
+        """Poll the cluster status with exponential backoff until the cluster is available
+
+        Args:
+            timeout (float): Maximum number of seconds to wait
+            initial_delay (float): Seconds to wait after the first poll, doubled after every poll
+            max_delay (float): Maximum number of seconds between two polls
+
+        Returns:
+            dict: Cluster props of the available cluster
+
+        Raises:
+            TimeoutError: If the cluster is not available before the timeout
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        delay = initial_delay
+        while True:
+            props = await asyncio.to_thread(self.get_redshift_props)
+            if props.get('ClusterStatus') == "available":
+                return props
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise TimeoutError(f"Cluster {self.DWH_CLUSTER_IDENTIFIER} is not available after {timeout} s.")
+            print('.', end="", flush=True)
+            await asyncio.sleep(min(delay, remaining))
+            delay = min(delay * 2, max_delay)
+
+    def set_endpoint(self, props, role_arn):
+        """ Keep the endpoint and role ARN of the available cluster """
+        self.DWH_ENDPOINT = props['Endpoint']['Address']
+        self.DWH_ROLE_ARN = role_arn
+        self.cluster_props = props
+        print("DWH_ENDPOINT :: ", self.DWH_ENDPOINT)
+        print("DWH_ROLE_ARN :: ", self.DWH_ROLE_ARN)
+
+    def get_cluster_endpoint_arn(self, timeout=None):
+        """ Get cluster endpoint and IAMRoleArn. Wait until the cluster is available, at max. DWH_WAIT_TIMEOUT seconds.
+        The endpoint is written to the endpoint cache, see load_cached_endpoint. The wait blocks the calling thread,
+        the ConnectionManager runs it in a thread of its own to overlap it with the parsing.
+
+        Args:
+            timeout (float, optional): Maximum number of seconds to wait, defaults to DWH_WAIT_TIMEOUT
         Returns:
             boolean: Returns True if cluster is available, else False.
         """
         print("Get cluster endpoint", end="")
-        props = dict()
-        num_tries = 0
-        while props.get('ClusterStatus') != "available" or num_tries >= 60:
+        try:
+            props = asyncio.run(self.wait_until_available(timeout or self.DWH_WAIT_TIMEOUT))
+        except TimeoutError as e:
+            print(e)
+            return False
+        print(".")
+        self.set_endpoint(props, self.roleArn)
+        self.save_cached_endpoint()
+        return True
+
+    def save_cached_endpoint(self):
+        """ Write the endpoint and role ARN of the cluster to the endpoint cache """
+        self.DWH_ENDPOINT_CACHE.write_text(json.dumps({
+            'ClusterIdentifier': self.DWH_CLUSTER_IDENTIFIER,
+            'Endpoint': self.DWH_ENDPOINT,
+            'RoleArn': self.DWH_ROLE_ARN}))
+
+    def load_cached_endpoint(self):
+        """Use the endpoint of the last run if the cluster is still available there.
+        This needs a single describe_clusters call instead of setting up the resources and waiting.
+
+        Returns:
+            boolean: Returns True if the cached endpoint is valid, else False.
+        """
+        if not self.DWH_ENDPOINT_CACHE.is_file():
+            return False
+        cache = json.loads(self.DWH_ENDPOINT_CACHE.read_text())
+        if cache.get('ClusterIdentifier') != self.DWH_CLUSTER_IDENTIFIER:
+            return False
+        try:
             props = self.get_redshift_props()
-            time.sleep(2)
-            print('.', end ="")
-            num_tries += 1
-        if num_tries < 60:
-            print(".")
-            self.DWH_ENDPOINT = props['Endpoint']['Address']
-            self.DWH_ROLE_ARN = self.roleArn
-            self.cluster_props = props
-            print("DWH_ENDPOINT :: ", self.DWH_ENDPOINT)
-            print("DWH_ROLE_ARN :: ", self.DWH_ROLE_ARN)
-            return True
-        else:
+        except ClientError as e:
+            print(f"Cached endpoint is not valid: {e}")
             return False
-            
+        if props.get('ClusterStatus') != "available" or props['Endpoint']['Address'] != cache['Endpoint']:
+            return False
+        self.roleArn = cache['RoleArn']
+        self.set_endpoint(props, cache['RoleArn'])
+        return True
+
     def delete_cluster(self):
         """ Delete the created Redshift cluster """
         print("Deleting cluster")
@@ -125,6 +202,8 @@ class ClusterConnector():
         
     def delete_iam_role(self):
         print("Deleting IAM role.")
+        self.iam.detach_role_policy(RoleName=self.DWH_IAM_ROLE_NAME,
+                                    PolicyArn="arn:aws:iam::aws:policy/AmazonS3ReadOnlyAccess")
         self.iam.delete_role(RoleName=self.DWH_IAM_ROLE_NAME)
         print("IAM role deleted.")
 
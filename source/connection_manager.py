@@ -0,0 +1,134 @@
+from threading import Lock, Thread
+
+from psycopg2.pool import ThreadedConnectionPool
+
+from cluster_connect import ClusterConnector
+
+
+class ConnectionManager():
+    """ Resolve the cluster endpoint once and keep a pool of open connections to the database.
+    One manager is shared per database, see get. """
+
+    managers = {}
+    managers_lock = Lock()
+
+    def __init__(self, config):
+        """
+        Args:
+            config (configparser.ConfigParser): Config with the DWH and AWS sections
+        """
+        self.config = config
+        self.endpoint = None
+        self.pool = None
+        # Guards the pool, it is only held briefly and not while the cluster is waited for
+        self.lock = Lock()
+        self.endpoint_lock = Lock()
+        # Thread opening the pool in the background and its error, see prepare
+        self.preparing = None
+        self.error = None
+
+    @classmethod
+    def get(cls, config):
+        """Get the manager for the database of the config, it is created on first use
+
+        Args:
+            config (configparser.ConfigParser): Config with the DWH and AWS sections
+
+        Returns:
+            ConnectionManager: The shared manager
+        """
+        key = tuple(config['DWH'].items())
+        with cls.managers_lock:
+            if key not in cls.managers:
+                cls.managers[key] = cls(config)
+            return cls.managers[key]
+
+    def get_endpoint(self):
+        """ Get the endpoint of the Redshift cluster, only on the first call. The endpoint of the last run
+        is used if the cluster is still available there, else the cluster is set up and waited for.
+        If DWH_HOST is configured, it is used instead of a cluster. """
+        with self.endpoint_lock:
+            if self.endpoint is None and self.config.get('DWH', 'DWH_HOST', fallback=''):
+                # A database server that is not managed by the ClusterConnector, e.g. a local PostgreSQL
+                self.endpoint = self.config['DWH']['DWH_HOST']
+            if self.endpoint is None:
+                connector = ClusterConnector(self.config)
+                connector.create_clients()
+                if not connector.load_cached_endpoint():
+                    connector.setup_resources()
+                    if not connector.get_cluster_endpoint_arn():
+                        raise ConnectionRefusedError(f"Cluster {connector.DWH_CLUSTER_IDENTIFIER} is not available.")
+                self.endpoint = connector.DWH_ENDPOINT
+            return self.endpoint
+
+    def prepare(self):
+        """ Start setting up the cluster and opening the pool in a thread, e.g. while the data is parsed.
+        The waits for the cluster block that thread only. The next connect waits for it and raises its error. """
+        with self.lock:
+            if self.pool is None and self.preparing is None:
+                self.preparing = Thread(target=self.prepare_pool, daemon=True)
+                self.preparing.start()
+
+    def prepare_pool(self):
+        try:
+            self.open_pool()
+        except Exception as e:
+            print(f"Preparing the connection pool failed: {e}")
+            self.error = e
+
+    def max_connections(self):
+        """ Get the size of the pool. Each of the LOAD_WORKERS holds a connection while the ETL holds its own,
+        so the pool has at least one more connection than workers even if DWH_MAX_CONNECTIONS is lower. """
+        return max(self.config.getint('DWH', 'DWH_MAX_CONNECTIONS', fallback=8),
+                   self.config.getint('ETL', 'LOAD_WORKERS', fallback=1) + 1)
+
+    def get_pool(self):
+        """ Get the connection pool. Waits for a prepare running in the background and raises its error,
+        instead of setting up the cluster again. """
+        preparing = self.preparing
+        if preparing is not None:
+            preparing.join()
+        if self.error is not None:
+            raise self.error
+        return self.open_pool()
+
+    def open_pool(self):
+        """ Create the connection pool on first use and open the minimum number of connections """
+        if self.pool is not None:
+            return self.pool
+        endpoint = self.get_endpoint()
+        with self.lock:
+            if self.pool is None:
+                self.pool = ThreadedConnectionPool(
+                    self.config.getint('DWH', 'DWH_MIN_CONNECTIONS', fallback=1),
+                    self.max_connections(),
+                    host=endpoint,
+                    dbname=self.config['DWH']['DWH_DB'],
+                    user=self.config['DWH']['DWH_DB_USER'],
+                    password=self.config['DWH']['DWH_DB_PASSWORD'],
+                    port=self.config['DWH']['DWH_PORT'])
+            return self.pool
+
+    def connect(self):
+        """Take a connection from the pool
+
+        Returns:
+            tuple of (Connection, Cursor): The connection and a new cursor
+        """
+        conn = self.get_pool().getconn()
+        return conn, conn.cursor()
+
+    def release(self, conn):
+        """ Put a connection back into the pool, an open transaction is rolled back """
+        if not conn.closed:
+            conn.rollback()
+        self.get_pool().putconn(conn, close=bool(conn.closed))
+
+    def close(self):
+        """ Close all connections of the pool, the next connect opens a new one """
+        with self.lock:
+            if self.pool is not None:
+                self.pool.closeall()
+                self.pool = None
+            self.preparing = None
+            self.error = None
@@ -1,4 +1,9 @@
+import configparser
 import psycopg2
+from pathlib import Path
+
+from backends import create_backend
+from schema_manager import SchemaManager
 from sql_queries import create_table_queries, drop_table_queries, foreign_key_query
 
 
@@ -27,45 +32,47 @@ def create_database():
     return cur, conn
 
 
-def drop_tables(cur, conn):
+def drop_tables(cur, conn, backend):
     """
-    Drops each table using the queries in `drop_table_queries` list.
+    Drops each table using the queries in `drop_table_queries` list,
+    translated into the dialect of the backend.
     """
     for query in drop_table_queries:
-        cur.execute(query)
+        backend.execute(cur, query)
         conn.commit()
 
 
-def create_tables(cur, conn):
+def create_tables(cur, conn, backend):
     """
-    Creates each table using the queries in `create_table_queries` list. 
+    Creates each table using the queries in `create_table_queries` list,
+    translated into the dialect of the backend.
     """
     for query in create_table_queries:
-        cur.execute(query)
+        backend.execute(cur, query)
         conn.commit()
-    cur.execute(foreign_key_query)
+    backend.execute(cur, foreign_key_query)
     conn.commit()
 
 
 def main():
     """
-    - Drops (if exists) and Creates the sparkify database. 
-    
-    - Establishes connection with the sparkify database and gets
-    cursor to it.  
-    
-    - Drops all the tables.  
+    - Gets a connection to the data warehouse of the configured
+    backend and a cursor to it.
     
-    - Creates all tables needed. 
+    - Creates the missing tables and adds the missing columns,
+    the loaded data is kept, see SchemaManager.
     
-    - Finally, closes the connection. 
+    - Finally, closes the connections. 
     """
-    cur, conn = create_database()
+    config = configparser.ConfigParser()
+    config.read(Path('config') / 'dwh.cfg')
+    backend = create_backend(config)
+    conn, cur = backend.connect()
     
-    drop_tables(cur, conn)
-    create_tables(cur, conn)
+    SchemaManager(backend).migrate(cur, conn)
 
-    conn.close()
+    backend.release(conn)
+    backend.close()
 
 
 if __name__ == "__main__":
@@ -1,45 +1,375 @@
+import mmap
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from itertools import repeat
+from pathlib import Path
+
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
+
+from input_files import open_csv_range, open_input
+from parse_cache import read_frame
+
+# ISO 8601 durations as used in the recipes data, e.g. PT1H30M or P1DT2H
+DURATION_REGEX = r'^P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$'
+# Minutes per day, hour, minute and second
+DURATION_UNIT_MINUTES = np.array([24 * 60, 60, 1, 1 / 60])
+
+# Columns of the input files used by the ETL, the compact mode reads only these
+RECIPES_COLUMNS = ['RecipeId', 'Name', 'AuthorId', 'AuthorName', 'CookTime', 'PrepTime', 'TotalTime', 'DatePublished',
+    'Description', 'Images', 'RecipeCategory', 'Keywords', 'RecipeIngredientQuantities', 'RecipeIngredientParts',
+    'Calories', 'FatContent', 'SaturatedFatContent', 'CholesterolContent', 'SodiumContent', 'CarbohydrateContent',
+    'FiberContent', 'SugarContent', 'ProteinContent', 'RecipeServings', 'RecipeYield', 'RecipeInstructions']
+REVIEWS_COLUMNS = ['ReviewId', 'RecipeId', 'AuthorId', 'AuthorName', 'Rating', 'Review', 'DateSubmitted', 'DateModified']
+# Text columns stored as Arrow strings and low-cardinality columns stored as categoricals in the compact mode
+STRING_COLUMNS = ['Name', 'AuthorName', 'Description', 'RecipeInstructions', 'Review']
+CATEGORICAL_COLUMNS = ['RecipeCategory', 'RecipeYield']
+INTEGER_COLUMNS = ['RecipeId', 'AuthorId', 'ReviewId', 'Rating']
+ARROW_STRING = pd.StringDtype('pyarrow')
+REVIEWS_TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+# Types of the reviews columns that are not inferred, so that every csv partition gets the same ones
+REVIEWS_TEXT_COLUMNS = ['AuthorName', 'Review']
+REVIEWS_TIMESTAMP_COLUMNS = ['DateSubmitted', 'DateModified']
+# Version of the cleaning in prepare_reviews and prepare_recipes, increase it on changes to invalidate the ParseCache
+PARSER_VERSION = 1
+
+
+def parse_duration(col):
+    """Convert ISO 8601 durations into minutes. The regex is only evaluated once per distinct
+    duration, the result is mapped back to the rows by the factorized codes.
+
+    Args:
+        col (pd.Series): Durations as strings, e.g. PT1H30M
+
+    Returns:
+        pd.Series: Durations in minutes as floats, 0 for missing or unparseable durations
+    """
+    codes, durations = pd.factorize(col)
+    parts = pd.Series(durations, dtype=object).str.extract(DURATION_REGEX).astype(float)
+    minutes = np.nan_to_num(parts.to_numpy()) @ DURATION_UNIT_MINUTES
+    # Code -1 (missing value) selects the appended 0
+    minutes = np.append(minutes, 0.0)
+    return pd.Series(minutes[codes], index=col.index, name=col.name)
+
+
+def compact_types(data_type):
+    """ types_mapper for pyarrow's to_pandas, keeping strings and lists in Arrow instead of Python objects """
+    if pa.types.is_string(data_type) or pa.types.is_large_string(data_type):
+        return ARROW_STRING
+    if pa.types.is_list(data_type) or pa.types.is_large_list(data_type):
+        return pd.ArrowDtype(data_type)
+    return None
+
+
+def arrow_lists(data_type):
+    """ types_mapper for pyarrow's to_pandas, keeping only lists in Arrow """
+    if pa.types.is_list(data_type) or pa.types.is_large_list(data_type):
+        return pd.ArrowDtype(data_type)
+    return None
+
+
+def join_lists(col, sep):
+    """ Join the strings of each list, for object arrays of lists and Arrow lists """
+    if isinstance(col.dtype, pd.ArrowDtype):
+        joined = pc.binary_join(pa.array(col.array), sep)
+        return pd.Series(pd.arrays.ArrowExtensionArray(joined), index=col.index, name=col.name)
+    return col.str.join(sep)
+
+
+def csv_partitions(path, parts, csv_start=0, csv_end=None):
+    """Split a csv file into byte ranges of whole records. A newline only ends a record if an even number of quotes
+    precedes it, so that quoted values spanning several lines are not split.
+
+    Args:
+        path (pathlib.Path): Path to the csv file
+        parts (int): Number of ranges to aim for
+        csv_start (int): Offset of the csv data in the file, e.g. of a zip member, see input_files.open_csv_range
+        csv_end (int, optional): Offset after the csv data, defaults to the end of the file
+
+    Returns:
+        tuple of (bytes, list of tuple): The header line and the (start, end) offsets of the ranges of records in the file
+    """
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    with mapped:
+        data = np.frombuffer(mapped, dtype=np.uint8)
+        quote = ord('"')
+        csv_end = len(mapped) if csv_end is None else csv_end
+
+        def record_start(start, quotes):
+            """ Offset after the first record end from start on and the number of quotes before it """
+            while True:
+                end = mapped.find(b'\n', start, csv_end)
+                if end < 0:
+                    return csv_end, quotes
+                quotes += np.count_nonzero(data[start:end] == quote)
+                if quotes % 2 == 0:
+                    return end + 1, quotes
+                start = end + 1
+
+        header_end, quotes = record_start(csv_start, 0)
+        header = mapped[csv_start:header_end]
+        boundaries = [header_end]
+        for part in range(1, parts):
+            target = header_end + part * (csv_end - header_end) // parts
+            if target > boundaries[-1]:
+                quotes += np.count_nonzero(data[boundaries[-1]:target] == quote)
+                boundary, quotes = record_start(target, quotes)
+                boundaries.append(boundary)
+        boundaries.append(csv_end)
+        del data
+    return header, [(start, end) for start, end in zip(boundaries[:-1], boundaries[1:]) if start < end]
+
+
+def partition_buffer(data):
+    """ Serialize a cleaned partition as Arrow IPC buffer. Without the pandas metadata, the columns are converted
+    by their Arrow types, so that lists kept in Arrow come back like from pd.read_parquet. """
+    table = pa.Table.from_pandas(data, preserve_index=False).replace_schema_metadata(None)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def parse_csv_partition(parser, path, header, start, end):
+    """ Read and clean the reviews in a byte range of the csv file, see csv_partitions, as Arrow IPC buffer """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        records = f.read(end - start)
+    return partition_buffer(parser.clean_reviews(parser.read_reviews(BytesIO(header + records))))
+
+
+def parse_row_groups(parser, path, row_groups):
+    """ Read and clean the recipes in row groups of the parquet file as Arrow IPC buffer """
+    parquet_file = pq.ParquetFile(path)
+    table = parquet_file.read_row_groups(row_groups, columns=parser.recipes_columns(parquet_file))
+    # The lists stay in Arrow until the partitions are concatenated, converting them twice costs more than the cleaning
+    return partition_buffer(parser.clean_recipes(table.to_pandas(types_mapper=compact_types if parser.compact else arrow_lists)))
+
 
 class DataParser():
 
-    def prepare_reviews(self, reviews_file):
-        print("Preparing reviews data")
-        reviews = pd.read_csv(reviews_file)
+    def __init__(self, compact=False, cache=None, workers=0):
+        """
+        Args:
+            compact (bool): Read only the columns used by the ETL, keep text and lists in Arrow,
+                low-cardinality columns as categoricals and integers in the smallest dtype
+            cache (ParseCache, optional): Cache of the prepared frames, unchanged input files are not parsed again
+            workers (int): Number of processes that parse partitions of the input files, 0 or 1 parses them serially
+        """
+        self.compact = compact
+        self.cache = cache
+        self.workers = workers
+
+    def __getstate__(self):
+        # The workers of the parallel parsing neither use the cache nor start workers themselves
+        return {**self.__dict__, 'cache': None, 'workers': 0}
+
+    def parse_partitions(self, parse, partitions):
+        """Parse and clean partitions of an input file in a process pool. The frames come back as Arrow IPC
+        buffers instead of pickled objects and are concatenated in the order of the partitions.
+
+        Args:
+            parse (callable): Module-level function parsing one partition, e.g. parse_row_groups
+            partitions (list of tuple): Arguments of parse after the parser
+
+        Returns:
+            pd.DataFrame: The cleaned data, the same as parsed serially
+        """
+        types_mapper = compact_types if self.compact else None
+        with ProcessPoolExecutor(self.workers) as pool:
+            frames = [read_frame(buffer, types_mapper) for buffer in pool.map(parse, repeat(self), *zip(*partitions))]
+        data = pd.concat(frames, ignore_index=True)
+        if self.compact:
+            # Categories and integer types are chosen per partition, they are chosen again for the whole data
+            data = self.compact_frame(data)
+        return data
+
+    def cached(self, parse, input_file, source):
+        """Parse an input file, or read its prepared frame from the cache
+
+        Args:
+            parse (callable): Parses and cleans the input file, e.g. parse_reviews
+            input_file (pathlib.Path or str): Path to the input file
+            source (str): Either recipes or reviews
+
+        Returns:
+            pd.DataFrame: Prepared data
+        """
+        if self.cache is None:
+            return parse(input_file)
+        key = self.cache.key(input_file, source, PARSER_VERSION, self.compact)
+        data = self.cache.get(key, types_mapper=compact_types if self.compact else None)
+        if data is not None:
+            print(f"Read prepared {source} data from the cache")
+            return data
+        data = parse(input_file)
+        self.cache.put(key, data)
+        return data
+
+    def compact_frame(self, data):
+        """ Convert the columns of a cleaned frame into the compact dtypes, see CATEGORICAL_COLUMNS """
+        for col in data:
+            if col in CATEGORICAL_COLUMNS:
+                # Arrow string categories, like the categories restored from the ParseCache
+                data[col] = data[col].astype(ARROW_STRING).astype('category')
+            elif col in STRING_COLUMNS:
+                data[col] = data[col].astype(ARROW_STRING)
+            elif col in INTEGER_COLUMNS:
+                data[col] = pd.to_numeric(data[col], downcast='integer')
+        return data
+
+    def clean_reviews(self, reviews):
+        """Clean the reviews data. Only the columns present are cleaned, so that column subsets can be streamed.
+
+        Args:
+            reviews (pd.DataFrame): Raw reviews data
+
+        Returns:
+            pd.DataFrame: Cleaned reviews data
+        """
         # Convert dtype of timestamp columns
-        format = '%Y-%m-%dT%H:%M:%SZ'
-        reviews['DateSubmitted'] = pd.to_datetime(reviews['DateSubmitted'], format=format)
-        reviews['DateModified'] = pd.to_datetime(reviews['DateModified'], format=format)
+        for col in ['DateSubmitted', 'DateModified']:
+            if col in reviews:
+                reviews[col] = pd.to_datetime(reviews[col], format=REVIEWS_TIMESTAMP_FORMAT)
 
         # Clean other columns
         reviews['AuthorId'] = reviews['AuthorId'].astype(int)
-        reviews['AuthorName'] = reviews['AuthorName'].str.strip()
-        reviews['Review'] = reviews['Review'].str.replace("'",'"')
+        if 'AuthorName' in reviews:
+            reviews['AuthorName'] = reviews['AuthorName'].str.strip()
+        if 'Review' in reviews:
+            reviews['Review'] = reviews['Review'].str.replace("'",'"')
 
+        if self.compact:
+            reviews = self.compact_frame(reviews)
         return reviews
 
-    def prepare_recipes(self, recipes_file):
-        recipes = pd.read_parquet(recipes_file)
+    def clean_recipes(self, recipes):
+        """Clean the recipes data. Only the columns present are cleaned, so that column subsets can be streamed.
 
-        print("Preparing recipe data")
-        # Convert dtype of timestamp columns
-        def parse_duration(col):
-            hour_regex = r'PT(\d+)H.*'
-            minute_regex = r'.?(\d+)M'
-            col_hour = col.str.extract(hour_regex).replace(np.nan, 0).astype('float')
-            col_minute = col.str.extract(minute_regex).replace(np.nan, 0).astype('float')
-            duration_df = pd.concat({'hour':col_hour,'minute':col_minute}, axis=1)
-            duration = duration_df.apply(lambda col: col[0]*60 + col[1], axis=1)
-            return duration
+        Args:
+            recipes (pd.DataFrame): Raw recipes data
 
-        recipes[['CookTime', 'PrepTime', 'TotalTime']] = recipes[['CookTime', 'PrepTime', 'TotalTime']].apply(parse_duration)
+        Returns:
+            pd.DataFrame: Cleaned recipes data
+        """
+        # Convert durations into minutes
+        for col in ['CookTime', 'PrepTime', 'TotalTime']:
+            if col in recipes:
+                recipes[col] = parse_duration(recipes[col])
 
         # Clean other columns
-        recipes[['AuthorId','RecipeId']] = recipes[['AuthorId','RecipeId']].astype(int)
-        recipes['AuthorName'] = recipes['AuthorName'].str.strip()
-        recipes['RecipeInstructions'] = recipes['RecipeInstructions'].str.join(" ")
-        for col in ['Description', 'RecipeIngredientParts', 'RecipeInstructions', 'RecipeYield', 'Name']:
-            recipes[col] = recipes[col].astype(str).str.replace("'", '"')
+        for col in ['AuthorId', 'RecipeId']:
+            if col in recipes:
+                recipes[col] = recipes[col].astype(int)
+        if 'AuthorName' in recipes:
+            recipes['AuthorName'] = recipes['AuthorName'].str.strip()
+        if 'RecipeInstructions' in recipes:
+            recipes['RecipeInstructions'] = join_lists(recipes['RecipeInstructions'], " ")
+        # RecipeIngredientParts stays a list, it is paired with the quantities in build_recipe_ingredients
+        for col in ['Description', 'RecipeInstructions', 'RecipeYield', 'Name']:
+            if col in recipes:
+                recipes[col] = recipes[col].astype(str).str.replace("'", '"')
 
+        if self.compact:
+            recipes = self.compact_frame(recipes)
         return recipes
-        
\ No newline at end of file
+
+    def csv_options(self):
+        """ Options of read_csv for the reviews chunks, the compact mode reads the text columns directly into Arrow strings """
+        if not self.compact:
+            return {}
+        return {'usecols': REVIEWS_COLUMNS,
+                'dtype': {col: ARROW_STRING for col in STRING_COLUMNS if col in REVIEWS_COLUMNS}}
+
+    def prepare_reviews(self, reviews_file):
+        print("Preparing reviews data")
+        return self.cached(self.parse_reviews, reviews_file, 'reviews')
+
+    def prepare_recipes(self, recipes_file):
+        print("Preparing recipe data")
+        return self.cached(self.parse_recipes, recipes_file, 'recipes')
+
+    def read_reviews(self, f):
+        """ Read the raw reviews csv. The text and timestamp columns get fixed types, also in partitions without values. """
+        if self.compact:
+            # Arrow parses the text and timestamps without Python objects
+            column_types = {col: pa.string() for col in REVIEWS_TEXT_COLUMNS}
+            column_types.update({col: pa.timestamp('s') for col in REVIEWS_TIMESTAMP_COLUMNS})
+            options = pv.ConvertOptions(include_columns=REVIEWS_COLUMNS, strings_can_be_null=True, column_types=column_types,
+                                        timestamp_parsers=[REVIEWS_TIMESTAMP_FORMAT])
+            return pv.read_csv(f, convert_options=options).to_pandas(types_mapper=compact_types)
+        return pd.read_csv(f, dtype={col: str for col in REVIEWS_TEXT_COLUMNS})
+
+    def recipes_columns(self, parquet_file):
+        """ Columns of the recipes parquet file to read, None for all """
+        if not self.compact:
+            return None
+        return [col for col in RECIPES_COLUMNS if col in parquet_file.schema_arrow.names]
+
+    def parse_reviews(self, reviews_file):
+        if self.workers > 1:
+            # The workers read byte ranges of a file on disk, a compressed zip member is extracted for them
+            with open_csv_range(reviews_file) as (path, csv_start, csv_end):
+                header, ranges = csv_partitions(path, self.workers, csv_start, csv_end)
+                if len(ranges) > 1:
+                    return self.parse_partitions(parse_csv_partition, [(path, header, start, end) for start, end in ranges])
+        with open_input(reviews_file) as f:
+            reviews = self.read_reviews(f)
+        return self.clean_reviews(reviews)
+
+    def parse_recipes(self, recipes_file):
+        with open_input(recipes_file) as f:
+            parquet_file = pq.ParquetFile(f)
+            if self.workers > 1 and parquet_file.num_row_groups > 1:
+                if isinstance(f, Path):
+                    row_groups = np.array_split(np.arange(parquet_file.num_row_groups), min(self.workers, parquet_file.num_row_groups))
+                    return self.parse_partitions(parse_row_groups, [(f, groups.tolist()) for groups in row_groups])
+                # The workers open the file by its path, a memory-mapped zip member has none
+                print(f"Parsing {recipes_file} in one process, parallel parsing needs an extracted parquet file.")
+            if self.compact:
+                recipes = parquet_file.read(columns=self.recipes_columns(parquet_file)).to_pandas(types_mapper=compact_types)
+            else:
+                recipes = pd.read_parquet(f)
+        return self.clean_recipes(recipes)
+
+    def iter_reviews(self, reviews_file, chunk_size, columns=None):
+        """Read and clean the reviews in chunks of csv rows
+
+        Args:
+            reviews_file (pathlib.Path or str): Path to the reviews csv or a zip file containing it
+            chunk_size (int): Number of rows per chunk
+            columns (list of str, optional): Read only these columns
+
+        Yields:
+            pd.DataFrame: Cleaned chunk of the reviews data
+        """
+        options = self.csv_options()
+        if columns is not None:
+            options['usecols'] = columns
+        with open_input(reviews_file) as f, pd.read_csv(f, chunksize=chunk_size, **options) as reader:
+            for chunk in reader:
+                yield self.clean_reviews(chunk)
+
+    def iter_recipes(self, recipes_file, chunk_size, columns=None):
+        """Read and clean the recipes in batches. The batches are read row group by row group
+        and large row groups are split into batches of at most chunk_size rows.
+
+        Args:
+            recipes_file (pathlib.Path or str): Path to the recipes parquet file or a zip file containing it
+            chunk_size (int): Maximum number of rows per chunk
+            columns (list of str, optional): Read only these columns
+
+        Yields:
+            pd.DataFrame: Cleaned chunk of the recipes data
+        """
+        with open_input(recipes_file) as f:
+            parquet_file = pq.ParquetFile(f)
+            if self.compact and columns is None:
+                columns = [col for col in RECIPES_COLUMNS if col in parquet_file.schema_arrow.names]
+            for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+                yield self.clean_recipes(batch.to_pandas(types_mapper=compact_types if self.compact else None))
@@ -1,14 +1,65 @@
+import argparse
+import boto3
+import logging
+import numpy as np
 import pandas as pd
-import psycopg2
 import configparser
 from data_parser import DataParser
 from pathlib import Path
 from zipfile import ZipFile
 from sql_queries import *
-from cluster_connect import ClusterConnector
+from backends import create_backend
+from change_detection import ChangeDetector
+from checkpoints import RunCheckpoints, run_fingerprint
+from input_files import extract_member
+from instrumentation import Instrumentation
+from key_dictionary import KeyDictionary
+from parse_cache import ParseCache
+from loader import CopyLoader, parse_insert_query
+from scheduler import TableScheduler, table_dependencies
+from schema_manager import SchemaManager
+from search_index import SearchIndex
+from summary_stats import SummaryStats
+from transforms import *
+
+# Insert statement, merge key and whether rows are replaced by key in incremental loads, see write_table.
+# Tables without merge key are only appended to.
+TABLE_INSERTS = {
+    'authors': (authors_table_insert, 'author_id', False),
+    'categories': (categories_table_insert, None, False),
+    'recipes': (recipes_table_insert, 'recipe_id', False),
+    'recipe_images': (recipe_images_table_insert, 'recipe_id', True),
+    'keywords': (keywords_table_insert, None, False),
+    'recipe_keywords': (recipe_keywords_table_insert, 'recipe_id', True),
+    'ingredients': (ingredients_table_insert, None, False),
+    'recipe_ingredients': (recipe_ingredients_table_insert, 'recipe_id', True),
+    'reviews': (reviews_table_insert, 'review_id', False),
+}
+
+# Insert statement, merge key and the assignments adding new stats to the stored ones of the summary tables
+SUMMARY_TABLE_INSERTS = {
+    'recipe_stats': (recipe_stats_table_insert, 'recipe_id', recipe_stats_accumulate),
+    'author_stats': (author_stats_table_insert, 'author_id', author_stats_accumulate),
+}
+
+# Stored rows that are replaced in incremental loads and the columns of the query, their stats are subtracted
+REPLACED_ROWS_SELECTS = {
+    'reviews': (replaced_reviews_select, ['RecipeId', 'AuthorId', 'Rating']),
+    'recipes': (replaced_recipes_select, ['RecipeId', 'AuthorId']),
+}
+
+# Post-load maintenance, see maintain_tables
+MAINTENANCE_MODES = ['auto', 'analyze', 'vacuum', 'none']
+
+# Tables rebuilt from the lists of each recipe, see select_rows
+RECIPE_CHILD_TABLES = ['recipe_images', 'recipe_keywords', 'recipe_ingredients']
+
+# Timestamp column of each source whose maximum is kept as high-water mark for incremental loads
+HIGH_WATER_MARK_COLUMNS = {'recipes': 'DatePublished', 'reviews': 'DateModified'}
 
 def unzip_file(file, target_filepath):
-    """Extracts all files from a zip file into a target file path
+    """Extracts all files from a zip file into a target file path.
+    Files that were already extracted (same size and CRC) are skipped.
 
     Args:
         file (pathlib.Path or str): Path to a zip file
@@ -19,52 +70,339 @@ def unzip_file(file, target_filepath):
     """
     # opening the zip file in READ mode
     with ZipFile(file, 'r') as zip:
-    # extracting all the files
-        print('Extracting files now...')
-        zip.extractall(path = target_filepath)
-        print('Done!')
-        return zip.namelist()
+        names = zip.namelist()
+    for name in names:
+        extract_member(file, target_filepath, name)
+    print('Done!')
+    return names
 
 class ETLProcess:
-    def __init__(self, config_file, recipes_file, reviews_file):
+    def __init__(self, config_file, recipes_file, reviews_file, resume=False):
         self.config = configparser.ConfigParser()
         self.config.read(config_file)
         
         self.recipes_file = recipes_file
         self.reviews_file = reviews_file
+        # Completed stages of the run, with CHECKPOINT_DIR they are kept on disk and resume skips the stages
+        # that a failed run completed, see checkpoints
+        self.resume = resume
+        self.checkpoints = RunCheckpoints(self.config.get('ETL', 'CHECKPOINT_DIR', fallback='') or None)
+        # Index of the streamed chunk that is loaded, None if the input files are loaded at once
+        self.chunk = None
+        # Stream the input files in chunks of this many rows, 0 loads them at once
+        self.chunk_size = self.config.getint('ETL', 'CHUNK_SIZE', fallback=0)
+        # Keep the parsed data in compact dtypes and read only the used columns, see DataParser
+        self.compact = self.config.getboolean('ETL', 'COMPACT', fallback=False)
+        # Directory of the prepared input data, empty to parse the input files in every run, see parse_cache
+        parse_cache_dir = self.config.get('ETL', 'PARSE_CACHE_DIR', fallback='')
+        # Processes parsing partitions of the input files, 0 parses them in the ETL process, see DataParser
+        self.parse_workers = self.config.getint('ETL', 'PARSE_WORKERS', fallback=0)
+        self.parse_cache = None
+        if parse_cache_dir:
+            self.parse_cache = ParseCache(parse_cache_dir,
+                                          max_bytes=self.config.getint('ETL', 'PARSE_CACHE_SIZE_MB', fallback=2048) << 20)
+        # Only load rows newer than the high-water marks of the last run and merge them into the tables
+        self.incremental = self.config.getboolean('ETL', 'INCREMENTAL', fallback=False)
+        self.high_water_marks = {}
+        self.new_high_water_marks = {}
+        # Directory of the row hashes of the last run, with it incremental loads take the new, changed and deleted rows
+        # of the input files instead of the rows newer than the high-water marks, see change_detection
+        hash_manifest_dir = self.config.get('ETL', 'HASH_MANIFEST_DIR', fallback='')
+        self.change_detector = ChangeDetector(hash_manifest_dir) if hash_manifest_dir else None
+        self.deleted_recipes = []
+        # Directory of the persisted category, keyword and ingredient ids, empty to assign new ids in every full load
+        key_store_dir = self.config.get('ETL', 'KEY_STORE_DIR', fallback='')
+        self.key_store_dir = Path(key_store_dir) if key_store_dir else None
+        # Review, rating and activity stats of the loaded recipes and authors, see summary_stats
+        self.summary_stats = SummaryStats(prior_reviews=self.config.getfloat('ETL', 'BAYESIAN_PRIOR_REVIEWS', fallback=10))
+        # ANALYZE and VACUUM the tables after the load, see maintain_tables
+        self.maintenance = self.config.get('ETL', 'MAINTENANCE', fallback='auto')
+        # Percentage of unsorted or deleted rows from which `auto` vacuums a table after incremental loads
+        self.vacuum_threshold = self.config.getfloat('ETL', 'VACUUM_THRESHOLD', fallback=10)
+        # Tables whose rows this run inserted, updated or deleted, only they are maintained
+        self.changed_tables = set()
+        if self.maintenance not in MAINTENANCE_MODES:
+            raise ValueError(f"Unknown maintenance {self.maintenance}, choose one of {', '.join(MAINTENANCE_MODES)}.")
+        # File of the recipe search index built after the load, empty to skip it, see search_index
+        self.search_index_file = self.config.get('ETL', 'SEARCH_INDEX_FILE', fallback='')
+        # Database to load into, see backends
+        self.backend = create_backend(self.config)
+        self.loader = self.create_loader()
+        # Migrates the tables in incremental loads and swaps in the shadow tables of full loads, see schema_manager
+        self.schema = SchemaManager(self.backend)
+        # Whether the loads write into the shadow tables
+        self.shadow = False
+        # Timings, memory and rows of the parsing, transforms and loads, see instrumentation
+        self.instrumentation = Instrumentation(
+            metrics_file=self.config.get('ETL', 'METRICS_FILE', fallback=''),
+            profile_dir=self.config.get('ETL', 'PROFILE_DIR', fallback=''),
+            trace_memory=self.config.getboolean('ETL', 'TRACE_MEMORY', fallback=False))
 
-    def connect_to_db(self):
+    def create_loader(self):
+        """ Create the loader for the configured LOAD_MODE. With `copy` (default), staging files are loaded
+        from S3 if a staging bucket is configured, else from STDIN. Redshift has no COPY FROM STDIN,
+        so it needs the S3_STAGING_BUCKET. With `batch`, or if the backend has no COPY,
+        the rows are inserted in batches.
 
-        # setup connection to Redshift cluster
-        connector = ClusterConnector(self.config)
-        connector.setup_resources()
-        connector.get_cluster_endpoint_arn()
+        Returns:
+            CopyLoader or BatchInserter: Loader for writing DataFrames into the database
+        """
+        if self.config.get('ETL', 'LOAD_MODE', fallback='copy') == 'batch' or not self.backend.supports_copy:
+            return self.backend.inserter(batch_size=self.config.getint('ETL', 'BATCH_SIZE', fallback=10000),
+                                 commit_per_batch=self.config.get('ETL', 'BATCH_COMMIT', fallback='batch') == 'batch',
+                                 retries=self.config.getint('ETL', 'BATCH_RETRIES', fallback=2),
+                                 quarantine_dir=self.config.get('ETL', 'QUARANTINE_DIR', fallback='quarantine'))
+
+        staging_dir = self.config.get('ETL', 'STAGING_DIR', fallback='staging')
+        s3_bucket = self.config.get('ETL', 'S3_STAGING_BUCKET', fallback='')
+        if not s3_bucket and not self.backend.copy_from_stdin:
+            raise ValueError("COPY into Redshift needs the S3_STAGING_BUCKET in the ETL section, "
+                             "set it or use LOAD_MODE=batch.")
+        s3_client = None
+        if s3_bucket:
+            s3_client = boto3.client('s3',
+                                     region_name='us-west-2',
+                                     aws_access_key_id=self.config.get('AWS', 'KEY'),
+                                     aws_secret_access_key=self.config.get('AWS', 'SECRET')
+                                     )
+        return CopyLoader(staging_dir, s3_client=s3_client, s3_bucket=s3_bucket,
+                          iam_role=self.config.get('AWS', 'ARN', fallback=None),
+                          compresslevel=self.config.getint('ETL', 'STAGING_GZIP_LEVEL', fallback=1),
+                          staging_files=self.config.getint('ETL', 'STAGING_FILES', fallback=8))
 
-        conn = psycopg2.connect("host={} dbname={} user={} password={} port={}".format(
-                connector.DWH_ENDPOINT, 
-                self.config['DWH']['DWH_DB'], 
-                self.config['DWH']['DWH_DB_USER'],
-                self.config['DWH']['DWH_DB_PASSWORD'],
-                self.config['DWH']['DWH_PORT']))
+    def connect_to_db(self):
+        """Get a connection to the database of the backend. For Redshift, it comes from the pool shared
+        by all users of the same database and the cluster is set up and its endpoint resolved only once.
 
-        cur = conn.cursor()
-        return conn, cur
+        Returns:
+            tuple of (Connection, Cursor): The connection and a new cursor
+        """
+        return self.backend.connect()
+
+    def release_connection(self, conn):
+        """ Release a connection from connect_to_db, e.g. return it to the pool """
+        self.backend.release(conn)
 
     def execute_query(self, conn, cur, query, data):
-        """Execute the SQL insert query
+        """Load the data into the table of the SQL insert query with the configured loader.
+        During full loads, the data goes into the shadow table.
 
         Args:
+            conn (Connection): Connection to the database
             cur (Cursor): Cursor for the database
             query (str): SQL insert statement
             data (pd.Dataframe): Data to insert into the table
         """
-        try:
-            args_str = ",".join(["(" + ', '.join(["'"+str(y)+"'" for y in x]) + ")" for x in data.values])
-            formatted_query = query.replace("%s", args_str)
-            cur.execute(formatted_query)
-            conn.commit()
-        except Exception as e:
-            print(e)
+        table, _ = parse_insert_query(query)
+        if self.shadow:
+            query = self.schema.shadow_query(query)
+        with self.instrumentation.stage(f"load {table}", rows_in=len(data)) as record:
+            record['rows_out'] = self.loader.load(conn, cur, query, data, stats=record)
+
+    def create_staging_table(self, conn, cur, staging_table, columns, table):
+        """ Create an empty staging table with the columns of a table and commit it, so that a loader
+        rolling back a failed batch does not drop it """
+        self.backend.execute_in_transaction(conn, cur, staging_table_create.format(
+            staging_table=staging_table, columns=columns, table=table))
+
+    def upsert(self, conn, cur, query, data, key, replace=False, assignments=None):
+        """Load the data into a staging table and merge it into the table of the insert query.
+        Rows of the table with the same key as a staged row are updated, the other staged rows are inserted.
+        With replace, all rows with the key of a staged row are deleted first, e.g. all images of a recipe.
+        The stats of stored rows that are replaced are subtracted from the summary stats.
+
+        Args:
+            conn (Connection): Connection to the database
+            cur (Cursor): Cursor for the database
+            query (str): SQL insert statement
+            data (pd.Dataframe): Data to merge into the table
+            key (str): Column identifying the rows to update or replace
+            replace (bool): Replace the rows by key instead of updating them
+            assignments (str, optional): SET clause of the update, by default the staged values are taken
+
+        Returns:
+            pd.DataFrame: The replaced rows whose stats were subtracted, None if the table has no stats
+        """
+        table, columns = parse_insert_query(query)
+        staging_table = f"{table}_staging"
+        self.create_staging_table(conn, cur, staging_table, ', '.join(columns), table)
+        self.execute_query(conn, cur, query.replace(f"INSERT INTO {table} ", f"INSERT INTO {staging_table} ", 1), data)
+        replaced = self.subtract_replaced_rows(cur, table)
+        if replace:
+            self.backend.execute(cur, merge_staging_table.format(table=table, staging_table=staging_table,
+                                                                 columns=', '.join(columns), key=key))
+        else:
+            assignments = assignments or ', '.join(f"{column} = {staging_table}.{column}" for column in columns if column != key)
+            self.backend.execute(cur, upsert_staging_table.format(table=table, staging_table=staging_table,
+                                                                  columns=', '.join(columns),
+                                                                  assignments=assignments, key=key))
+        conn.commit()
+        return replaced
+
+    def subtract_replaced_rows(self, cur, table):
+        """ Subtract the stats of the stored rows with the keys in the staging table of a table, see REPLACED_ROWS_SELECTS.
+        Returns them, None if the table has no stats. """
+        if table not in REPLACED_ROWS_SELECTS:
+            return None
+        replaced_query, replaced_columns = REPLACED_ROWS_SELECTS[table]
+        self.backend.execute(cur, replaced_query)
+        replaced = pd.DataFrame(cur.fetchall(), columns=replaced_columns)
+        self.summary_stats.add(table, replaced, sign=-1)
+        return replaced
+
+    def write_table(self, conn, cur, query, data, key, replace=False):
+        """ Insert the data, or merge it by the key column if new rows are added to existing tables, see upsert """
+        if self.high_water_marks:
+            return self.upsert(conn, cur, query, data, key, replace)
+        self.execute_query(conn, cur, query, data)
+        return None
+
+    def read_high_water_marks(self, cur):
+        """Read the high-water marks of the last run
+
+        Args:
+            cur (Cursor): Cursor for the database
+
+        Returns:
+            dict: High-water mark timestamp per source, empty if nothing was loaded yet
+        """
+        self.backend.execute(cur, table_exists_query.format(table='etl_watermarks'))
+        if cur.fetchone()[0] == 0:
+            return {}
+        self.backend.execute(cur, etl_watermarks_select)
+        return {source: pd.Timestamp(high_water_mark) for source, high_water_mark in cur.fetchall()}
+
+    def write_high_water_marks(self, cur, conn):
+        """ Store the newest timestamps of the loaded sources as high-water marks for the next run """
+        high_water_marks = pd.DataFrame(list(self.new_high_water_marks.items()), columns=['source', 'high_water_mark'])
+        print("Writing high-water marks into database.")
+        self.write_table(conn, cur, etl_watermarks_table_insert, high_water_marks, 'source')
+
+    def track_high_water_mark(self, data, source):
+        """ Keep the newest timestamp of the source as its next high-water mark and get the timestamps as naive ones """
+        dates = data[HIGH_WATER_MARK_COLUMNS[source]]
+        if dates.dt.tz is not None:
+            dates = dates.dt.tz_convert(None)
+        newest = dates.max()
+        if pd.notna(newest):
+            self.new_high_water_marks[source] = max(newest, self.new_high_water_marks.get(source, newest))
+        return dates
+
+    def select_new_rows(self, data, source):
+        """Keep the rows that are newer than the high-water mark of the source and track the newest timestamp
+
+        Args:
+            data (pd.DataFrame): Prepared recipes or reviews
+            source (str): Either recipes or reviews
+
+        Returns:
+            pd.DataFrame: The new rows
+        """
+        dates = self.track_high_water_mark(data, source)
+        high_water_mark = self.high_water_marks.get(source)
+        if high_water_mark is None:
+            return data
+        return data[(dates > high_water_mark).to_numpy()]
+
+    def select_rows(self, conn, cur, data, source):
+        """Keep the rows to load. With a HASH_MANIFEST_DIR, incremental loads take the rows that are new or changed
+        since the last run and delete the images, keywords and ingredients of the changed recipes, so that they are
+        rebuilt from the loaded ones. Otherwise they take the rows newer than the high-water mark, see select_new_rows.
+
+        Args:
+            conn (Connection): Connection to the database
+            cur (Cursor): Cursor for the database
+            data (pd.DataFrame): Prepared recipes or reviews, or a chunk of them
+            source (str): Either recipes or reviews
+
+        Returns:
+            pd.DataFrame: The rows to load
+        """
+        if self.change_detector is None:
+            return self.select_new_rows(data, source)
+        self.track_high_water_mark(data, source)
+        changed = self.change_detector.select_changed_rows(data, source)
+        if not self.high_water_marks:
+            return data
+        if source == 'recipes' and len(changed):
+            for table in RECIPE_CHILD_TABLES:
+                # The rows of a resumed run were already rebuilt
+                if not self.checkpoints.done(self.load_stage(table)):
+                    self.delete_rows(conn, cur, table, 'recipe_id', changed['RecipeId'])
+        return changed
+
+    def delete_rows(self, conn, cur, table, key, keys):
+        """Delete the rows with the keys from a table through a staging table of the keys.
+        The stats of the deleted rows are subtracted from the summary stats.
+
+        Args:
+            conn (Connection): Connection to the database
+            cur (Cursor): Cursor for the database
+            table (str): Name of the table
+            key (str): Key column of the table, e.g. recipe_id
+            keys (array-like): Keys of the deleted rows
+
+        Returns:
+            pd.DataFrame: The deleted rows whose stats were subtracted, None if the table has no stats
+        """
+        staging_table = f"{table}_staging"
+        if len(keys):
+            self.changed_tables.add(table)
+        self.create_staging_table(conn, cur, staging_table, key, table)
+        self.execute_query(conn, cur, staging_keys_insert.format(staging_table=staging_table, key=key),
+                           pd.DataFrame({key: np.asarray(keys, dtype=np.int64)}))
+        deleted = self.subtract_replaced_rows(cur, table)
+        self.backend.execute(cur, delete_staging_table.format(table=table, staging_table=staging_table, key=key))
+        conn.commit()
+        return deleted
+
+    def delete_removed_rows(self, cur, conn):
+        """ Delete the reviews and the recipes, with their images, keywords, ingredients and stats,
+        that are in the hash manifest of the last run but not in the input files anymore """
+        deleted_reviews = self.change_detector.deleted_keys('reviews')
+        if len(deleted_reviews):
+            print("Deleting removed reviews from database.")
+            self.run_stage('delete reviews', self.delete_rows, conn, cur, 'reviews', 'review_id', deleted_reviews,
+                           table='reviews', rows=len(deleted_reviews))
+        self.deleted_recipes = self.change_detector.deleted_keys('recipes')
+        if len(self.deleted_recipes):
+            print("Deleting removed recipes from database.")
+            for table in RECIPE_CHILD_TABLES + ['recipe_stats', 'recipes']:
+                self.run_stage(f"delete {table}", self.delete_rows, conn, cur, table, 'recipe_id', self.deleted_recipes,
+                               table=table, rows=len(self.deleted_recipes))
+
+    def start_checkpoints(self):
+        """ Start recording the completed stages. With resume, the stages of the last run are skipped
+        if it read the same input files with the same load options. """
+        fingerprint = None
+        if self.checkpoints.checkpoint_dir:
+            fingerprint = run_fingerprint([self.recipes_file, self.reviews_file], incremental=self.incremental,
+                                          chunk_size=self.chunk_size, change_detection=self.change_detector is not None)
+        self.checkpoints.start(fingerprint, resume=self.resume)
+
+    def load_dimensions(self, cur):
+        """ Read the existing categories, keywords and ingredients, so that new values get new ids and old ids are kept.
+        The ids of the tables are the ones the recipes refer to, a key store that differs from them is discarded,
+        e.g. a stale one after the tables were loaded without it. """
+        for name, query in [('categories', categories_select),
+                            ('keywords', keywords_select),
+                            ('ingredients', ingredients_select)]:
+            dictionary = getattr(self, name)
+            self.backend.execute(cur, query)
+            entries = pd.DataFrame(cur.fetchall(), columns=[dictionary.id_column, dictionary.value_column])
+            if len(dictionary) and not dictionary.matches(entries):
+                print(f"The key store of the {name} differs from the table, the ids are read from the table.")
+                dictionary = KeyDictionary(dictionary.id_column, dictionary.value_column)
+                setattr(self, name, dictionary)
+            dictionary.add(entries)
+
+    def write_dimensions(self, cur, conn):
+        """ Write all entries of the key dictionaries into the newly created categories, keywords and ingredients tables """
+        for dictionary, query in [(self.categories, categories_table_insert),
+                                  (self.keywords, keywords_table_insert),
+                                  (self.ingredients, ingredients_table_insert)]:
+            if len(dictionary):
+                self.execute_query(conn, cur, query, dictionary.to_frame())
 
     def create_tables(self, cur, conn):
         """ Create all tables and add constraints
@@ -75,9 +413,9 @@ class ETLProcess:
         """
         print("Creating tables")
         for query in create_table_queries:
-            cur.execute(query)
+            self.backend.execute(cur, query)
             conn.commit()
-        cur.execute(foreign_key_query)
+        self.backend.execute(cur, foreign_key_query)
         conn.commit()
 
     def drop_tables(self, cur, conn):
@@ -89,108 +427,306 @@ class ETLProcess:
         """
         print("Dropping tables")
         for query in drop_table_queries:
-            cur.execute(query)
+            self.backend.execute(cur, query)
             conn.commit()
 
-    def load_data(self, cur, conn):
+    def run_stage(self, stage, function, *args, table=None, rows=None):
+        """Run a stage and record it as completed, unless the resumed run completed it, see RunCheckpoints.
+        The stats of the rows that a skipped stage replaced or deleted are subtracted again.
+
+        Args:
+            stage (str): Name of the stage, e.g. load recipes
+            function (callable): Called with the args to run the stage, it may return the replaced rows
+            table (str, optional): Table whose rows the stage replaces or deletes, see REPLACED_ROWS_SELECTS
+            rows (int, optional): Rows processed by the stage, e.g. the loaded rows
+        """
+        if self.checkpoints.done(stage):
+            print(f"Skipping {stage}, it was completed by the resumed run.")
+            replaced = self.checkpoints.frame(stage)
+            if replaced is not None:
+                self.summary_stats.add(table, replaced, sign=-1)
+            return
+        replaced = function(*args)
+        self.checkpoints.complete(stage, rows=rows, frame=replaced if isinstance(replaced, pd.DataFrame) else None)
+
+    def load_stage(self, table):
+        """ Get the name of the stage loading a table, there is one per chunk in streamed loads """
+        return f"load {table}" if self.chunk is None else f"load {table} chunk {self.chunk}"
+
+    def load_table(self, conn, cur, table, data):
+        """Write the data into a table, see TABLE_INSERTS
+
+        Args:
+            conn (Connection): Connection to the database
+            cur (Cursor): Cursor for the database
+            table (str): Name of the table
+            data (pd.DataFrame): Data to write into the table
+        """
+        query, key, replace = TABLE_INSERTS[table]
+        print(f"Writing {table} into database.")
+        if len(data):
+            self.changed_tables.add(table)
+        # The stats of tables loaded by a resumed run are added as well, the summary tables are written at the end
+        self.summary_stats.add(table, data)
+        if key is None:
+            self.run_stage(self.load_stage(table), self.execute_query, conn, cur, query, data, rows=len(data))
+        else:
+            self.run_stage(self.load_stage(table), self.write_table, conn, cur, query, data, key, replace,
+                           table=table, rows=len(data))
+
+    def recipe_tasks(self, recipes):
+        """Assign ids to the categories, keywords and ingredients that are new in a chunk of recipes
+        and get the transforms for the recipes table and the derived tables.
+
+        Args:
+            recipes (pd.DataFrame): Prepared recipes
+
+        Returns:
+            dict: Scheduler tasks per table, see TableScheduler.run
+        """
+        categories = self.categories.update(recipes['RecipeCategory'])
+        keywords = self.keywords.update(distinct_list_values(recipes['Keywords']))
+        recipe_ingredients = lower_ingredient_parts(recipes[['RecipeId', 'RecipeIngredientParts', 'RecipeIngredientQuantities']])
+        ingredients = self.ingredients.update(ingredient_names(recipe_ingredients))
+        # Only pass the needed columns to the transforms, they may be sent to other processes
+        recipe_columns = [column for column in RECIPES_TABLE_COLUMNS if column != 'CategoryId'] + ['RecipeCategory']
+        return {
+            'categories': categories,
+            'recipes': (build_recipes_table, (recipes[recipe_columns], self.categories)),
+            'recipe_images': (build_recipe_images, (recipes[['RecipeId', 'Images']],)),
+            'keywords': keywords,
+            'recipe_keywords': (build_recipe_keywords, (recipes[['RecipeId', 'Keywords']], self.keywords)),
+            'ingredients': ingredients,
+            'recipe_ingredients': (build_recipe_ingredients, (recipe_ingredients, self.ingredients)),
+        }
+
+    def review_tasks(self, reviews):
+        """ Get the transform for the reviews table """
+        return {'reviews': (build_reviews_table, (reviews,))}
+
+    def load_key_dictionary(self, name, id_column, value_column):
+        """ Load a key dictionary from the key store, or start an empty one if it was not saved yet """
+        if self.key_store_dir and (self.key_store_dir / f"{name}.parquet").exists():
+            return KeyDictionary.load(self.key_store_dir / f"{name}.parquet", id_column, value_column)
+        return KeyDictionary(id_column, value_column)
+
+    def load_key_dictionaries(self):
+        """ Load the id dictionaries for the categories, keywords and ingredients """
+        self.categories = self.load_key_dictionary('categories', 'CategoryId', 'RecipeCategory')
+        self.keywords = self.load_key_dictionary('keywords', 'KeywordId', 'Keywords')
+        self.ingredients = self.load_key_dictionary('ingredients', 'IngredientId', 'RecipeIngredient')
+
+    def save_key_dictionaries(self):
+        """ Save the id dictionaries into the key store, so that the next run assigns the same ids """
+        if not self.key_store_dir:
+            return
+        self.key_store_dir.mkdir(parents=True, exist_ok=True)
+        for name, dictionary in [('categories', self.categories), ('keywords', self.keywords), ('ingredients', self.ingredients)]:
+            dictionary.save(self.key_store_dir / f"{name}.parquet")
+
+    def write_summary_tables(self, cur, conn):
+        """ Write the recipe_stats and author_stats of the loaded rows. In incremental loads, they are added
+        to the stored stats and the ratings are recomputed from the sums. """
+        for table, data in [('recipe_stats', self.summary_stats.recipe_stats()),
+                            ('author_stats', self.summary_stats.author_stats())]:
+            query, key, assignments = SUMMARY_TABLE_INSERTS[table]
+            if table == 'recipe_stats':
+                # The stats of deleted recipes were deleted with them
+                data = data[~data['RecipeId'].isin(self.deleted_recipes)]
+            print(f"Writing {table} into database.")
+            # The ratings of all rows are recomputed in incremental loads
+            self.changed_tables.add(table)
+            if self.high_water_marks:
+                self.run_stage(f"write {table}", self.upsert, conn, cur, query, data, key, False, assignments, rows=len(data))
+            else:
+                self.run_stage(f"write {table}", self.execute_query, conn, cur, query, data, rows=len(data))
+        if self.high_water_marks:
+            self.backend.execute(cur, recipe_stats_totals_select)
+            review_count, rating_sum = cur.fetchone()
+            prior_mean = self.summary_stats.prior_mean(review_count, rating_sum)
+            self.backend.execute(cur, recipe_stats_ratings_update.format(
+                prior_reviews=self.summary_stats.prior_reviews, prior_mean=prior_mean))
+            self.backend.execute(cur, author_stats_ratings_update)
+            conn.commit()
+
+    def tables_to_vacuum(self, cur, tables):
+        """Select the tables to vacuum. With MAINTENANCE `vacuum` all changed tables are vacuumed, with `auto` only
+        after incremental loads, whose merges delete rows and append unsorted ones, and only the tables whose share of
+        unsorted or deleted rows reached the VACUUM_THRESHOLD. Redshift runs one VACUUM per cluster at a time,
+        so vacuuming every table after each of frequent incremental loads would stall them. Postgres publishes the dead
+rows of the load workers' sessions with a delay, so a table may only be vacuumed after its next change.
+
+        Args:
+            cur (Cursor): Cursor for the database
+            tables (list of str): The changed tables
+
+        Returns:
+            list of str: The tables to vacuum
+        """
+        if self.maintenance == 'vacuum':
+            return tables
+        if self.maintenance != 'auto' or not self.high_water_marks or not tables:
+            return []
+        if self.backend.vacuum_stats_query is None:
+            return tables
+        self.backend.execute(cur, self.backend.vacuum_stats_query)
+        percentages = {table: percentage for table, percentage in cur.fetchall()}
+        return [table for table in tables if (percentages.get(table) or 0) >= self.vacuum_threshold]
+
+    def maintain_tables(self, cur, conn):
+        """ Update the planner statistics of the tables changed by this run with ANALYZE and vacuum the ones
+        that need it first, see tables_to_vacuum """
+        if self.maintenance == 'none':
+            return
+        tables = [table for table in list(TABLE_INSERTS) + list(SUMMARY_TABLE_INSERTS) if table in self.changed_tables]
+        vacuum = self.tables_to_vacuum(cur, tables)
+        print(f"Vacuuming {len(vacuum)} and analyzing {len(tables)} tables.")
+        for table in tables:
+            with self.instrumentation.stage(f"maintain {table}"):
+                if table in vacuum:
+                    self.backend.execute_outside_transaction(conn, cur, vacuum_table_query.format(table=table))
+                self.backend.execute_outside_transaction(conn, cur, analyze_table_query.format(table=table))
+
+    def write_search_index(self, cur):
+        """ Build the recipe search index from the loaded tables and save it into the SEARCH_INDEX_FILE """
+        print("Building search index.")
+        with self.instrumentation.stage('build search index') as record:
+            index = SearchIndex.from_database(self.backend, cur)
+            index.save(self.search_index_file)
+            record['rows_out'] = len(index)
+
+    def load_data(self, cur, conn, author_rows=None):
         """ This procedure processes the recipes data.
         It extracts the recipe information in order to store it into the recipes table.
 
         Args:
             cur (Cursor): The cursor variable for the database
+            conn (Connection): Connection to the database
+            author_rows (tuple of pd.DataFrame, optional): Reviews and recipes whose newest author names are loaded,
+                by default the loaded ones
         """
         print("Loading data into database.")
-        # Prepare recipe categories
-        categories = self.recipes['RecipeCategory'].unique()
-        categories = pd.DataFrame(categories).reset_index()
-        categories.columns = ['CategoryId', 'RecipeCategory']
-        self.recipes = pd.merge(self.recipes, categories, on='RecipeCategory')
-        print("Writing categories into database.")
-        self.execute_query(conn, cur, categories_table_insert, categories)
 
         # Prepare authors data
-        newest_authors_reviews = self.reviews.loc[self.reviews.groupby(['AuthorId'])['DateModified'].idxmax()][['AuthorId','AuthorName']]
-        newest_authors_recipes = self.recipes.loc[self.recipes.groupby(['AuthorId'])['DatePublished'].idxmax()][['AuthorId','AuthorName']]
-        authors = pd.merge(newest_authors_reviews, newest_authors_recipes, on='AuthorId', how='outer')
-        authors = authors.drop_duplicates(subset=['AuthorId', 'AuthorName_x', 'AuthorName_y'])
-        authors['AuthorName'] = authors['AuthorName_x'].where(authors['AuthorName_x'] > "", authors['AuthorName_y'])
-        authors = authors[['AuthorId', 'AuthorName']]
-        print("Writing authors into database.")
-        self.execute_query(conn, cur, authors_table_insert, authors)
-
-        # Prepare recipes data
-        df = self.recipes[['RecipeId', 'Name', 'AuthorId','CookTime','PrepTime','TotalTime', 'DatePublished', 'Description', 'CategoryId', 
-            'Calories', 'FatContent', 'SaturatedFatContent', 'CholesterolContent', 'SodiumContent', 'CarbohydrateContent', 'FiberContent', 
-            'SugarContent', 'ProteinContent', 'RecipeServings', 'RecipeYield','RecipeInstructions']]
-        df[['AuthorId','CategoryId']] = df[['AuthorId','CategoryId']].astype(pd.Int64Dtype())
-        print("Writing recipes into database.")
-        self.execute_query(conn, cur, recipes_table_insert, df)
-
-        # Prepare recipe images data
-        df = self.recipes[['RecipeId', 'Images']]
-        df = df.explode('Images')
-        print("Writing recipe images into database.")
-        self.execute_query(conn, cur, recipe_images_table_insert, df)
-
-
-        # Prepare recipe keywords data
-        keywords = self.recipes['Keywords'].explode().unique()
-        keywords = pd.DataFrame(keywords).reset_index()
-        keywords.columns = ['KeywordId', 'Keywords']
-        print("Writing keywords into database.")
-        self.execute_query(conn, cur, keywords_table_insert, keywords)
-        
-        recipe_keywords = self.recipes[['RecipeId','Keywords']].explode('Keywords')
-        recipe_keywords = pd.merge(recipe_keywords, keywords, on='Keywords')
-        df = recipe_keywords[['RecipeId','KeywordId']]
-        print("Writing recipe_keywords into database.")
-        self.execute_query(conn, cur, recipe_keywords_table_insert, df)
-        
-        # Prepare recipe ingredients data
-        ingredients = self.recipes['RecipeIngredientParts'].explode().str.lower().unique()
-        ingredients = pd.DataFrame(ingredients).reset_index()
-        ingredients.columns = ['IngredientId', 'RecipeIngredient']
-        print("Writing ingredients into database.")
-        self.execute_query(conn, cur, ingredients_table_insert, ingredients)
-        
-        recipe_ingredient_parts = self.recipes[['RecipeId','RecipeIngredientParts']].explode('RecipeIngredientParts')
-        recipe_ingredient_parts = recipe_ingredient_parts.reset_index(drop=True)
-        recipe_ingredient_parts['recipe_ingredient_num'] = recipe_ingredient_parts.groupby('RecipeId').cumcount()
-        
-        recipe_ingredient_quants = self.recipes[['RecipeId','RecipeIngredientQuantities']].explode('RecipeIngredientQuantities')
-        recipe_ingredient_quants = recipe_ingredient_quants.reset_index(drop=True)
-        recipe_ingredient_quants['recipe_ingredient_num'] = recipe_ingredient_quants.groupby('RecipeId').cumcount()
-
-        recipe_ingredients = pd.merge(recipe_ingredient_parts, recipe_ingredient_quants, on=['RecipeId','recipe_ingredient_num'], how="inner")
-        recipe_ingredients['RecipeIngredientParts'] = recipe_ingredients['RecipeIngredientParts'].str.lower()
-        recipe_ingredients = pd.merge(recipe_ingredients, ingredients, right_on='RecipeIngredient', left_on='RecipeIngredientParts', how="left")
-        df = recipe_ingredients[['RecipeId', 'IngredientId', 'RecipeIngredientQuantities']]
-        print("Writing recipe ingredients into database.")
-        self.execute_query(conn, cur, recipe_ingredients_table_insert, df)
-
-        # Prepare reviews data
-        df = self.reviews[['ReviewId', 'AuthorId', 'RecipeId', 'Rating', 'Review', 'DateSubmitted', 'DateModified']]
-        print("Writing reviews into database.")
-        self.execute_query(conn, cur, reviews_table_insert, df)
-        
+        reviews, recipes = author_rows or (self.reviews, self.recipes)
+        tasks = {'authors': (newest_authors, (reviews[['AuthorId', 'AuthorName', 'DateModified']],
+                                              recipes[['AuthorId', 'AuthorName', 'DatePublished']]))}
+        tasks.update(self.recipe_tasks(self.recipes))
+        tasks.update(self.review_tasks(self.reviews))
+        self.scheduler.run(tasks, self.load_table)
+
+    def load_data_streaming(self, cur, conn, parser):
+        """Load the data chunk by chunk, so that only one chunk of the input files is held in memory.
+        The authors need the newest name over all rows, so their columns are read in a first pass.
+
+        Args:
+            cur (Cursor): The cursor variable for the database
+            conn (Connection): Connection to the database
+            parser (DataParser): Parser for reading and cleaning the chunks
+        """
+        print("Loading data into database in chunks of {} rows.".format(self.chunk_size))
+
+        # Prepare authors data, the names of each chunk are resolved together with the newest names so far
+        authors = None
+        for chunks, source in [
+                (parser.iter_reviews(self.reviews_file, self.chunk_size, ['AuthorId', 'AuthorName', 'DateModified']), 'reviews'),
+                (parser.iter_recipes(self.recipes_file, self.chunk_size, ['AuthorId', 'AuthorName', 'DatePublished']), 'recipes')]:
+            for chunk in self.instrumentation.iterate(f"prepare {source} authors", chunks):
+                if self.change_detector is None:
+                    # With change detection, the names of all authors are loaded, their rows are not hashed yet
+                    chunk = self.select_new_rows(chunk, source)
+                names = author_names(chunk, HIGH_WATER_MARK_COLUMNS[source], preferred=source == 'reviews')
+                authors = resolve_authors(pd.concat([authors, names], ignore_index=True))
+        self.scheduler.run({'authors': authors[['AuthorId', 'AuthorName']]}, self.load_table)
+
+        chunks = self.instrumentation.iterate('prepare recipes', parser.iter_recipes(self.recipes_file, self.chunk_size))
+        for self.chunk, recipes in enumerate(chunks):
+            self.scheduler.run(self.recipe_tasks(self.select_rows(conn, cur, recipes, 'recipes')), self.load_table)
+        chunks = self.instrumentation.iterate('prepare reviews', parser.iter_reviews(self.reviews_file, self.chunk_size))
+        for self.chunk, reviews in enumerate(chunks):
+            self.scheduler.run(self.review_tasks(self.select_rows(conn, cur, reviews, 'reviews')), self.load_table)
+        self.chunk = None
 
     def run(self):
-        # Prepare data
-        parser = DataParser()
-        self.reviews = parser.prepare_reviews(self.reviews_file)
-        self.recipes = parser.prepare_recipes(self.recipes_file)
-        
+        # Set up the cluster while the data is parsed
+        self.backend.prepare()
+        self.start_checkpoints()
+
+        parser = DataParser(compact=self.compact, cache=self.parse_cache, workers=self.parse_workers)
+        if not self.chunk_size:
+            # Prepare data, a resumed run reads it from the PARSE_CACHE_DIR
+            with self.instrumentation.stage('prepare reviews') as record:
+                self.reviews = parser.prepare_reviews(self.reviews_file)
+                record['rows_out'] = len(self.reviews)
+            self.checkpoints.complete('prepare reviews', rows=len(self.reviews))
+            with self.instrumentation.stage('prepare recipes') as record:
+                self.recipes = parser.prepare_recipes(self.recipes_file)
+                record['rows_out'] = len(self.recipes)
+            self.checkpoints.complete('prepare recipes', rows=len(self.recipes))
+
         print("Connect to DB")
         conn, cur = self.connect_to_db()
 
-        self.drop_tables(cur, conn)
-        self.create_tables(cur, conn)
-        self.load_data(cur, conn)
+        self.load_key_dictionaries()
+        if self.incremental:
+            # A resumed run selects the rows by the high-water marks of the failed run, not by the ones it wrote
+            if self.checkpoints.done('read high-water marks'):
+                self.high_water_marks = {source: pd.Timestamp(high_water_mark) for source, high_water_mark
+                                         in self.checkpoints.value('read high-water marks').items()}
+            else:
+                self.high_water_marks = self.read_high_water_marks(cur)
+                self.checkpoints.complete('read high-water marks', value={
+                    source: high_water_mark.isoformat() for source, high_water_mark in self.high_water_marks.items()})
+        if self.high_water_marks:
+            print("Loading rows newer than the high-water marks", self.high_water_marks)
+            self.schema.migrate(cur, conn)
+            self.load_dimensions(cur)
+        else:
+            # The live tables stay readable until the loaded tables replace them
+            self.run_stage('create shadow tables', self.schema.create_shadow_tables, cur, conn)
+            self.shadow = True
+            self.run_stage('write dimensions', self.write_dimensions, cur, conn)
+
+        with TableScheduler(table_dependencies(foreign_key_query), self.connect_to_db,
+                            transform_workers=self.config.getint('ETL', 'TRANSFORM_WORKERS', fallback=0),
+                            load_workers=self.config.getint('ETL', 'LOAD_WORKERS', fallback=1),
+                            connections=[(conn, cur)], release=self.release_connection,
+                            instrumentation=self.instrumentation) as self.scheduler:
+            if self.chunk_size:
+                self.load_data_streaming(cur, conn, parser)
+            else:
+                # With change detection, the names of all authors are loaded, like in load_data_streaming,
+                # as the newest name of an author may be in a row that did not change
+                author_rows = (self.reviews, self.recipes) if self.change_detector is not None else None
+                self.recipes = self.select_rows(conn, cur, self.recipes, 'recipes')
+                self.reviews = self.select_rows(conn, cur, self.reviews, 'reviews')
+                self.load_data(cur, conn, author_rows)
+        if self.change_detector is not None and self.high_water_marks:
+            self.delete_removed_rows(cur, conn)
+        self.write_summary_tables(cur, conn)
+        self.run_stage('write high-water marks', self.write_high_water_marks, cur, conn)
+        if self.shadow:
+            self.run_stage('swap shadow tables', self.schema.swap_shadow_tables, cur, conn)
+            self.shadow = False
+        self.save_key_dictionaries()
+        if self.change_detector is not None:
+            self.change_detector.save()
+        self.run_stage('maintain tables', self.maintain_tables, cur, conn)
+        if self.search_index_file:
+            self.run_stage('write search index', self.write_search_index, cur)
+
+        self.release_connection(conn)
+        self.checkpoints.finish()
+        self.instrumentation.write_metrics()
 
-        conn.close()
-            
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load the recipes and reviews into the data warehouse.")
+    parser.add_argument('--resume', action='store_true',
+                        help="Skip the stages that the last, failed run completed, needs a CHECKPOINT_DIR")
+    args = parser.parse_args()
+    # The stages are logged as JSON, see instrumentation
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
     config_file = Path(r'.\config\dwh.cfg')
     data_filepath = Path(r'.\data')
     small_set = False
@@ -199,10 +735,8 @@ if __name__ == "__main__":
         reviews_file = data_filepath / 'reviews_small10.csv'
         recipes_file = data_filepath / 'recipes_small10.parquet'
     else:  
+        # The zip files are read in place, see input_files.open_input
         reviews_file = data_filepath / 'reviews.csv.zip'
-        recipes_zip_file = data_filepath / 'recipes.parquet.zip'
-        
-        recipes_filename = unzip_file(recipes_zip_file, data_filepath)[0]
-        recipes_file = data_filepath / recipes_filename
-    etl = ETLProcess(config_file, recipes_file, reviews_file)
+        recipes_file = data_filepath / 'recipes.parquet.zip'
+    etl = ETLProcess(config_file, recipes_file, reviews_file, resume=args.resume)
     etl.run()
\ No newline at end of file
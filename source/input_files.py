@@ -0,0 +1,146 @@
+import struct
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from zipfile import ZipFile, ZIP_STORED
+
+import pyarrow as pa
+
+# Size of the fixed part of a local file header in a zip file
+LOCAL_HEADER_SIZE = 30
+
+
+def file_crc(path, block_size=1 << 20):
+    """ Compute the CRC-32 of a file like it is stored in zip archives """
+    crc = 0
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            crc = zlib.crc32(block, crc)
+    return crc
+
+
+def is_extracted(zip_info, path):
+    """Check if a file is an extracted copy of a zip member by comparing the size and the CRC
+
+    Args:
+        zip_info (zipfile.ZipInfo): The zip member
+        path (pathlib.Path): Path of the possibly extracted copy
+
+    Returns:
+        bool: True if the file exists and matches the member
+    """
+    return (path.is_file()
+            and path.stat().st_size == zip_info.file_size
+            and file_crc(path) == zip_info.CRC)
+
+
+def extract_member(zip_file, target_filepath, member=None):
+    """Extract a member of a zip file unless a matching extracted copy already exists
+
+    Args:
+        zip_file (pathlib.Path or str): Path to a zip file
+        target_filepath (pathlib.Path or str): Directory into which the member is extracted
+        member (str, optional): Name of the member, defaults to the first member
+
+    Returns:
+        pathlib.Path: Path to the extracted file
+    """
+    with ZipFile(zip_file, 'r') as zip:
+        zip_info = zip.getinfo(member) if member else zip.infolist()[0]
+        path = Path(target_filepath) / zip_info.filename
+        if is_extracted(zip_info, path):
+            print(f'{path} is already extracted.')
+        else:
+            print(f'Extracting {zip_info.filename} now...')
+            zip.extract(zip_info, path=target_filepath)
+        return path
+
+
+def member_offset(zip_file, zip_info):
+    """ Offset of the data of a zip member in the zip file """
+    with open(zip_file, 'rb') as f:
+        # The local header repeats the name and has its own extra field, so its length has to be read
+        f.seek(zip_info.header_offset + 26)
+        name_length, extra_length = struct.unpack('<HH', f.read(4))
+    return zip_info.header_offset + LOCAL_HEADER_SIZE + name_length + extra_length
+
+
+@contextmanager
+def map_stored_member(zip_file, zip_info):
+    """Memory-map an uncompressed zip member without copying it. The file is closed when the context exits,
+    the map itself is released once no data read from it is referenced anymore.
+
+    Args:
+        zip_file (pathlib.Path or str): Path to a zip file
+        zip_info (zipfile.ZipInfo): Member stored without compression
+
+    Yields:
+        pyarrow.BufferReader: Readable, seekable buffer of the member
+    """
+    with pa.memory_map(str(zip_file)) as mapped:
+        mapped.seek(member_offset(zip_file, zip_info))
+        yield pa.BufferReader(mapped.read_buffer(zip_info.file_size))
+
+
+@contextmanager
+def open_input(path, extract_dir=None):
+    """Open an input file for pandas and pyarrow without extracting zip files where possible.
+    Files that are not zipped are passed on as paths. Of a zip file, the first member is used:
+    - members stored without compression are memory-mapped,
+    - compressed csv members are decompressed while they are read,
+    - compressed parquet members need random access. They are extracted into the extract_dir
+      (defaults to the directory of the zip file) unless a matching copy is already there.
+
+    Args:
+        path (pathlib.Path or str): Path to the input file
+        extract_dir (pathlib.Path or str, optional): Directory for extracted parquet files
+
+    Yields:
+        pathlib.Path or file-like: Input for pd.read_csv, pd.read_parquet or pq.ParquetFile
+    """
+    path = Path(path)
+    if path.suffix != '.zip':
+        yield path
+        return
+
+    with ZipFile(path, 'r') as zip:
+        zip_info = zip.infolist()[0]
+        if zip_info.compress_type == ZIP_STORED:
+            with map_stored_member(path, zip_info) as f:
+                yield f
+        elif zip_info.filename.endswith('.parquet'):
+            yield extract_member(path, extract_dir or path.parent, zip_info.filename)
+        else:
+            with zip.open(zip_info) as f:
+                yield f
+
+
+@contextmanager
+def open_csv_range(path, extract_dir=None):
+    """Locate the csv data of an input file on disk, so that byte ranges of it can be read by several processes.
+    Of a zip file, the first member is used: a member stored without compression is read in place,
+    a compressed member is extracted into a temporary directory in the extract_dir (defaults to the directory
+    of the zip file) that is removed when the context exits.
+
+    Args:
+        path (pathlib.Path or str): Path to the csv file or a zip file containing it
+        extract_dir (pathlib.Path or str, optional): Directory for the temporary copy of a compressed member
+
+    Yields:
+        tuple of (pathlib.Path, int, int): The file and the start and end offsets of the csv data in it
+    """
+    path = Path(path)
+    if path.suffix != '.zip':
+        yield path, 0, path.stat().st_size
+        return
+
+    with ZipFile(path, 'r') as zip:
+        zip_info = zip.infolist()[0]
+    if zip_info.compress_type == ZIP_STORED:
+        start = member_offset(path, zip_info)
+        yield path, start, start + zip_info.file_size
+        return
+    with TemporaryDirectory(dir=extract_dir or path.parent) as tmp_dir:
+        extracted = extract_member(path, tmp_dir, zip_info.filename)
+        yield extracted, 0, extracted.stat().st_size
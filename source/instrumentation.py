@@ -0,0 +1,146 @@
+import cProfile
+import json
+import logging
+import re
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from threading import Lock
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, the peak RSS is not recorded there
+    resource = None
+
+logger = logging.getLogger('etl')
+
+# Metric name, help text and record field of the Prometheus text output, see write_metrics
+PROMETHEUS_METRICS = [
+    ('etl_stage_runs_total', 'Number of times the stage ran', None),
+    ('etl_stage_wall_seconds_total', 'Wall-clock time of the stage', 'wall_seconds'),
+    ('etl_stage_cpu_seconds_total', 'CPU time of the thread running the stage', 'cpu_seconds'),
+    ('etl_stage_rows_in_total', 'Rows passed into the stage', 'rows_in'),
+    ('etl_stage_rows_out_total', 'Rows produced or loaded by the stage', 'rows_out'),
+    ('etl_stage_bytes_sent_total', 'Bytes sent to the database by the stage', 'bytes_sent'),
+    ('etl_stage_peak_rss_increase_bytes_total', 'Increase of the peak resident memory during the stage',
+     'peak_rss_increase_bytes'),
+]
+
+
+def peak_rss():
+    """ Get the peak resident memory of the process in bytes, None if it cannot be measured """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class Instrumentation():
+    """ Measure the stages of the ETL, e.g. parsing a file, building or loading a table.
+    Each stage is logged as JSON and kept for the Prometheus text file. """
+
+    def __init__(self, metrics_file=None, profile_dir=None, trace_memory=False):
+        """
+        Args:
+            metrics_file (pathlib.Path or str, optional): Prometheus text file written by write_metrics
+            profile_dir (pathlib.Path or str, optional): Directory for a cProfile file per stage
+            trace_memory (bool): Record the peak of the Python allocations with tracemalloc. It is process-wide,
+                so the peaks of stages running at the same time, e.g. with several load workers, overlap.
+        """
+        self.metrics_file = Path(metrics_file) if metrics_file else None
+        self.profile_dir = Path(profile_dir) if profile_dir else None
+        self.trace_memory = trace_memory
+        self.records = []
+        self.lock = Lock()
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        """Measure the block as stage. The block may set rows_out and bytes_sent in the yielded record.
+
+        Args:
+            name (str): Name of the stage, e.g. `load recipes`
+            rows_in (int, optional): Number of rows passed into the stage
+
+        Yields:
+            dict: The record of the stage
+        """
+        record = {'stage': name, 'rows_in': rows_in, 'rows_out': None, 'bytes_sent': None}
+        profiler = cProfile.Profile() if self.profile_dir else None
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        rss_before = peak_rss()
+        cpu_start_time = time.thread_time()
+        start_time = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            record['wall_seconds'] = time.perf_counter() - start_time
+            record['cpu_seconds'] = time.thread_time() - cpu_start_time
+            record['peak_rss_increase_bytes'] = peak_rss() - rss_before if rss_before is not None else None
+            if self.trace_memory:
+                record['traced_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+            if profiler is not None:
+                self.profile_dir.mkdir(parents=True, exist_ok=True)
+                file_name = re.sub(r'\W+', '_', name)
+                profiler.dump_stats(self.profile_dir / f"{file_name}_{len(self.records)}.prof")
+            if not record.pop('discard', False):
+                with self.lock:
+                    self.records.append(record)
+                logger.info(json.dumps(record))
+
+    def iterate(self, name, items):
+        """ Yield the items of an iterable, e.g. the chunks of DataParser.iter_recipes, and measure
+        producing each item as stage. The number of rows of each item is recorded as rows_out. """
+        iterator = iter(items)
+        while True:
+            with self.stage(name) as record:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    record['discard'] = True
+                    return
+                record['rows_out'] = len(item)
+            yield item
+
+    def summary(self):
+        """Sum up the records per stage name
+
+        Returns:
+            dict: Per stage name the number of runs and the sums of the numeric fields
+        """
+        summary = {}
+        with self.lock:
+            records = list(self.records)
+        for record in records:
+            totals = summary.setdefault(record['stage'], {'runs': 0})
+            totals['runs'] += 1
+            for field, value in record.items():
+                if field != 'stage' and value is not None:
+                    totals[field] = totals.get(field, 0) + value
+        return summary
+
+    def write_metrics(self):
+        """ Write the summed up stages in the Prometheus text format into the metrics file, if one is configured """
+        if self.metrics_file is None:
+            return
+        summary = self.summary()
+        lines = []
+        for metric, help_text, field in PROMETHEUS_METRICS:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} counter")
+            for name, totals in summary.items():
+                value = totals['runs'] if field is None else totals.get(field)
+                if value is not None:
+                    lines.append(f'{metric}{{stage="{name}"}} {value}')
+        self.metrics_file.parent.mkdir(parents=True, exist_ok=True)
+        self.metrics_file.write_text('\n'.join(lines) + '\n')
@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+
+
+class KeyDictionary():
+    """ Map the values of a dimension (e.g. categories) to integer ids that stay the same across chunks and runs """
+
+    def __init__(self, id_column, value_column):
+        """
+        Args:
+            id_column (str): Name of the id column in the DataFrames of new entries, e.g. CategoryId
+            value_column (str): Name of the value column in the DataFrames of new entries, e.g. RecipeCategory
+        """
+        self.id_column = id_column
+        self.value_column = value_column
+        self.values = pd.Index([], dtype=object)
+        self.ids = np.array([], dtype=np.int64)
+
+    def __len__(self):
+        return len(self.values)
+
+    @classmethod
+    def load(cls, path, id_column, value_column):
+        """Load a dictionary saved with save
+
+        Args:
+            path (pathlib.Path or str): Path to the parquet file
+            id_column (str): Name of the id column
+            value_column (str): Name of the value column
+
+        Returns:
+            KeyDictionary: The loaded dictionary
+        """
+        dictionary = cls(id_column, value_column)
+        dictionary.add(pd.read_parquet(path))
+        return dictionary
+
+    def save(self, path):
+        """ Save the entries into a parquet file """
+        self.to_frame().to_parquet(path, index=False)
+
+    def to_frame(self):
+        """ Get all entries as DataFrame with the id and value column """
+        return pd.DataFrame({self.id_column: self.ids, self.value_column: self.values})
+
+    def next_id(self):
+        """ Get the id for the next new value """
+        return int(self.ids.max()) + 1 if len(self.ids) else 0
+
+    def matches(self, entries):
+        """Check if the dictionary has exactly the entries, e.g. the rows of the dimension table
+
+        Args:
+            entries (pd.DataFrame): Entries with the id and value column
+
+        Returns:
+            bool: True if both have the same values with the same ids
+        """
+        if len(entries) != len(self):
+            return False
+        ids = pd.Series(self.ids, index=self.values).reindex(entries[self.value_column])
+        return bool((ids.to_numpy() == entries[self.id_column].to_numpy(dtype=np.int64)).all())
+
+    def add(self, entries):
+        """Add existing entries, e.g. read back from the dimension table, so that their ids are kept
+
+        Args:
+            entries (pd.DataFrame): Entries with the id and value column
+        """
+        entries = entries[~pd.Index(entries[self.value_column]).isin(self.values)]
+        self.values = self.values.append(pd.Index(entries[self.value_column], dtype=object))
+        self.ids = np.concatenate([self.ids, entries[self.id_column].to_numpy(dtype=np.int64)])
+
+    def update(self, values):
+        """Assign ids to the values that are not in the dictionary yet. Missing values get no id.
+
+        Args:
+            values (pd.Series): Dimension values, may contain duplicates
+
+        Returns:
+            pd.DataFrame: The new entries with the id and value column
+        """
+        unique_values = pd.Index(pd.unique(values.dropna()), dtype=object)
+        new_values = unique_values[self.values.get_indexer(unique_values) == -1]
+        new_entries = pd.DataFrame({self.id_column: np.arange(self.next_id(), self.next_id() + len(new_values)),
+                                    self.value_column: new_values})
+        self.add(new_entries)
+        return new_entries
+
+    def lookup(self, values):
+        """Get the ids of the values
+
+        Args:
+            values (pd.Series): Dimension values, categoricals are looked up once per category
+
+        Returns:
+            pd.Series: Ids of the values, <NA> for missing or unknown values
+        """
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # Code -1 (missing value) selects the appended -1
+            positions = np.append(self.values.get_indexer(values.cat.categories), -1)[values.cat.codes]
+        else:
+            positions = self.values.get_indexer(values)
+        ids = self.ids[positions] if len(self.ids) else np.zeros(len(positions), dtype=np.int64)
+        ids = pd.Series(ids, index=values.index, dtype=pd.Int64Dtype())
+        return ids.mask(positions == -1)
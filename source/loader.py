@@ -0,0 +1,292 @@
+import gzip
+import re
+import shutil
+import time
+import uuid
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+from psycopg2.extras import execute_values
+
+from sql_queries import copy_from_stdin_query, copy_from_s3_query, count_rows_query
+
+INSERT_QUERY_REGEX = re.compile(r'INSERT INTO (\w+) \(([^)]*)\)')
+
+
+class LoadError(Exception):
+    """ Raised when a table could not be loaded completely """
+
+
+def parse_insert_query(query):
+    """Get the table name and the column names from an insert statement
+
+    Args:
+        query (str): SQL insert statement, e.g. from sql_queries
+
+    Returns:
+        tuple of (str, list of str): Table name and column names
+    """
+    match = INSERT_QUERY_REGEX.search(query)
+    if match is None:
+        raise ValueError(f"Not an insert statement: {query}")
+    columns = [column.strip() for column in match.group(2).split(',')]
+    return match.group(1), columns
+
+
+def csv_table(data):
+    """Convert a DataFrame into an Arrow table for the csv writer, with the values formatted like the COPY
+    statements expect: timestamps in whole seconds without time zone and empty strings as NULL
+
+    Args:
+        data (pd.DataFrame): Data to stage
+
+    Returns:
+        pa.Table: The data, text columns in Arrow are not copied
+    """
+    table = pa.Table.from_pandas(data, preserve_index=False)
+    columns = []
+    for column in table.columns:
+        if pa.types.is_dictionary(column.type):
+            column = column.cast(column.type.value_type)
+        if pa.types.is_timestamp(column.type):
+            column = column.cast(pa.timestamp('s'), safe=False)
+        elif pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+            # The writer quotes all strings, and a quoted empty string is not NULL
+            column = pc.if_else(pc.equal(column, ''), pa.scalar(None, column.type), column)
+        columns.append(column)
+    return pa.table(columns, names=table.column_names)
+
+
+class CopyLoader():
+    """ Bulk load DataFrames with COPY using gzipped csv staging files """
+
+    def __init__(self, staging_dir, s3_client=None, s3_bucket=None, iam_role=None, region='us-west-2', compresslevel=1,
+                 staging_files=8, min_file_rows=10000):
+        """
+        Args:
+            staging_dir (pathlib.Path or str): Local directory for the staging files
+            s3_client (botocore.client.S3, optional): Client for uploading the staging files.
+                If no client or bucket is given, the files are sent with COPY FROM STDIN.
+            s3_bucket (str, optional): S3 bucket Redshift loads the staging files from
+            iam_role (str, optional): ARN of the IAM role Redshift uses to read the bucket
+            region (str): AWS region of the bucket
+            compresslevel (int): gzip level of the staging files, from 1 (fastest) to 9 (smallest)
+            staging_files (int): Maximum number of staging files per table. Redshift cannot split a gzipped
+                file, so there should be a multiple of the slices of the cluster, e.g. 8 for 4 dc2.large nodes.
+            min_file_rows (int): Minimum number of rows per staging file, small tables get fewer files
+        """
+        self.staging_dir = Path(staging_dir)
+        self.s3_client = s3_client
+        self.s3_bucket = s3_bucket
+        self.iam_role = iam_role
+        self.region = region
+        self.compresslevel = compresslevel
+        self.staging_files = max(staging_files, 1)
+        self.min_file_rows = min_file_rows
+
+    def write_staging_files(self, table, data):
+        """Write the data into gzipped csv files in a new directory of the staging directory, so that the slices
+        of the cluster load them in parallel. The csv is written by Arrow from the column buffers,
+        without formatting each value in Python.
+
+        Args:
+            table (str): Name of the target table
+            data (pd.Dataframe): Data to stage, columns in the order of the target columns
+
+        Returns:
+            tuple of (pathlib.Path, list of pathlib.Path): Directory of the staging files and the files
+        """
+        staging_path = self.staging_dir / f"{table}_{uuid.uuid4().hex}"
+        staging_path.mkdir(parents=True)
+        rows = csv_table(data)
+        files = max(min(self.staging_files, rows.num_rows // max(self.min_file_rows, 1)), 1)
+        file_rows = -(-rows.num_rows // files)
+        staging_files = []
+        for part in range(files):
+            staging_file = staging_path / f"part_{part:04d}.csv.gz"
+            with gzip.open(staging_file, 'wb', compresslevel=self.compresslevel) as f:
+                pv.write_csv(rows.slice(part * file_rows, file_rows), f, pv.WriteOptions(include_header=False))
+            staging_files.append(staging_file)
+        return staging_path, staging_files
+
+    def count_rows(self, cur, table):
+        """ Get the number of rows in a table """
+        cur.execute(count_rows_query.format(table=table))
+        return cur.fetchone()[0]
+
+    def copy_staging_files(self, cur, table, columns, staging_path, staging_files):
+        """Run COPY for the staging files, either for their common prefix in S3 or for each file from STDIN
+
+        Returns:
+            int: Number of bytes sent, the gzipped files for S3 or the csv text for STDIN
+        """
+        if self.s3_client is not None and self.s3_bucket:
+            prefix = f"staging/{staging_path.name}/"
+            keys = []
+            try:
+                for staging_file in staging_files:
+                    keys.append(prefix + staging_file.name)
+                    self.s3_client.upload_file(str(staging_file), self.s3_bucket, keys[-1])
+                cur.execute(copy_from_s3_query.format(table=table, columns=', '.join(columns),
+                    bucket=self.s3_bucket, key=prefix, iam_role=self.iam_role, region=self.region))
+            finally:
+                for key in keys:
+                    self.s3_client.delete_object(Bucket=self.s3_bucket, Key=key)
+            return sum(staging_file.stat().st_size for staging_file in staging_files)
+        bytes_sent = 0
+        for staging_file in staging_files:
+            with gzip.open(staging_file, 'rb') as f:
+                cur.copy_expert(copy_from_stdin_query.format(table=table, columns=', '.join(columns)), f)
+                bytes_sent += f.tell()
+        return bytes_sent
+
+    def load(self, conn, cur, query, data, stats=None):
+        """Load the data into the table of the insert query and verify the row count.
+        The load is committed only if all rows arrived in the table.
+
+        Args:
+            conn (Connection): Connection to the database
+            cur (Cursor): Cursor for the database
+            query (str): SQL insert statement naming the target table and columns
+            data (pd.Dataframe): Data to insert into the table
+            stats (dict, optional): Receives the number of bytes sent as bytes_sent
+
+        Returns:
+            int: Number of loaded rows
+        """
+        table, columns = parse_insert_query(query)
+        staging_path, staging_files = self.write_staging_files(table, data)
+        try:
+            rows_before = self.count_rows(cur, table)
+            bytes_sent = self.copy_staging_files(cur, table, columns, staging_path, staging_files)
+            if stats is not None:
+                stats['bytes_sent'] = bytes_sent
+            rows_loaded = self.count_rows(cur, table) - rows_before
+            if rows_loaded != len(data):
+                raise LoadError(f"Loaded {rows_loaded} of {len(data)} rows into {table}.")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            shutil.rmtree(staging_path)
+        return rows_loaded
+
+
+class BatchInserter():
+    """ Insert DataFrames in batches of parameterized multi-row INSERTs, for targets without COPY """
+
+    def __init__(self, batch_size=10000, commit_per_batch=True, retries=2, quarantine_dir='quarantine'):
+        """
+        Args:
+            batch_size (int): Number of rows sent per INSERT statement
+            commit_per_batch (bool): Commit after every batch. If False, the table is committed
+                as a whole and a failed batch rolls back the complete table.
+            retries (int): Number of times a failed batch is retried before it is quarantined
+            quarantine_dir (pathlib.Path or str): Directory for the rows of failed batches
+        """
+        self.batch_size = batch_size
+        self.commit_per_batch = commit_per_batch
+        self.retries = retries
+        self.quarantine_dir = Path(quarantine_dir)
+
+    def iter_batches(self, data):
+        """Yield the rows of the data in batches of Python values, missing values are None
+
+        Args:
+            data (pd.Dataframe): Data to split into batches
+
+        Yields:
+            tuple of (pd.Dataframe, list of tuple): The batch and its rows
+        """
+        for start in range(0, len(data), self.batch_size):
+            batch = data.iloc[start:start + self.batch_size]
+            values = batch.astype(object).where(batch.notna(), None)
+            yield batch, list(values.itertuples(index=False, name=None))
+
+    def insert_batch(self, cur, query, rows):
+        """Send one batch with the `VALUES %s` insert statement
+
+        Returns:
+            int: Number of bytes of the sent statement
+        """
+        execute_values(cur, query, rows, page_size=len(rows))
+        return len(cur.query)
+
+    def quarantine(self, table, batch):
+        """Write the rows of a failed batch into a csv file in the quarantine directory
+
+        Returns:
+            pathlib.Path: Path to the quarantine file
+        """
+        self.quarantine_dir.mkdir(parents=True, exist_ok=True)
+        quarantine_file = self.quarantine_dir / f"{table}_{uuid.uuid4().hex}.csv"
+        batch.to_csv(quarantine_file, index=False)
+        return quarantine_file
+
+    def load(self, conn, cur, query, data, stats=None):
+        """Insert the data batch by batch. A failed batch is retried and then quarantined
+        if batches are committed separately, else the whole table is rolled back.
+
+        Args:
+            conn (Connection): Connection to the database
+            cur (Cursor): Cursor for the database
+            query (str): SQL insert statement with a `VALUES %s` placeholder
+            data (pd.Dataframe): Data to insert into the table
+            stats (dict, optional): Receives the number of bytes sent as bytes_sent
+
+        Returns:
+            int: Number of inserted rows
+        """
+        table, _ = parse_insert_query(query)
+        start_time = time.perf_counter()
+        rows_loaded = 0
+        rows_quarantined = 0
+        bytes_sent = 0
+        for batch, rows in self.iter_batches(data):
+            for attempt in range(self.retries + 1):
+                try:
+                    bytes_sent += self.insert_batch(cur, query, rows)
+                    if self.commit_per_batch:
+                        conn.commit()
+                    rows_loaded += len(rows)
+                    break
+                except Exception as e:
+                    conn.rollback()
+                    if not self.commit_per_batch:
+                        raise LoadError(f"Loading {table} failed, the table was rolled back: {e}") from e
+                    print(f"Batch for {table} failed (attempt {attempt + 1}): {e}")
+            else:
+                quarantine_file = self.quarantine(table, batch)
+                rows_quarantined += len(rows)
+                print(f"Quarantined {len(rows)} rows of {table} in {quarantine_file}.")
+        if not self.commit_per_batch:
+            conn.commit()
+
+        if stats is not None:
+            stats['bytes_sent'] = bytes_sent
+        duration = time.perf_counter() - start_time
+        print(f"Inserted {rows_loaded} rows into {table} in {duration:.1f} s "
+              f"({rows_loaded / max(duration, 1e-9):.0f} rows/s), {rows_quarantined} rows quarantined.")
+        return rows_loaded
+
+
+class SQLiteInserter(BatchInserter):
+    """ Insert DataFrames in batches with executemany, for the sqlite3 module which has no execute_values """
+
+    def iter_batches(self, data):
+        """ Yield the batches like BatchInserter, with timestamps as text since sqlite3 does not bind them """
+        dates = data.select_dtypes(['datetime', 'datetimetz']).columns
+        data = data.assign(**{column: data[column].dt.strftime('%Y-%m-%d %H:%M:%S') for column in dates})
+        yield from super().iter_batches(data)
+
+    def insert_batch(self, cur, query, rows):
+        """Send one batch with the `VALUES %s` insert statement, one parameter per column
+
+        Returns:
+            int: 0, the rows are not sent anywhere but written into the database file
+        """
+        cur.executemany(query.replace('%s', '(' + ', '.join('?' * len(rows[0])) + ')'), rows)
+        return 0
@@ -0,0 +1,119 @@
+import hashlib
+import os
+from pathlib import Path
+
+import pyarrow as pa
+
+# Suffix of the cached frames, Arrow IPC files that are memory-mapped on a hit
+CACHE_SUFFIX = '.arrow'
+# Bytes read per step when hashing an input file
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def file_digest(path):
+    """ Get the SHA-256 of the content of a file as hex string """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_frame(sink, data):
+    """ Write a DataFrame as Arrow IPC file into a pyarrow sink, e.g. an OSFile or a BufferOutputStream """
+    table = pa.Table.from_pandas(data, preserve_index=False)
+    with pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+
+
+def read_frame(source, types_mapper=None):
+    """Read a DataFrame written with write_frame
+
+    Args:
+        source (pyarrow.NativeFile or pyarrow.Buffer): The Arrow IPC file, e.g. memory-mapped
+        types_mapper (callable, optional): types_mapper for pyarrow's to_pandas, e.g. to keep strings in Arrow
+
+    Returns:
+        pd.DataFrame: The frame. Columns kept in Arrow still point into the source.
+    """
+    table = pa.ipc.open_file(source).read_all()
+    data = table.to_pandas(types_mapper=types_mapper)
+    # to_pandas does not apply the types_mapper to the categories of dictionary columns
+    for field in table.schema:
+        if types_mapper and pa.types.is_dictionary(field.type) and types_mapper(field.type.value_type):
+            categories = data[field.name].cat.categories.astype(types_mapper(field.type.value_type))
+            data[field.name] = data[field.name].cat.rename_categories(categories)
+    return data
+
+
+class ParseCache():
+    """ Keep the cleaned frames of the DataParser in a directory, keyed by the hash of the input file,
+    the parser version and the parse options. A hit is memory-mapped instead of parsing the input again.
+    The least recently used frames are evicted when the directory grows beyond its size limit. """
+
+    def __init__(self, cache_dir, max_bytes=2 << 30):
+        """
+        Args:
+            cache_dir (pathlib.Path or str): Directory of the cached frames, it is created if missing
+            max_bytes (int): Size limit of the directory
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+    def key(self, input_file, *options):
+        """Get the cache key of a parsed input file
+
+        Args:
+            input_file (pathlib.Path or str): Input file, e.g. a csv or a zip file containing it
+            options: Everything else that changes the parsed frame, e.g. the parser version
+
+        Returns:
+            str: Hex digest of the file content and the options
+        """
+        digest = hashlib.sha256(file_digest(input_file).encode())
+        for option in options:
+            digest.update(f"\0{option}".encode())
+        return digest.hexdigest()
+
+    def path(self, key):
+        return self.cache_dir / (key + CACHE_SUFFIX)
+
+    def get(self, key, types_mapper=None):
+        """Read a cached frame
+
+        Args:
+            key (str): Cache key, see key
+            types_mapper (callable, optional): types_mapper for pyarrow's to_pandas, e.g. to keep strings in Arrow
+
+        Returns:
+            pd.DataFrame: The cached frame, None if it is not cached
+        """
+        path = self.path(key)
+        try:
+            source = pa.memory_map(str(path))
+        except FileNotFoundError:
+            return None
+        # The modification time orders the frames for the eviction
+        os.utime(path)
+        return read_frame(source, types_mapper)
+
+    def put(self, key, data):
+        """ Store a frame under the key and evict the least recently used frames beyond the size limit """
+        path = self.path(key)
+        tmp_path = path.with_suffix('.tmp')
+        with pa.OSFile(str(tmp_path), 'wb') as sink:
+            write_frame(sink, data)
+        os.replace(tmp_path, path)
+        self.evict(keep=path)
+
+    def evict(self, keep=None):
+        """ Delete the least recently used frames until the directory fits into the size limit, except keep """
+        files = sorted(self.cache_dir.glob('*' + CACHE_SUFFIX), key=lambda file: file.stat().st_mtime_ns)
+        size = sum(file.stat().st_size for file in files)
+        for file in files:
+            if size <= self.max_bytes:
+                break
+            if file != keep:
+                size -= file.stat().st_size
+                file.unlink(missing_ok=True)
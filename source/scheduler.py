@@ -0,0 +1,132 @@
+import re
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from graphlib import TopologicalSorter
+from queue import Queue
+from threading import Lock
+
+from instrumentation import Instrumentation
+
+FOREIGN_KEY_REGEX = re.compile(r'ALTER TABLE (\w+)\s+ADD CONSTRAINT \w+\s+FOREIGN KEY \(\w+\)\s+REFERENCES (\w+)')
+
+
+def table_dependencies(foreign_key_query):
+    """Get the tables each table references from the foreign key constraints
+
+    Args:
+        foreign_key_query (str): ALTER TABLE statements adding the foreign keys, see sql_queries
+
+    Returns:
+        dict: Set of referenced tables per table
+    """
+    dependencies = {}
+    for table, referenced_table in FOREIGN_KEY_REGEX.findall(foreign_key_query):
+        dependencies.setdefault(table, set()).add(referenced_table)
+    return dependencies
+
+
+class TableScheduler():
+    """ Transform and load tables in parallel. A table is loaded after all tables it references are loaded. """
+
+    def __init__(self, dependencies, connect, transform_workers=0, load_workers=1, connections=(), release=None,
+                 instrumentation=None):
+        """
+        Args:
+            dependencies (dict): Set of referenced tables per table, see table_dependencies
+            connect (callable): Returns a new (connection, cursor) tuple for a load worker
+            transform_workers (int): Number of processes for the transforms, 0 runs each transform in its load worker
+            load_workers (int): Number of tables loaded at the same time, each over its own connection
+            connections (iterable of tuple): Open (connection, cursor) tuples to use first. They are not closed.
+            release (callable, optional): Called with each connection opened by connect when the scheduler
+                is closed, e.g. to return it to a pool. Defaults to closing the connection.
+            instrumentation (Instrumentation, optional): Measures each transform as stage `transform <table>`.
+                With transform workers, the stage is the wait for the result of the worker process.
+        """
+        self.dependencies = dependencies
+        self.connect = connect
+        self.release = release or (lambda conn: conn.close())
+        self.instrumentation = instrumentation or Instrumentation()
+        self.load_workers = load_workers
+        self.transform_pool = ProcessPoolExecutor(transform_workers) if transform_workers > 0 else None
+        self.load_pool = ThreadPoolExecutor(load_workers)
+        self.connections = Queue()
+        for connection in list(connections)[:load_workers]:
+            self.connections.put(connection)
+        self.num_connections = self.connections.qsize()
+        self.own_connections = []
+        self.lock = Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """ Shut down the worker pools and release the connections opened by the scheduler """
+        if self.transform_pool is not None:
+            self.transform_pool.shutdown()
+        self.load_pool.shutdown()
+        for conn, _ in self.own_connections:
+            self.release(conn)
+
+    def get_connection(self):
+        """ Take a free connection, open a new one while there are less connections than load workers """
+        with self.lock:
+            open_new = self.connections.empty() and self.num_connections < self.load_workers
+            if open_new:
+                self.num_connections += 1
+        if open_new:
+            connection = self.connect()
+            self.own_connections.append(connection)
+            return connection
+        return self.connections.get()
+
+    def run(self, tasks, load):
+        """Run the transforms and load their results, referenced tables first
+
+        Args:
+            tasks (dict): Per table either a tuple (function, args) whose result is loaded, or the data itself
+            load (callable): Called with (connection, cursor, table, data) to load a table
+
+        Raises:
+            Exception: The first error of a transform or load, after all started loads finished
+        """
+        transformed = {}
+        for table, task in tasks.items():
+            if isinstance(task, tuple) and self.transform_pool is not None:
+                function, args = task
+                transformed[table] = self.transform_pool.submit(function, *args)
+            else:
+                transformed[table] = task
+
+        # Submit the loads in topological order, so that a load only waits for loads that were started before
+        order = TopologicalSorter({table: self.dependencies.get(table, set()) & tasks.keys() for table in tasks})
+        loaded = {}
+        for table in order.static_order():
+            dependencies = [loaded[dependency] for dependency in self.dependencies.get(table, set()) if dependency in loaded]
+            loaded[table] = self.load_pool.submit(self.load_table, load, table, transformed[table], dependencies)
+
+        errors = [future.exception() for future in loaded.values() if future.exception() is not None]
+        if errors:
+            raise errors[0]
+
+    def load_table(self, load, table, transformed, dependencies):
+        """ Wait for the transform and the referenced tables, then load the table over a free connection """
+        for dependency in dependencies:
+            dependency.result()
+        if isinstance(transformed, (Future, tuple)):
+            with self.instrumentation.stage(f"transform {table}") as record:
+                if isinstance(transformed, Future):
+                    data = transformed.result()
+                else:
+                    function, args = transformed
+                    record['rows_in'] = len(args[0])
+                    data = function(*args)
+                record['rows_out'] = len(data)
+        else:
+            data = transformed
+        connection = self.get_connection()
+        try:
+            load(*connection, table, data)
+        finally:
+            self.connections.put(connection)
@@ -0,0 +1,129 @@
+import re
+
+from sql_queries import create_table_queries, foreign_key_query
+
+CREATE_TABLE_REGEX = re.compile(r'CREATE TABLE IF NOT EXISTS (\w+)\s*\(')
+# Suffix of the tables a full load writes into before they replace the live tables, see SchemaManager.swap_shadow_tables
+SHADOW_SUFFIX = '_shadow'
+# Suffix of the replaced live tables until they are dropped
+OLD_SUFFIX = '_old'
+
+add_column_query = "ALTER TABLE {table} ADD COLUMN {definition};"
+rename_table_query = "ALTER TABLE {table} RENAME TO {new_name};"
+drop_table_query = "DROP TABLE IF EXISTS {table} CASCADE;"
+
+
+def split_top_level(text):
+    """ Split a column list at the commas outside of parentheses, e.g. not in numeric(10,2) """
+    parts, depth, start = [], 0, 0
+    for i, char in enumerate(text):
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return [part.strip() for part in parts if part.strip()]
+
+
+def table_definitions(create_queries):
+    """Get the column definitions of the tables from their CREATE TABLE statements
+
+    Args:
+        create_queries (list of str): CREATE TABLE IF NOT EXISTS statements, see sql_queries
+
+    Returns:
+        dict: Per table, the column definitions by column name in the order of the statement
+    """
+    definitions = {}
+    for query in create_queries:
+        match = CREATE_TABLE_REGEX.search(query)
+        # The column list ends at the parenthesis matching the opening one
+        depth, end = 1, match.end()
+        while depth:
+            depth += {'(': 1, ')': -1}.get(query[end], 0)
+            end += 1
+        columns = split_top_level(query[match.end():end - 1])
+        definitions[match.group(1)] = {column.split()[0]: column for column in columns}
+    return definitions
+
+
+class SchemaManager():
+    """ Keep the tables in the database in line with the table definitions of sql_queries without dropping
+    the loaded data. Incremental loads migrate the existing tables, full loads write into shadow tables
+    that replace the live tables at once, so that readers never see empty or half-loaded tables. """
+
+    def __init__(self, backend, create_queries=create_table_queries, foreign_keys=foreign_key_query):
+        """
+        Args:
+            backend (Backend): Backend of the database
+            create_queries (list of str): CREATE TABLE IF NOT EXISTS statements of the tables
+            foreign_keys (str): ALTER TABLE statements adding the foreign keys between the tables
+        """
+        self.backend = backend
+        self.create_queries = create_queries
+        self.foreign_keys = foreign_keys
+        self.definitions = table_definitions(create_queries)
+        self.table_regex = re.compile(r'\b(' + '|'.join(self.definitions) + r')\b')
+
+    def migration_queries(self, cur):
+        """Compare the tables in the database with the definitions
+
+        Args:
+            cur (Cursor): Cursor for the database
+
+        Returns:
+            list of str: Statements creating the missing tables and adding the missing columns. Added columns
+                are nullable, since the table may already have rows. Other differences are only reported.
+        """
+        existing = self.backend.table_columns(cur)
+        queries = []
+        for query, (table, columns) in zip(self.create_queries, self.definitions.items()):
+            if table not in existing:
+                queries.append(query)
+                continue
+            for column, definition in columns.items():
+                if column not in existing[table]:
+                    definition = re.sub(r'\s+(PRIMARY KEY|NOT NULL)', '', definition)
+                    queries.append(add_column_query.format(table=table, definition=definition))
+            for column in existing[table]:
+                if column not in columns:
+                    print(f"Column {column} of table {table} is not defined anymore, it is kept.")
+        return queries
+
+    def migrate(self, cur, conn):
+        """ Create the missing tables and add the missing columns, the data of the existing tables is kept """
+        queries = self.migration_queries(cur)
+        for query in queries:
+            print("Migrating schema:", ' '.join(query.split())[:100])
+            self.backend.execute(cur, query)
+        conn.commit()
+
+    def shadow_query(self, query):
+        """ Rename the tables in a query to their shadow tables, e.g. an insert statement """
+        return self.table_regex.sub(lambda match: match.group(1) + SHADOW_SUFFIX, query)
+
+    def create_shadow_tables(self, cur, conn):
+        """ Create empty shadow tables with their foreign keys. Leftovers of an aborted load are dropped first. """
+        print("Creating shadow tables")
+        for table in self.definitions:
+            self.backend.execute(cur, drop_table_query.format(table=table + SHADOW_SUFFIX))
+            self.backend.execute(cur, drop_table_query.format(table=table + OLD_SUFFIX))
+        for query in self.create_queries:
+            self.backend.execute(cur, self.shadow_query(query))
+        self.backend.execute(cur, self.shadow_query(self.foreign_keys))
+        conn.commit()
+
+    def swap_shadow_tables(self, cur, conn):
+        """ Replace the live tables by the loaded shadow tables in one transaction and drop the old tables """
+        print("Swapping shadow tables in")
+        existing = self.backend.table_columns(cur)
+        renames, drops = [], []
+        for table in self.definitions:
+            if table in existing:
+                renames.append(rename_table_query.format(table=table, new_name=table + OLD_SUFFIX))
+                drops.append(drop_table_query.format(table=table + OLD_SUFFIX))
+            renames.append(rename_table_query.format(table=table + SHADOW_SUFFIX, new_name=table))
+        self.backend.execute_in_transaction(conn, cur, '\n'.join(renames + drops))
@@ -0,0 +1,277 @@
+import json
+import mmap
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from sql_queries import *
+
+# Start of the index file, followed by the length of the JSON header and the header, see SearchIndex.save
+MAGIC = b'RECIPEIX'
+# Offset alignment of the arrays in the index file, so that they can be used directly from the memory map
+ALIGNMENT = 64
+# Terms in more than this fraction of the recipes are stored as bitmap, which is then smaller than the posting list
+BITMAP_FRACTION = 1 / 32
+# Searchable terms of the recipes
+TERM_KINDS = ['ingredients', 'keywords', 'categories']
+
+
+class SearchIndex():
+    """ In-process index for searching recipes by ingredients, keywords, category, total time and rating.
+    The recipes are numbered by their position in the sorted recipe ids. For each term (e.g. an ingredient)
+    the positions of its recipes are kept as sorted posting list, or as bitmap if the term is frequent.
+    The arrays can be saved into one file that is memory-mapped when loaded, so that several app workers
+    share the same pages. """
+
+    def __init__(self, arrays, terms):
+        """
+        Args:
+            arrays (dict): Numpy arrays of the index by name, see build
+            terms (dict): Names of the terms per kind, e.g. the ingredient names, in the order of the posting lists
+        """
+        self.arrays = arrays
+        self.terms = terms
+        self.term_rows = {kind: {term: row for row, term in enumerate(names)} for kind, names in terms.items()}
+        self.recipe_ids = arrays['recipe_ids']
+
+    def __len__(self):
+        return len(self.recipe_ids)
+
+    @classmethod
+    def build(cls, recipes, ratings, links):
+        """Build the index from the tables of the data model
+
+        Args:
+            recipes (pd.DataFrame): Recipes with RecipeId and TotalTime
+            ratings (pd.DataFrame): Average rating per recipe with RecipeId and Rating
+            links (dict): Per term kind, the (recipe id, term id) pairs and the (term id, term name) pairs as DataFrames,
+                e.g. the recipe_ingredients and ingredients tables
+
+        Returns:
+            SearchIndex: The index
+        """
+        recipe_ids = np.sort(recipes['RecipeId'].to_numpy(dtype=np.int64))
+        total_time = np.full(len(recipe_ids), np.nan, dtype=np.float32)
+        total_time[np.searchsorted(recipe_ids, recipes['RecipeId'].to_numpy(dtype=np.int64))] = pd.to_numeric(recipes['TotalTime'])
+        rating = np.full(len(recipe_ids), np.nan, dtype=np.float32)
+        rated = ratings[np.isin(ratings['RecipeId'].to_numpy(dtype=np.int64), recipe_ids)]
+        rating[np.searchsorted(recipe_ids, rated['RecipeId'].to_numpy(dtype=np.int64))] = pd.to_numeric(rated['Rating'])
+
+        arrays = {'recipe_ids': recipe_ids, 'total_time': total_time, 'rating': rating}
+        for name, values in [('total_time', total_time), ('rating', rating)]:
+            # Sorted values of the recipes that have one and their positions, for range queries
+            order = np.argsort(values, kind='stable')[:np.count_nonzero(~np.isnan(values))]
+            arrays[f'{name}_sorted'] = values[order]
+            arrays[f'{name}_order'] = order.astype(np.uint32)
+        terms = {}
+        for kind, (pairs, names) in links.items():
+            terms[kind], kind_arrays = build_postings(recipe_ids, *pairs.to_numpy(dtype=np.int64).T, names)
+            arrays.update({f'{kind}_{name}': array for name, array in kind_arrays.items()})
+        # Number of distinct ingredients of each recipe, for counting the missing ingredients
+        ingredient_counts = np.zeros(len(recipe_ids), dtype=np.uint16)
+        np.add.at(ingredient_counts, arrays['ingredients_postings'], 1)
+        for row in np.flatnonzero(arrays['ingredients_bitmap_rows'] >= 0):
+            ingredient_counts += unpack(arrays['ingredients_bitmaps'][arrays['ingredients_bitmap_rows'][row]], len(recipe_ids))
+        arrays['ingredient_counts'] = ingredient_counts
+        print(f"Built search index of {len(recipe_ids)} recipes and {len(terms['ingredients'])} ingredients.")
+        return cls(arrays, terms)
+
+    @classmethod
+    def from_database(cls, backend, cur):
+        """Build the index from the tables in the database, so that it also covers the rows of earlier incremental loads
+
+        Args:
+            backend (Backend): Backend of the database
+            cur (Cursor): Cursor for the database
+
+        Returns:
+            SearchIndex: The index
+        """
+        def select(query, columns):
+            backend.execute(cur, query)
+            return pd.DataFrame(cur.fetchall(), columns=columns)
+
+        links = {}
+        for kind, pairs_query, names_query in [('ingredients', search_recipe_ingredients_select, ingredients_select),
+                                               ('keywords', search_recipe_keywords_select, keywords_select),
+                                               ('categories', search_recipe_categories_select, categories_select)]:
+            links[kind] = (select(pairs_query, ['RecipeId', 'TermId']), select(names_query, ['TermId', 'Term']))
+        return cls.build(select(search_recipes_select, ['RecipeId', 'TotalTime']),
+                         select(search_ratings_select, ['RecipeId', 'Rating']), links)
+
+    def save(self, path):
+        """Write the index into one file. It is written next to the path and then renamed,
+        so that workers that mapped the previous file keep reading it until they load the new one.
+
+        Args:
+            path (pathlib.Path or str): Index file
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        specs = {}
+        offset = 0
+        for name, array in self.arrays.items():
+            specs[name] = {'dtype': array.dtype.str, 'shape': array.shape, 'offset': offset}
+            offset = aligned(offset + array.nbytes)
+        header = json.dumps({'terms': self.terms, 'arrays': specs}).encode()
+        data_start = aligned(len(MAGIC) + 8 + len(header))
+        temp_path = path.with_name(path.name + '.tmp')
+        with open(temp_path, 'wb') as f:
+            f.write(MAGIC + len(header).to_bytes(8, 'little') + header)
+            for name, array in self.arrays.items():
+                f.seek(data_start + specs[name]['offset'])
+                f.write(np.ascontiguousarray(array).tobytes())
+            f.truncate(data_start + offset)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Memory-map an index file written by save. The arrays are read-only views of the file.
+
+        Args:
+            path (pathlib.Path or str): Index file
+
+        Returns:
+            SearchIndex: The index
+        """
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if buffer[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a search index file.")
+        header_length = int.from_bytes(buffer[len(MAGIC):len(MAGIC) + 8], 'little')
+        header = json.loads(buffer[len(MAGIC) + 8:len(MAGIC) + 8 + header_length])
+        data_start = aligned(len(MAGIC) + 8 + header_length)
+        arrays = {}
+        for name, spec in header['arrays'].items():
+            dtype = np.dtype(spec['dtype'])
+            count = int(np.prod(spec['shape']))
+            arrays[name] = np.frombuffer(buffer, dtype=dtype, count=count,
+                                         offset=data_start + spec['offset']).reshape(spec['shape'])
+        return cls(arrays, header['terms'])
+
+    def recipes_with(self, kind, term):
+        """Get the recipes that have a term
+
+        Args:
+            kind (str): Kind of the term, one of TERM_KINDS
+            term (str): E.g. an ingredient name
+
+        Returns:
+            np.ndarray: Boolean mask over the recipes, all False for unknown terms
+        """
+        mask = np.zeros(len(self), dtype=bool)
+        row = self.term_rows[kind].get(term)
+        if row is None:
+            return mask
+        bitmap_row = self.arrays[f'{kind}_bitmap_rows'][row]
+        if bitmap_row >= 0:
+            return unpack(self.arrays[f'{kind}_bitmaps'][bitmap_row], len(self)).view(bool)
+        offsets = self.arrays[f'{kind}_offsets']
+        mask[self.arrays[f'{kind}_postings'][offsets[row]:offsets[row + 1]]] = True
+        return mask
+
+    def in_range(self, name, minimum=None, maximum=None):
+        """Get the recipes whose total_time or rating is within the bounds, recipes without value are excluded
+
+        Returns:
+            np.ndarray: Boolean mask over the recipes
+        """
+        values = self.arrays[f'{name}_sorted']
+        start = np.searchsorted(values, minimum, 'left') if minimum is not None else 0
+        end = np.searchsorted(values, maximum, 'right') if maximum is not None else len(values)
+        mask = np.zeros(len(self), dtype=bool)
+        mask[self.arrays[f'{name}_order'][start:end]] = True
+        return mask
+
+    def search(self, ingredients=(), available=None, max_missing=None, keywords=(), category=None,
+               max_total_time=None, min_rating=None, limit=None):
+        """Find the recipes matching all criteria
+
+        Args:
+            ingredients (list of str): Ingredients the recipes must contain
+            available (list of str, optional): Ingredients at hand, the required ingredients count as available
+            max_missing (int, optional): Maximum number of ingredients of a recipe that are not available
+            keywords (list of str): Keywords the recipes must have
+            category (str, optional): Category of the recipes
+            max_total_time (float, optional): Maximum total time in minutes
+            min_rating (float, optional): Minimum average rating
+            limit (int, optional): Maximum number of results
+
+        Returns:
+            pd.DataFrame: RecipeId, MissingIngredients (neither required nor available), TotalTime and Rating
+                of the matches, with the fewest missing ingredients and then the best rating first
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for ingredient in ingredients:
+            mask &= self.recipes_with('ingredients', ingredient.lower())
+        for keyword in keywords:
+            mask &= self.recipes_with('keywords', keyword)
+        if category is not None:
+            mask &= self.recipes_with('categories', category)
+        if max_total_time is not None:
+            mask &= self.in_range('total_time', maximum=max_total_time)
+        if min_rating is not None:
+            mask &= self.in_range('rating', minimum=min_rating)
+
+        positions = np.flatnonzero(mask)
+        missing = self.arrays['ingredient_counts'][positions].astype(np.int32)
+        for ingredient in set(ingredient.lower() for ingredient in list(ingredients) + list(available or [])):
+            missing -= self.recipes_with('ingredients', ingredient)[positions]
+        if max_missing is not None:
+            positions, missing = positions[missing <= max_missing], missing[missing <= max_missing]
+        rating = self.arrays['rating']
+        total_time = self.arrays['total_time']
+        order = np.lexsort((-np.nan_to_num(rating[positions], nan=-1), missing))[:limit]
+        return pd.DataFrame({'RecipeId': self.recipe_ids[positions[order]], 'MissingIngredients': missing[order],
+                             'TotalTime': total_time[positions[order]], 'Rating': rating[positions[order]]})
+
+
+def build_postings(recipe_ids, pair_recipe_ids, pair_term_ids, names):
+    """Build the posting lists and bitmaps of one term kind
+
+    Args:
+        recipe_ids (np.ndarray): Sorted ids of the recipes
+        pair_recipe_ids (np.ndarray): Recipe id of each (recipe, term) pair
+        pair_term_ids (np.ndarray): Term id of each (recipe, term) pair
+        names (pd.DataFrame): Term ids and names, e.g. the ingredients table
+
+    Returns:
+        tuple of (list, dict): The term names and the arrays offsets, postings, bitmap_rows and bitmaps
+    """
+    names = names.sort_values(names.columns[0])
+    term_ids = names.iloc[:, 0].to_numpy(dtype=np.int64)
+    # Pairs of unknown recipes or terms are left out, duplicate pairs are counted once
+    known = np.isin(pair_recipe_ids, recipe_ids) & np.isin(pair_term_ids, term_ids)
+    rows = np.searchsorted(term_ids, pair_term_ids[known])
+    positions = np.searchsorted(recipe_ids, pair_recipe_ids[known])
+    keys = np.sort(rows * len(recipe_ids) + positions)
+    keys = keys[np.append(True, keys[1:] != keys[:-1])] if len(keys) else keys
+    rows, positions = keys // max(len(recipe_ids), 1), (keys % max(len(recipe_ids), 1)).astype(np.uint32)
+    counts = np.bincount(rows, minlength=len(term_ids))
+
+    dense = counts > len(recipe_ids) * BITMAP_FRACTION
+    bitmap_rows = np.full(len(term_ids), -1, dtype=np.int32)
+    bitmap_rows[dense] = np.arange(np.count_nonzero(dense))
+    bitmaps = np.zeros((np.count_nonzero(dense), (len(recipe_ids) + 7) // 8), dtype=np.uint8)
+    starts = np.concatenate([[0], np.cumsum(counts)])
+    for row in np.flatnonzero(dense):
+        bits = np.zeros(len(recipe_ids), dtype=bool)
+        bits[positions[starts[row]:starts[row + 1]]] = True
+        bitmaps[bitmap_rows[row]] = np.packbits(bits)
+    # The recipes of terms with a bitmap are left out of the posting lists
+    sparse = ~dense[rows]
+    offsets = np.concatenate([[0], np.cumsum(np.where(dense, 0, counts))]).astype(np.int64)
+    arrays = {'offsets': offsets, 'postings': positions[sparse], 'bitmap_rows': bitmap_rows, 'bitmaps': bitmaps}
+    return names.iloc[:, 1].astype(str).tolist(), arrays
+
+
+def unpack(bitmap, length):
+    """ Unpack a bitmap of build_postings into one 0/1 byte per recipe """
+    return np.unpackbits(bitmap, count=length)
+
+
+def aligned(offset):
+    """ Round an offset up to the next multiple of ALIGNMENT """
+    return -(-offset // ALIGNMENT) * ALIGNMENT
@@ -8,8 +8,15 @@ recipe_keywords_table_drop = "DROP TABLE IF EXISTS recipe_keywords CASCADE;"
 keyword_table_drop = "DROP TABLE IF EXISTS keywords CASCADE;"
 authors_table_drop = "DROP TABLE IF EXISTS authors CASCADE;"
 reviews_table_drop = "DROP TABLE IF EXISTS reviews CASCADE;"
+etl_watermarks_table_drop = "DROP TABLE IF EXISTS etl_watermarks CASCADE;"
+recipe_stats_table_drop = "DROP TABLE IF EXISTS recipe_stats CASCADE;"
+author_stats_table_drop = "DROP TABLE IF EXISTS author_stats CASCADE;"
 
 # CREATE TABLES
+# The tables are written for Redshift. The recipe child tables, the reviews and recipe_stats are distributed
+# by recipe_id, so that they are joined with the recipes on the same node; the small dimensions are copied
+# to all nodes. The sort keys let Redshift skip blocks for the usual filters, e.g. on the total time.
+# The other backends strip the distribution, sort key and encoding clauses, see backends.
 
 recipes_table_create = ("""
 CREATE TABLE IF NOT EXISTS recipes (
@@ -20,7 +27,7 @@ CREATE TABLE IF NOT EXISTS recipes (
             prep_time float,
             total_time float,
             date_published datetime,
-            description varchar(max),
+            description varchar(max) ENCODE ZSTD,
             category_id int,
             calories float,
             fat_content float,
@@ -33,8 +40,10 @@ CREATE TABLE IF NOT EXISTS recipes (
             protein_content float,
             recipe_servings varchar(50),
             recipe_yield varchar(50),
-            recipe_instructions varchar(max)
-            );
+            recipe_instructions varchar(max) ENCODE ZSTD
+            )
+DISTKEY(recipe_id)
+COMPOUND SORTKEY(total_time, date_published);
 """)
 
 recipe_images_table_create = ("""
@@ -42,12 +51,16 @@ CREATE TABLE IF NOT EXISTS recipe_images (
             recipe_image_id int IDENTITY(0,1) PRIMARY KEY, 
             recipe_id int NOT NULL,
             image_url varchar)
+DISTKEY(recipe_id)
+SORTKEY(recipe_id)
 """)
 
 ingredients_table_create = ("""
 CREATE TABLE IF NOT EXISTS ingredients (
             ingredient_id int PRIMARY KEY, 
             name varchar(500))
+DISTSTYLE ALL
+SORTKEY(ingredient_id)
 """)
 
 recipe_ingredients_table_create = ("""
@@ -57,25 +70,33 @@ CREATE TABLE IF NOT EXISTS recipe_ingredients (
             recipe_id int NOT NULL,
             ingredient_quantity VARCHAR(20)
             )
+DISTKEY(recipe_id)
+SORTKEY(recipe_id, ingredient_id)
 """)
 
 categories_table_create = ("""
 CREATE TABLE IF NOT EXISTS categories (
             category_id int PRIMARY KEY, 
-            category_name varchar(50));
+            category_name varchar(50))
+DISTSTYLE ALL
+SORTKEY(category_name);
 """)
 
 keywords_table_create = ("""
     CREATE TABLE IF NOT EXISTS keywords ( 
             keyword_id int PRIMARY KEY, 
-            keyword varchar(50) NOT NULL);
+            keyword varchar(50) NOT NULL)
+DISTSTYLE ALL
+SORTKEY(keyword);
 """)
 
 recipe_keywords_table_create = ("""
     CREATE TABLE IF NOT EXISTS recipe_keywords ( 
             recipe_keyword_id int IDENTITY(0,1) PRIMARY KEY,
             recipe_id int NOT NULL,
-            keyword_id int NOT NULL);
+            keyword_id int NOT NULL)
+DISTKEY(recipe_id)
+SORTKEY(recipe_id, keyword_id);
 """)
 
 reviews_table_create = ("""
@@ -84,15 +105,54 @@ reviews_table_create = ("""
             author_id int NOT NULL,
             recipe_id int NOT NULL,
             rating int NOT NULL,
-            review varchar(max),
+            review varchar(max) ENCODE ZSTD,
             date_submitted datetime,
-            date_modified datetime);
+            date_modified datetime)
+DISTKEY(recipe_id)
+COMPOUND SORTKEY(recipe_id, rating);
 """)
 
 authors_table_create = ("""
     CREATE TABLE IF NOT EXISTS authors ( 
             author_id int PRIMARY KEY, 
-            name varchar(250) NOT NULL);
+            name varchar(250) NOT NULL)
+DISTKEY(author_id)
+SORTKEY(author_id);
+""")
+
+etl_watermarks_table_create = ("""
+    CREATE TABLE IF NOT EXISTS etl_watermarks (
+            source varchar(50) PRIMARY KEY,
+            high_water_mark datetime)
+DISTSTYLE ALL;
+""")
+
+# Summary tables, see summary_stats. The rating sums are kept so that the stats of new reviews can be added.
+recipe_stats_table_create = ("""
+    CREATE TABLE IF NOT EXISTS recipe_stats (
+            recipe_id int PRIMARY KEY,
+            review_count int NOT NULL,
+            rating_sum float NOT NULL,
+            mean_rating float,
+            bayesian_rating float,
+            last_review_date datetime,
+            ingredient_count int,
+            keyword_count int)
+DISTKEY(recipe_id)
+COMPOUND SORTKEY(bayesian_rating, review_count);
+""")
+
+author_stats_table_create = ("""
+    CREATE TABLE IF NOT EXISTS author_stats (
+            author_id int PRIMARY KEY,
+            recipe_count int NOT NULL,
+            review_count int NOT NULL,
+            rating_sum float NOT NULL,
+            mean_rating float,
+            last_recipe_date datetime,
+            last_review_date datetime)
+DISTKEY(author_id)
+SORTKEY(author_id);
 """)
 
 foreign_key_query = """
@@ -189,7 +249,149 @@ VALUES %s
 """
 )
 
+etl_watermarks_table_insert = ("""
+INSERT INTO etl_watermarks (source, high_water_mark)
+VALUES %s
+"""
+)
+
+recipe_stats_table_insert = ("""
+INSERT INTO recipe_stats (recipe_id, review_count, rating_sum, mean_rating, bayesian_rating, last_review_date, ingredient_count, keyword_count)
+VALUES %s
+"""
+)
+
+author_stats_table_insert = ("""
+INSERT INTO author_stats (author_id, recipe_count, review_count, rating_sum, mean_rating, last_recipe_date, last_review_date)
+VALUES %s
+"""
+)
+
 # QUERY LISTS
 
-create_table_queries = [recipes_table_create, recipe_images_table_create,recipe_ingredients_table_create, ingredients_table_create, categories_table_create, recipe_keywords_table_create, keywords_table_create, authors_table_create, reviews_table_create]
-drop_table_queries = [recipe_images_table_drop, recipe_ingredients_table_drop, ingredients_table_drop, categories_table_drop, recipe_keywords_table_drop, reviews_table_drop, recipes_table_drop, keyword_table_drop, authors_table_drop]
\ No newline at end of file
+create_table_queries = [recipes_table_create, recipe_images_table_create,recipe_ingredients_table_create, ingredients_table_create, categories_table_create, recipe_keywords_table_create, keywords_table_create, authors_table_create, reviews_table_create, etl_watermarks_table_create, recipe_stats_table_create, author_stats_table_create]
+drop_table_queries = [recipe_images_table_drop, recipe_ingredients_table_drop, ingredients_table_drop, categories_table_drop, recipe_keywords_table_drop, reviews_table_drop, recipes_table_drop, keyword_table_drop, authors_table_drop, etl_watermarks_table_drop, recipe_stats_table_drop, author_stats_table_drop]
+
+# COPY QUERIES
+
+copy_from_stdin_query = ("""
+COPY {table} ({columns})
+FROM STDIN WITH CSV
+""")
+
+copy_from_s3_query = ("""
+COPY {table} ({columns})
+FROM 's3://{bucket}/{key}'
+IAM_ROLE '{iam_role}'
+CSV GZIP EMPTYASNULL
+TIMEFORMAT 'auto'
+REGION '{region}'
+""")
+
+count_rows_query = "SELECT COUNT(*) FROM {table};"
+
+# MAINTENANCE
+
+# Update the planner statistics, and sort the rows and reclaim deleted ones after merges
+analyze_table_query = "ANALYZE {table};"
+vacuum_table_query = "VACUUM {table};"
+# Percentage of unsorted or deleted rows per table, the tables below a threshold are not vacuumed
+redshift_vacuum_stats_select = ("""
+SELECT "table", GREATEST(COALESCE(unsorted, 0), 100.0 * (tbl_rows - estimated_visible_rows) / NULLIF(tbl_rows, 0))
+FROM svv_table_info;
+""")
+postgres_vacuum_stats_select = ("""
+SELECT relname, 100.0 * n_dead_tup / NULLIF(n_live_tup + n_dead_tup, 0) FROM pg_stat_user_tables;
+""")
+
+
+# INCREMENTAL LOADS
+
+etl_watermarks_select = "SELECT source, high_water_mark FROM etl_watermarks;"
+
+categories_select = "SELECT category_id, category_name FROM categories;"
+keywords_select = "SELECT keyword_id, keyword FROM keywords;"
+ingredients_select = "SELECT ingredient_id, name FROM ingredients;"
+
+table_exists_query = "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = '{table}';"
+table_columns_select = ("SELECT table_name, column_name FROM information_schema.columns "
+                        "WHERE table_schema = current_schema() ORDER BY table_name, ordinal_position;")
+
+staging_table_create = ("""
+DROP TABLE IF EXISTS {staging_table};
+CREATE TEMP TABLE {staging_table} AS SELECT {columns} FROM {table} WHERE 1 = 0;
+""")
+
+# Update the rows of the table that have the same key as a staged row and insert the others
+upsert_staging_table = ("""
+UPDATE {table} SET {assignments} FROM {staging_table} WHERE {table}.{key} = {staging_table}.{key};
+INSERT INTO {table} ({columns}) SELECT {columns} FROM {staging_table}
+    WHERE {staging_table}.{key} NOT IN (SELECT {key} FROM {table});
+DROP TABLE {staging_table};
+""")
+
+# Replace all rows of the table that have the same key as the staged rows, e.g. all images of a recipe
+merge_staging_table = ("""
+DELETE FROM {table} WHERE {key} IN (SELECT {key} FROM {staging_table});
+INSERT INTO {table} ({columns}) SELECT {columns} FROM {staging_table};
+DROP TABLE {staging_table};
+""")
+
+# Delete the rows of the table with the staged keys, e.g. the recipes that are not in the input files anymore
+staging_keys_insert = ("""
+INSERT INTO {staging_table} ({key})
+VALUES %s
+""")
+
+delete_staging_table = ("""
+DELETE FROM {table} WHERE {key} IN (SELECT {key} FROM {staging_table});
+DROP TABLE {staging_table};
+""")
+
+# SUMMARY TABLES
+
+# Stored rows that are replaced by the staged rows of an incremental load, their stats are subtracted
+replaced_reviews_select = ("SELECT reviews.recipe_id, reviews.author_id, reviews.rating FROM reviews "
+                           "JOIN reviews_staging ON reviews.review_id = reviews_staging.review_id;")
+replaced_recipes_select = ("SELECT recipes.recipe_id, recipes.author_id FROM recipes "
+                           "JOIN recipes_staging ON recipes.recipe_id = recipes_staging.recipe_id;")
+
+# Assignments of upsert_staging_table that add the staged stats to the stored stats. Missing counts
+# of ingredients and keywords keep the stored ones.
+recipe_stats_accumulate = """review_count = recipe_stats.review_count + recipe_stats_staging.review_count,
+    rating_sum = recipe_stats.rating_sum + recipe_stats_staging.rating_sum,
+    last_review_date = CASE WHEN recipe_stats.last_review_date IS NULL
+                                 OR recipe_stats_staging.last_review_date > recipe_stats.last_review_date
+                            THEN recipe_stats_staging.last_review_date ELSE recipe_stats.last_review_date END,
+    ingredient_count = COALESCE(recipe_stats_staging.ingredient_count, recipe_stats.ingredient_count),
+    keyword_count = COALESCE(recipe_stats_staging.keyword_count, recipe_stats.keyword_count)"""
+
+author_stats_accumulate = """recipe_count = author_stats.recipe_count + author_stats_staging.recipe_count,
+    review_count = author_stats.review_count + author_stats_staging.review_count,
+    rating_sum = author_stats.rating_sum + author_stats_staging.rating_sum,
+    last_recipe_date = CASE WHEN author_stats.last_recipe_date IS NULL
+                                 OR author_stats_staging.last_recipe_date > author_stats.last_recipe_date
+                            THEN author_stats_staging.last_recipe_date ELSE author_stats.last_recipe_date END,
+    last_review_date = CASE WHEN author_stats.last_review_date IS NULL
+                                 OR author_stats_staging.last_review_date > author_stats.last_review_date
+                            THEN author_stats_staging.last_review_date ELSE author_stats.last_review_date END"""
+
+recipe_stats_totals_select = "SELECT SUM(review_count), SUM(rating_sum) FROM recipe_stats;"
+
+# Recompute the ratings from the accumulated sums, the prior of the Bayesian rating is the mean over all reviews
+recipe_stats_ratings_update = ("""
+UPDATE recipe_stats SET mean_rating = CASE WHEN review_count > 0 THEN rating_sum / review_count END,
+    bayesian_rating = ({prior_reviews} * {prior_mean} + rating_sum) / ({prior_reviews} + review_count);
+""")
+
+author_stats_ratings_update = ("""
+UPDATE author_stats SET mean_rating = CASE WHEN review_count > 0 THEN rating_sum / review_count END;
+""")
+
+# SEARCH INDEX
+
+search_recipes_select = "SELECT recipe_id, total_time FROM recipes;"
+search_ratings_select = "SELECT recipe_id, mean_rating FROM recipe_stats WHERE review_count > 0;"
+search_recipe_ingredients_select = "SELECT recipe_id, ingredient_id FROM recipe_ingredients;"
+search_recipe_keywords_select = "SELECT recipe_id, keyword_id FROM recipe_keywords;"
+search_recipe_categories_select = "SELECT recipe_id, category_id FROM recipes WHERE category_id IS NOT NULL;"
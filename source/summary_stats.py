@@ -0,0 +1,127 @@
+from threading import Lock
+
+import numpy as np
+import pandas as pd
+
+# Columns of the summary tables, see recipe_stats_table_insert and author_stats_table_insert
+RECIPE_STATS_COLUMNS = ['RecipeId', 'ReviewCount', 'RatingSum', 'MeanRating', 'BayesianRating', 'LastReviewDate',
+                        'IngredientCount', 'KeywordCount']
+AUTHOR_STATS_COLUMNS = ['AuthorId', 'RecipeCount', 'ReviewCount', 'RatingSum', 'MeanRating', 'LastRecipeDate',
+                        'LastReviewDate']
+# Columns that are summed up over the rows of an id, the others are counts of the current rows or dates
+# whose maximum is kept
+ADDITIVE_COLUMNS = ['RecipeCount', 'ReviewCount', 'RatingSum']
+COUNT_COLUMNS = ['IngredientCount', 'KeywordCount']
+DATE_COLUMNS = ['LastRecipeDate', 'LastReviewDate']
+
+
+def aggregate(data, key):
+    """Combine the stats of the same id
+
+    Args:
+        data (pd.DataFrame): Stats with the key column and any of the additive, count and date columns
+        key (str): Id column, e.g. RecipeId
+
+    Returns:
+        pd.DataFrame: One row per id. Columns without a value for an id stay missing.
+    """
+    groups = data.groupby(key, sort=False)
+    sums = [column for column in data.columns if column in ADDITIVE_COLUMNS + COUNT_COLUMNS]
+    dates = [column for column in data.columns if column in DATE_COLUMNS]
+    return pd.concat([groups[sums].sum(min_count=1), groups[dates].max()], axis=1).reset_index()
+
+
+def naive_dates(dates):
+    """ Get timestamps as naive UTC ones, so that the dates of tz-aware recipes and of naive reviews
+    and the missing dates of replaced rows can be combined """
+    if dates.dt.tz is not None:
+        dates = dates.dt.tz_convert(None)
+    return dates
+
+
+class SummaryStats():
+    """ Accumulate the recipe_stats and author_stats summary tables from the rows of the loaded tables,
+    so that rating queries do not need to aggregate the reviews. The stats of each loaded chunk are
+    aggregated right away and combined once when the tables are written. """
+
+    def __init__(self, prior_reviews=10):
+        """
+        Args:
+            prior_reviews (float): Weight of the mean rating over all reviews in the Bayesian rating of a recipe,
+                in number of reviews
+        """
+        self.prior_reviews = prior_reviews
+        self.recipes = []
+        self.authors = []
+        self.lock = Lock()
+
+    def add(self, table, data, sign=1):
+        """Add the stats of rows loaded into a table. Tables without stats are ignored.
+
+        Args:
+            table (str): Name of the table, e.g. reviews
+            data (pd.DataFrame): Rows of the table, see TABLE_INSERTS in etl
+            sign (int): -1 to subtract the stats of rows that are replaced, their dates are ignored
+        """
+        recipes, authors = None, None
+        if table == 'reviews':
+            dates = naive_dates(data['DateSubmitted']) if sign > 0 else pd.NaT
+            ratings = pd.DataFrame({'ReviewCount': sign, 'RatingSum': data['Rating'].to_numpy(dtype=np.float64) * sign,
+                                    'LastReviewDate': dates}, index=data.index)
+            recipes = aggregate(ratings.assign(RecipeId=data['RecipeId']), 'RecipeId')
+            authors = aggregate(ratings.assign(AuthorId=data['AuthorId']), 'AuthorId')
+        elif table == 'recipes':
+            dates = naive_dates(data['DatePublished']) if sign > 0 else pd.NaT
+            authors = aggregate(pd.DataFrame({'AuthorId': data['AuthorId'], 'RecipeCount': sign,
+                                              'LastRecipeDate': dates}).dropna(subset=['AuthorId']), 'AuthorId')
+            if sign > 0:
+                # Recipes without ingredients or keywords have none after this load
+                recipes = pd.DataFrame({'RecipeId': data['RecipeId'].to_numpy(), 'IngredientCount': 0, 'KeywordCount': 0})
+        elif table in ('recipe_ingredients', 'recipe_keywords'):
+            counts = data['RecipeId'].value_counts(sort=False)
+            column = 'IngredientCount' if table == 'recipe_ingredients' else 'KeywordCount'
+            recipes = pd.DataFrame({'RecipeId': counts.index.to_numpy(), column: counts.to_numpy()})
+        with self.lock:
+            if recipes is not None:
+                self.recipes.append(recipes)
+            if authors is not None:
+                self.authors.append(authors)
+
+    def combine(self, partial_stats, key, columns):
+        """ Aggregate the stats of all chunks into one row per id with the columns of the table """
+        stats = aggregate(pd.concat(partial_stats, ignore_index=True), key) if partial_stats else pd.DataFrame(columns=[key])
+        stats = stats.reindex(columns=columns)
+        for column in ADDITIVE_COLUMNS:
+            if column in columns:
+                stats[column] = stats[column].fillna(0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            stats['MeanRating'] = (stats['RatingSum'] / stats['ReviewCount']).where(stats['ReviewCount'] > 0)
+        return stats.astype({column: pd.Int64Dtype() for column in ADDITIVE_COLUMNS + COUNT_COLUMNS
+                             if column in columns and column != 'RatingSum'})
+
+    def prior_mean(self, review_count, rating_sum):
+        """ Get the mean rating used as prior of the Bayesian rating, 0 without reviews """
+        return rating_sum / review_count if review_count else 0.0
+
+    def recipe_stats(self):
+        """Get the recipe_stats table of the added rows
+
+        Returns:
+            pd.DataFrame: Review count, rating sum, mean and Bayesian rating, last review date and the number
+                of ingredients and keywords per recipe. The counts of ingredients and keywords are missing
+                for recipes whose ingredients or keywords were not loaded.
+        """
+        stats = self.combine(self.recipes, 'RecipeId', RECIPE_STATS_COLUMNS)
+        prior_mean = self.prior_mean(stats['ReviewCount'].sum(), stats['RatingSum'].sum())
+        stats['BayesianRating'] = ((self.prior_reviews * prior_mean + stats['RatingSum'])
+                                   / (self.prior_reviews + stats['ReviewCount']).astype(float))
+        return stats
+
+    def author_stats(self):
+        """Get the author_stats table of the added rows
+
+        Returns:
+            pd.DataFrame: Number of recipes and reviews, sum and mean of the given ratings and the dates
+                of the last recipe and review per author
+        """
+        return self.combine(self.authors, 'AuthorId', AUTHOR_STATS_COLUMNS)
@@ -0,0 +1,171 @@
+import configparser
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+
+import pandas as pd
+
+from backends import PostgresBackend, RedshiftBackend, SQLiteBackend, create_backend
+from create_tables import create_tables, drop_tables
+from etl import ETLProcess
+from loader import BatchInserter, CopyLoader, SQLiteInserter
+from sql_queries import *
+
+
+class FailingInserter(SQLiteInserter):
+    """ Inserter whose first batch fails once """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.failed = False
+
+    def insert_batch(self, cur, query, rows):
+        if not self.failed:
+            self.failed = True
+            raise sqlite3.OperationalError("connection lost")
+        return super().insert_batch(cur, query, rows)
+
+
+class BackendsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.config = configparser.ConfigParser()
+        self.config.read_dict({'DWH': {'DWH_DB_FILE': str(Path(self.tmp_dir.name) / 'dwh.sqlite')},
+                               'ETL': {'BACKEND': 'sqlite'}})
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_create_backend(self):
+        self.assertIsInstance(create_backend(self.config), SQLiteBackend)
+        self.config['ETL']['BACKEND'] = 'oracle'
+        with self.assertRaises(ValueError):
+            create_backend(self.config)
+
+    def etl(self, **options):
+        """ Create an ETL process with the options in the ETL section """
+        config_file = Path(self.tmp_dir.name) / 'dwh.cfg'
+        self.config.read_dict({'ETL': options, 'AWS': {'KEY': 'key', 'SECRET': 'secret', 'ARN': 'arn:role'}})
+        with open(config_file, 'w') as f:
+            self.config.write(f)
+        return ETLProcess(config_file, None, None)
+
+    def test_redshift_copy_needs_staging_bucket(self):
+        # Redshift has no COPY FROM STDIN
+        with self.assertRaises(ValueError):
+            self.etl(BACKEND='redshift', LOAD_MODE='copy', S3_STAGING_BUCKET='')
+        self.assertIsInstance(self.etl(BACKEND='redshift', LOAD_MODE='batch').loader, BatchInserter)
+        loader = self.etl(BACKEND='redshift', LOAD_MODE='copy', S3_STAGING_BUCKET='lets-cook-staging').loader
+        self.assertEqual(loader.s3_bucket, 'lets-cook-staging')
+        # Postgres streams the staging files without a bucket
+        self.config['DWH']['DWH_HOST'] = 'localhost'
+        loader = self.etl(BACKEND='postgres', S3_STAGING_BUCKET='').loader
+        self.assertIsInstance(loader, CopyLoader)
+        self.assertIsNone(loader.s3_client)
+
+    def test_failed_batch_keeps_staging_table(self):
+        etl = self.etl(BACKEND='sqlite', LOAD_MODE='batch', QUARANTINE_DIR=str(Path(self.tmp_dir.name) / 'quarantine'))
+        etl.loader = FailingInserter(batch_size=2, quarantine_dir=etl.loader.quarantine_dir)
+        conn, cur = etl.connect_to_db()
+        etl.drop_tables(cur, conn)
+        etl.create_tables(cur, conn)
+        etl.high_water_marks = {'recipes': pd.Timestamp('2020-01-01')}
+        # Postgres and Redshift create the staging table in the open transaction, the rollback of the failed
+        # batch must not drop it
+        cur.execute('BEGIN')
+        images = pd.DataFrame({'RecipeId': [1, 1, 2, 3, 3], 'Images': ['a', 'b', 'c', 'd', 'e']})
+        etl.upsert(conn, cur, recipe_images_table_insert, images, 'recipe_id', replace=True)
+        cur.execute("SELECT recipe_id, image_url FROM recipe_images ORDER BY recipe_id, image_url;")
+        self.assertEqual(cur.fetchall(), list(images.itertuples(index=False, name=None)))
+        self.assertFalse(etl.loader.quarantine_dir.exists())
+        etl.release_connection(conn)
+
+    def test_maintenance_of_changed_tables(self):
+        etl = self.etl(BACKEND='sqlite', MAINTENANCE='auto', VACUUM_THRESHOLD='10')
+        conn, cur = etl.connect_to_db()
+        etl.drop_tables(cur, conn)
+        etl.create_tables(cur, conn)
+        etl.load_table(conn, cur, 'recipe_images', pd.DataFrame({'RecipeId': [1], 'Images': ['a']}))
+        etl.load_table(conn, cur, 'recipe_keywords', pd.DataFrame({'RecipeId': [], 'KeywordId': []}))
+        queries = []
+        etl.backend.execute_outside_transaction = lambda conn, cur, query: queries.append(query)
+        # A full load analyzes the changed tables only
+        etl.maintain_tables(cur, conn)
+        self.assertEqual(queries, [analyze_table_query.format(table='recipe_images')])
+
+        # Incremental loads only vacuum the tables with enough unsorted or deleted rows
+        etl.changed_tables.update(['reviews', 'recipe_stats'])
+        etl.high_water_marks = {'reviews': pd.Timestamp('2020-01-01')}
+        etl.backend.vacuum_stats_query = "SELECT 'reviews', 25.0 UNION ALL SELECT 'recipe_images', 5.0;"
+        self.assertEqual(etl.tables_to_vacuum(cur, ['recipe_images', 'reviews', 'recipe_stats']), ['reviews'])
+        queries.clear()
+        etl.maintain_tables(cur, conn)
+        self.assertEqual(queries.count(vacuum_table_query.format(table='reviews')), 1)
+        self.assertEqual(len(queries), 4)
+        etl.maintenance = 'vacuum'
+        self.assertEqual(etl.tables_to_vacuum(cur, ['recipe_images', 'reviews']), ['recipe_images', 'reviews'])
+        etl.release_connection(conn)
+
+    def test_postgres_needs_host(self):
+        # Without DWH_HOST, the connection manager would set up a Redshift cluster
+        with self.assertRaises(ValueError):
+            PostgresBackend(self.config)
+        self.config.read_dict({'DWH': {'DWH_HOST': ''}, 'ETL': {'BACKEND': 'postgres'}})
+        with self.assertRaises(ValueError):
+            create_backend(self.config)
+        self.config['DWH']['DWH_HOST'] = 'localhost'
+        self.assertIsInstance(create_backend(self.config), PostgresBackend)
+
+    def test_postgres_ddl(self):
+        self.config['DWH']['DWH_HOST'] = 'localhost'
+        backend = PostgresBackend(self.config)
+        query = backend.translate(reviews_table_create + recipe_images_table_create)
+        self.assertIn('date_submitted timestamp', query)
+        self.assertIn('review text', query)
+        self.assertIn('recipe_image_id serial PRIMARY KEY', query)
+        self.assertEqual(backend.translate(foreign_key_query), foreign_key_query)
+        # The physical design of the tables is only kept for Redshift
+        for create_query in create_table_queries:
+            self.assertNotRegex(backend.translate(create_query), 'DISTSTYLE|DISTKEY|SORTKEY|ENCODE')
+        self.assertIn('DISTKEY(recipe_id)', RedshiftBackend(self.config).translate(reviews_table_create))
+
+    def test_sqlite_load_and_merge(self):
+        backend = SQLiteBackend(self.config)
+        conn, cur = backend.connect()
+        drop_tables(cur, conn, backend)
+        create_tables(cur, conn, backend)
+        self.assertEqual(backend.translate(foreign_key_query).strip(), '')
+
+        inserter = SQLiteInserter(batch_size=2, quarantine_dir=Path(self.tmp_dir.name) / 'quarantine')
+        watermarks = pd.DataFrame({'source': ['recipes', 'reviews'],
+                                   'high_water_mark': pd.to_datetime(['2020-01-01', None])})
+        self.assertEqual(inserter.load(conn, cur, etl_watermarks_table_insert, watermarks), 2)
+        images = pd.DataFrame({'RecipeId': [1, 1, 2], 'Images': ['a', 'b', 'c']})
+        inserter.load(conn, cur, recipe_images_table_insert, images)
+
+        # Replace the images of recipe 1 through a staging table, like an incremental load
+        backend.execute(cur, staging_table_create.format(staging_table='recipe_images_staging',
+                                                         columns='recipe_id, image_url', table='recipe_images'))
+        inserter.load(conn, cur, recipe_images_table_insert.replace('recipe_images', 'recipe_images_staging'),
+                      pd.DataFrame({'RecipeId': [1], 'Images': ['d']}))
+        backend.execute(cur, merge_staging_table.format(table='recipe_images', staging_table='recipe_images_staging',
+                                                        columns='recipe_id, image_url', key='recipe_id'))
+        conn.commit()
+
+        backend.execute(cur, table_exists_query.format(table='etl_watermarks'))
+        self.assertEqual(cur.fetchone()[0], 1)
+        backend.execute(cur, etl_watermarks_select)
+        self.assertEqual(sorted(cur.fetchall()), [('recipes', '2020-01-01 00:00:00'), ('reviews', None)])
+        cur.execute("SELECT recipe_id, image_url FROM recipe_images ORDER BY recipe_id, image_url;")
+        self.assertEqual(cur.fetchall(), [(1, 'd'), (2, 'c')])
+
+        backend.execute_outside_transaction(conn, cur, vacuum_table_query.format(table='recipe_images'))
+        backend.execute_outside_transaction(conn, cur, analyze_table_query.format(table='recipe_images'))
+        cur.execute("SELECT tbl FROM sqlite_stat1;")
+        self.assertIn(('recipe_images',), cur.fetchall())
+        backend.release(conn)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import configparser
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from change_detection import SOURCE_COLUMNS, ChangeDetector, row_hashes
+from data_parser import RECIPES_COLUMNS, DataParser
+from etl import ETLProcess
+
+
+class ChangeDetectionTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp_dir.name)
+        self.reviews = pd.DataFrame({
+            'ReviewId': [1, 2, 3], 'RecipeId': [10, 10, 11], 'AuthorId': [5, 6, 5], 'AuthorName': ['Ann', 'Bo', 'Ann'],
+            'Rating': [5, 3, 4], 'Review': ["It's good", None, 'Fine'],
+            'DateSubmitted': pd.to_datetime(['2020-01-01 10:00', '2020-02-01 10:00', '2020-03-01 10:00']),
+            'DateModified': pd.to_datetime(['2020-01-02 10:00', '2020-02-01 10:00', '2020-03-01 10:00'])})
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_hashes_do_not_depend_on_the_parse_mode(self):
+        recipes = pd.DataFrame({
+            'RecipeId': [38, 39], 'Name': ['Cake', 'Soup'], 'AuthorId': [1533, 20], 'AuthorName': ['Dancer', 'Hal'],
+            'TotalTime': ['PT1H45M', 'PT5M'], 'DatePublished': pd.to_datetime(['1999-08-09', '2000-01-01'], utc=True),
+            'Images': [np.array(['a.jpg'], dtype=object), None], 'RecipeCategory': ['Dessert', 'Soup'],
+            'RecipeIngredientParts': [np.array(['flour', 'sugar'], dtype=object), np.array(['water'], dtype=object)],
+            'RecipeInstructions': [np.array(['Mix.', 'Bake.'], dtype=object), np.array(['Boil.'], dtype=object)]})
+        recipes_file = self.path / 'recipes.parquet'
+        recipes.to_parquet(recipes_file, index=False)
+        hashes = [row_hashes(DataParser(compact=compact).prepare_recipes(recipes_file), SOURCE_COLUMNS['recipes'][1])
+                  for compact in [False, True]]
+        np.testing.assert_array_equal(hashes[0], hashes[1])
+        self.assertEqual(hashes[0].dtype, np.uint64)
+
+        # The values of a list are not hashed as one string
+        moved = recipes.assign(RecipeIngredientParts=[np.array(['flour'], dtype=object),
+                                                      np.array(['sugar', 'water'], dtype=object)])
+        moved.to_parquet(recipes_file, index=False)
+        changed = row_hashes(DataParser().prepare_recipes(recipes_file), SOURCE_COLUMNS['recipes'][1])
+        self.assertTrue((changed != hashes[0]).all())
+
+    def test_changed_rows(self):
+        detector = ChangeDetector(self.path / 'manifests')
+        pd.testing.assert_frame_equal(detector.select_changed_rows(self.reviews, 'reviews'), self.reviews)
+        self.assertEqual(list(detector.deleted_keys('reviews')), [])
+        detector.save()
+
+        # The next run sees an updated, a deleted and a new review in two chunks
+        reviews = pd.concat([self.reviews, self.reviews.iloc[[0]].assign(ReviewId=4)], ignore_index=True)
+        reviews.loc[1, 'Rating'] = 1
+        reviews = reviews.drop(index=2)
+        detector = ChangeDetector(self.path / 'manifests')
+        changed = pd.concat([detector.select_changed_rows(reviews.iloc[:2], 'reviews'),
+                             detector.select_changed_rows(reviews.iloc[2:], 'reviews')])
+        self.assertEqual(list(changed['ReviewId']), [2, 4])
+        self.assertEqual(list(detector.deleted_keys('reviews')), [3])
+        # Sources that were not read delete nothing
+        self.assertEqual(list(detector.deleted_keys('recipes')), [])
+        detector.save()
+
+        detector = ChangeDetector(self.path / 'manifests')
+        self.assertEqual(len(detector.select_changed_rows(reviews, 'reviews')), 0)
+        self.assertEqual(sorted(detector.manifest('reviews').index), [1, 2, 4])
+
+    def test_incremental_load_keeps_newest_author_names(self):
+        config = configparser.ConfigParser()
+        config.read_dict({'DWH': {'DWH_DB_FILE': str(self.path / 'dwh.sqlite')},
+                          'ETL': {'BACKEND': 'sqlite', 'INCREMENTAL': 'true',
+                                  'HASH_MANIFEST_DIR': str(self.path / 'manifests')}})
+        config_file = self.path / 'dwh.cfg'
+        with open(config_file, 'w') as f:
+            config.write(f)
+        recipes = pd.DataFrame({'RecipeId': [10, 11], 'Name': ['Cake', 'Soup'], 'AuthorId': [6, 6],
+                                'AuthorName': ['Bo', 'Bo'], 'CookTime': ['PT1H', 'PT5M'], 'PrepTime': ['PT5M', None],
+                                'TotalTime': ['PT1H5M', 'PT5M'],
+                                'DatePublished': pd.to_datetime(['2019-01-01', '2019-02-01'], utc=True)})
+        for column in ['Images', 'Keywords', 'RecipeIngredientQuantities', 'RecipeIngredientParts',
+                       'RecipeInstructions']:
+            recipes[column] = [np.array(['a'], dtype=object), np.array(['b'], dtype=object)]
+        recipes = recipes.reindex(columns=RECIPES_COLUMNS)
+        recipes_file = self.path / 'recipes.parquet'
+        recipes.to_parquet(recipes_file, index=False)
+        # Author 5 was renamed from Ann to Annie in review 3
+        reviews = self.reviews.assign(AuthorName=['Ann', 'Bo', 'Annie'])
+        reviews_file = self.path / 'reviews.csv'
+        reviews.to_csv(reviews_file, index=False, date_format='%Y-%m-%dT%H:%M:%SZ')
+        ETLProcess(config_file, recipes_file, reviews_file).run()
+
+        # Only her older review 1 changes, its name must not replace the newest one
+        reviews.loc[0, 'Rating'] = 1
+        reviews.to_csv(reviews_file, index=False, date_format='%Y-%m-%dT%H:%M:%SZ')
+        etl = ETLProcess(config_file, recipes_file, reviews_file)
+        etl.run()
+        conn, cur = etl.connect_to_db()
+        cur.execute("SELECT author_id, name FROM authors ORDER BY author_id;")
+        self.assertEqual(cur.fetchall(), [(5, 'Annie'), (6, 'Bo')])
+        cur.execute("SELECT rating FROM reviews WHERE review_id = 1;")
+        self.assertEqual(cur.fetchone()[0], 1)
+        etl.release_connection(conn)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import pandas as pd
+
+from checkpoints import RunCheckpoints, run_fingerprint
+
+
+class RunCheckpointsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp_dir.name)
+        self.input_file = self.path / 'reviews.csv'
+        self.input_file.write_text('ReviewId,Rating\n1,5\n')
+        self.fingerprint = run_fingerprint([self.input_file], incremental=True)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_resume(self):
+        checkpoints = RunCheckpoints(self.path / 'checkpoints')
+        self.assertFalse(checkpoints.start(self.fingerprint, resume=True))
+        replaced = pd.DataFrame({'RecipeId': [1, 2], 'AuthorId': [5, 6], 'Rating': [4, 3]})
+        checkpoints.complete('load reviews', rows=2, frame=replaced)
+        checkpoints.complete('read high-water marks', value={'reviews': '2020-01-01T00:00:00'})
+
+        # The run fails, the next one resumes it
+        checkpoints = RunCheckpoints(self.path / 'checkpoints')
+        self.assertTrue(checkpoints.start(self.fingerprint, resume=True))
+        self.assertTrue(checkpoints.done('load reviews'))
+        self.assertFalse(checkpoints.done('load recipes'))
+        self.assertEqual(checkpoints.stages['load reviews']['rows'], 2)
+        pd.testing.assert_frame_equal(checkpoints.frame('load reviews'), replaced)
+        self.assertIsNone(checkpoints.frame('read high-water marks'))
+        self.assertEqual(checkpoints.value('read high-water marks'), {'reviews': '2020-01-01T00:00:00'})
+
+        # A successful run discards the records
+        checkpoints.finish()
+        self.assertFalse(RunCheckpoints(self.path / 'checkpoints').start(self.fingerprint, resume=True))
+
+    def test_changed_inputs_are_not_resumed(self):
+        checkpoints = RunCheckpoints(self.path / 'checkpoints')
+        checkpoints.start(self.fingerprint)
+        checkpoints.complete('load reviews', rows=1)
+        # Without resume, a run starts from the first stage
+        self.assertFalse(RunCheckpoints(self.path / 'checkpoints').start(self.fingerprint))
+
+        checkpoints.start(self.fingerprint)
+        checkpoints.complete('load reviews', rows=1)
+        self.assertFalse(checkpoints.start(run_fingerprint([self.input_file], incremental=False), resume=True))
+        self.input_file.write_text('ReviewId,Rating\n1,4\n')
+        checkpoints = RunCheckpoints(self.path / 'checkpoints')
+        self.assertFalse(checkpoints.start(run_fingerprint([self.input_file], incremental=True), resume=True))
+        self.assertFalse(checkpoints.done('load reviews'))
+
+    def test_in_memory(self):
+        checkpoints = RunCheckpoints()
+        self.assertFalse(checkpoints.start(resume=True))
+        checkpoints.complete('load reviews', rows=1, frame=pd.DataFrame({'a': [1]}))
+        self.assertTrue(checkpoints.done('load reviews'))
+        self.assertIsNone(checkpoints.frame('load reviews'))
+
+
+if __name__ == "__main__":
+    unittest.main()
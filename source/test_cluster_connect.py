@@ -0,0 +1,78 @@
+import asyncio
+import configparser
+import tempfile
+import unittest
+from pathlib import Path
+
+from botocore.exceptions import ClientError
+
+from cluster_connect import ClusterConnector
+
+
+class StubRedshift():
+    """ Redshift client returning a given sequence of cluster states """
+
+    def __init__(self, states, address='lets-cook.example.com'):
+        self.states = list(states)
+        self.address = address
+        self.calls = 0
+
+    def describe_clusters(self, ClusterIdentifier):
+        self.calls += 1
+        if not self.states:
+            raise ClientError({'Error': {'Code': 'ClusterNotFound'}}, 'DescribeClusters')
+        state = self.states.pop(0) if len(self.states) > 1 else self.states[0]
+        return {'Clusters': [{'ClusterStatus': state, 'Endpoint': {'Address': self.address}}]}
+
+
+class ClusterConnectTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.config = configparser.ConfigParser()
+        self.config.read_dict({
+            'AWS': {'KEY': 'key', 'SECRET': 'secret'},
+            'DWH': {'DWH_CLUSTER_TYPE': 'multi-node', 'DWH_NUM_NODES': '4', 'DWH_NODE_TYPE': 'dc2.large',
+                    'DWH_CLUSTER_IDENTIFIER': 'lets-cook-cluster', 'DWH_DB': 'dwh', 'DWH_DB_USER': 'dwhuser',
+                    'DWH_DB_PASSWORD': 'Passw0rd', 'DWH_PORT': '5439', 'DWH_IAM_ROLE_NAME': 'redshift_user',
+                    'DWH_WAIT_TIMEOUT': '1',
+                    'DWH_ENDPOINT_CACHE': str(Path(self.tmp_dir.name) / 'endpoint.json')}})
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def connector(self, states):
+        connector = ClusterConnector(self.config)
+        connector.redshift = StubRedshift(states)
+        connector.roleArn = 'arn:aws:iam::123:role/redshift_user'
+        return connector
+
+    def test_wait_until_available(self):
+        connector = self.connector(['creating', 'creating', 'available'])
+        props = asyncio.run(connector.wait_until_available(timeout=1, initial_delay=0.01))
+        self.assertEqual(props['ClusterStatus'], 'available')
+        self.assertEqual(connector.redshift.calls, 3)
+
+    def test_wait_until_available_stops_at_deadline(self):
+        connector = self.connector(['creating'])
+        with self.assertRaises(TimeoutError):
+            asyncio.run(connector.wait_until_available(timeout=0.1, initial_delay=0.01))
+        self.assertFalse(connector.get_cluster_endpoint_arn(timeout=0.05))
+
+    def test_cached_endpoint_is_validated_with_one_probe(self):
+        connector = self.connector(['creating', 'available'])
+        self.assertFalse(connector.load_cached_endpoint())
+        self.assertTrue(connector.get_cluster_endpoint_arn())
+
+        connector = self.connector(['available'])
+        connector.roleArn = None
+        self.assertTrue(connector.load_cached_endpoint())
+        self.assertEqual(connector.redshift.calls, 1)
+        self.assertEqual(connector.DWH_ENDPOINT, 'lets-cook.example.com')
+        self.assertEqual(connector.DWH_ROLE_ARN, 'arn:aws:iam::123:role/redshift_user')
+
+        self.assertFalse(self.connector([]).load_cached_endpoint())
+        self.assertFalse(self.connector(['paused']).load_cached_endpoint())
+
+
+if __name__ == "__main__":
+    unittest.main()
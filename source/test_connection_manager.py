@@ -0,0 +1,43 @@
+import configparser
+import unittest
+from threading import Event
+
+from connection_manager import ConnectionManager
+
+
+class ConnectionManagerTest(unittest.TestCase):
+    def test_pool_has_a_connection_per_load_worker(self):
+        config = configparser.ConfigParser()
+        config.read_dict({'DWH': {'DWH_MAX_CONNECTIONS': '8'}, 'ETL': {'LOAD_WORKERS': '4'}})
+        self.assertEqual(ConnectionManager(config).max_connections(), 8)
+        # The workers and the connection of the ETL itself
+        config['ETL']['LOAD_WORKERS'] = '8'
+        self.assertEqual(ConnectionManager(config).max_connections(), 9)
+
+    def test_prepare_error_is_raised_by_connect(self):
+        waiting, failing = Event(), Event()
+        calls = []
+
+        class FailingManager(ConnectionManager):
+            def get_endpoint(self):
+                calls.append(1)
+                waiting.set()
+                failing.wait(timeout=5)
+                raise ConnectionRefusedError("Cluster lets-cook-cluster is not available.")
+
+        manager = FailingManager(configparser.ConfigParser())
+        manager.prepare()
+        waiting.wait(timeout=5)
+        # The pool lock is not held while the cluster is waited for
+        self.assertTrue(manager.lock.acquire(timeout=1))
+        manager.lock.release()
+        failing.set()
+        for _ in range(2):
+            with self.assertRaises(ConnectionRefusedError):
+                manager.connect()
+        # The cluster was only waited for once
+        self.assertEqual(len(calls), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import tempfile
+import unittest
+from io import BytesIO
+from pathlib import Path
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED
+
+import numpy as np
+import pandas as pd
+
+from data_parser import ARROW_STRING, DataParser, csv_partitions, parse_duration
+from input_files import open_csv_range
+
+
+class DataParserTest(unittest.TestCase):
+    def test_parse_duration(self):
+        durations = pd.Series(['PT1H30M', 'PT45M', 'PT2H', 'P1DT2H', 'PT90S', None, 'PT45M', 'invalid'])
+        minutes = parse_duration(durations)
+        self.assertEqual(list(minutes), [90.0, 45.0, 120.0, 1560.0, 1.5, 0.0, 45.0, 0.0])
+
+    def test_parse_duration_keeps_index(self):
+        durations = pd.Series([None, None], index=[5, 7])
+        minutes = parse_duration(durations)
+        self.assertEqual(list(minutes.index), [5, 7])
+        self.assertEqual(list(minutes), [0.0, 0.0])
+
+    def test_compact_recipes(self):
+        recipes = pd.DataFrame({
+            'RecipeId': [38, 39], 'Name': ["Low-Fat 'Berry' Cake", 'Soup'], 'AuthorId': [1533, 2000000000],
+            'AuthorName': ['Dancer ', 'Hal'], 'CookTime': ['PT1H', None], 'PrepTime': ['PT45M', 'PT5M'],
+            'TotalTime': ['PT1H45M', 'PT5M'], 'DatePublished': pd.to_datetime(['1999-08-09', '2000-01-01'], utc=True),
+            'Description': ['Best cake', None], 'Images': [np.array(['a.jpg'], dtype=object), None],
+            'RecipeCategory': ['Dessert', 'Dessert'], 'Keywords': [np.array(['Easy'], dtype=object), None],
+            'RecipeIngredientQuantities': [np.array(['1', '2'], dtype=object), np.array(['3'], dtype=object)],
+            'RecipeIngredientParts': [np.array(['Flour', 'sugar'], dtype=object), np.array(['water'], dtype=object)],
+            'AggregatedRating': [4.5, None], 'RecipeServings': [8.0, None], 'RecipeYield': [None, '1 pot'],
+            'RecipeInstructions': [np.array(['Mix.', 'Bake.'], dtype=object), np.array(['Boil.'], dtype=object)]})
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            recipes_file = Path(tmp_dir) / 'recipes.parquet'
+            recipes.to_parquet(recipes_file, index=False)
+            default = DataParser().prepare_recipes(recipes_file)
+            compact = DataParser(compact=True).prepare_recipes(recipes_file)
+
+        self.assertNotIn('AggregatedRating', compact)
+        self.assertEqual(compact['RecipeCategory'].dtype, 'category')
+        self.assertEqual(compact['Name'].dtype, ARROW_STRING)
+        self.assertEqual(compact['RecipeId'].dtype, np.int8)
+        self.assertEqual(compact['AuthorId'].dtype, np.int32)
+        self.assertEqual(list(compact['RecipeInstructions']), ['Mix. Bake.', 'Boil.'])
+        self.assertEqual(list(compact['RecipeIngredientParts'].explode()), ['Flour', 'sugar', 'water'])
+        self.assertEqual(list(default['RecipeIngredientParts'].explode()), ['Flour', 'sugar', 'water'])
+        self.assertEqual(list(default['Name']), list(compact['Name']))
+        self.assertEqual(list(default['TotalTime']), list(compact['TotalTime']))
+
+    def test_parallel_parsing(self):
+        reviews = pd.DataFrame({'ReviewId': range(40), 'RecipeId': 7, 'AuthorId': range(100, 140),
+                                'AuthorName': [f'Author {i} ' for i in range(40)], 'Rating': 5,
+                                'Review': ['Line one\nline "two"' if i % 3 else None for i in range(40)],
+                                'DateSubmitted': '2020-01-01T10:00:00Z', 'DateModified': '2020-01-02T10:00:00Z'})
+        recipes = pd.DataFrame({'RecipeId': range(40), 'Name': 'Cake', 'AuthorId': 1, 'AuthorName': 'Ann',
+                                'TotalTime': ['PT1H', 'PT5M'] * 20, 'DatePublished': pd.Timestamp('2000-01-01', tz='UTC'),
+                                'RecipeCategory': [f'Category {i % 15}' for i in range(40)],
+                                'RecipeIngredientParts': [np.array(['flour'], dtype=object)] * 40,
+                                'RecipeInstructions': [np.array(['Mix.', 'Bake.'], dtype=object)] * 40})
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            reviews_file = Path(tmp_dir) / 'reviews.csv'
+            reviews.to_csv(reviews_file, index=False)
+            # Quoted newlines do not end a record
+            header, ranges = csv_partitions(reviews_file, 4)
+            self.assertEqual(len(ranges), 4)
+            with open(reviews_file, 'rb') as f:
+                content = f.read()
+            self.assertEqual(sum(len(pd.read_csv(BytesIO(header + content[start:end]))) for start, end in ranges), 40)
+
+            recipes_file = Path(tmp_dir) / 'recipes.parquet'
+            recipes.to_parquet(recipes_file, index=False, row_group_size=10)
+            for compact in [False, True]:
+                serial = DataParser(compact=compact)
+                parallel = DataParser(compact=compact, workers=3)
+                pd.testing.assert_frame_equal(parallel.prepare_reviews(reviews_file), serial.prepare_reviews(reviews_file))
+                pd.testing.assert_frame_equal(parallel.prepare_recipes(recipes_file), serial.prepare_recipes(recipes_file))
+
+    def test_parallel_parsing_of_zipped_reviews(self):
+        reviews = pd.DataFrame({'ReviewId': range(40), 'RecipeId': 7, 'AuthorId': range(100, 140),
+                                'AuthorName': [f'Author {i}' for i in range(40)], 'Rating': 4,
+                                'Review': ['Line one\nline "two"' if i % 3 else None for i in range(40)],
+                                'DateSubmitted': '2020-01-01T10:00:00Z', 'DateModified': '2020-01-02T10:00:00Z'})
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            reviews_file = Path(tmp_dir) / 'reviews.csv'
+            reviews.to_csv(reviews_file, index=False)
+            expected = DataParser().prepare_reviews(reviews_file)
+            for compression in [ZIP_STORED, ZIP_DEFLATED]:
+                zip_file = Path(tmp_dir) / f'reviews_{compression}.csv.zip'
+                with ZipFile(zip_file, 'w', compression=compression) as zip:
+                    zip.write(reviews_file, 'reviews.csv')
+                # Stored members are split in place, compressed ones are extracted into a temporary directory
+                with open_csv_range(zip_file) as (path, csv_start, csv_end):
+                    self.assertEqual(path == zip_file, compression == ZIP_STORED)
+                    header, ranges = csv_partitions(path, 4, csv_start, csv_end)
+                    self.assertEqual(len(ranges), 4)
+                    self.assertEqual((ranges[0][0], ranges[-1][1]), (csv_start + len(header), csv_end))
+                pd.testing.assert_frame_equal(DataParser(workers=3).prepare_reviews(zip_file), expected)
+            self.assertEqual(sorted(p.name for p in Path(tmp_dir).iterdir()),
+                             sorted(['reviews.csv', f'reviews_{ZIP_DEFLATED}.csv.zip', f'reviews_{ZIP_STORED}.csv.zip']))
+
+
+if __name__ == "__main__":
+    unittest.main()
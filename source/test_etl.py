@@ -28,6 +28,7 @@ class ETLTest(unittest.TestCase):
         cur.execute("SELECT * FROM reviews;")
         reviews = cur.fetchall()
         self.assertEqual(len(reviews), etl.reviews.shape[0])
+        etl.release_connection(conn)
 
 if __name__ == "__main__": 
     unittest.main()
\ No newline at end of file
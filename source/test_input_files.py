@@ -0,0 +1,62 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED
+
+import pandas as pd
+
+from input_files import open_input
+
+
+class InputFilesTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp_dir.name)
+        self.data = pd.DataFrame({'RecipeId': [1, 2, 3], 'Name': ['a', 'b', 'c']})
+        self.data.to_parquet(self.path / 'recipes.parquet', index=False)
+        self.data.to_csv(self.path / 'reviews.csv', index=False)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def zip(self, filename, compression):
+        zip_file = self.path / f'{filename}.zip'
+        with ZipFile(zip_file, 'w', compression=compression) as zip:
+            zip.write(self.path / filename, filename)
+        (self.path / filename).unlink()
+        return zip_file
+
+    def test_stored_members_are_memory_mapped(self):
+        with open_input(self.zip('recipes.parquet', ZIP_STORED)) as f:
+            pd.testing.assert_frame_equal(pd.read_parquet(f), self.data)
+        with open_input(self.zip('reviews.csv', ZIP_STORED)) as f:
+            pd.testing.assert_frame_equal(pd.read_csv(f), self.data)
+        self.assertEqual(sorted(p.name for p in self.path.iterdir()), ['recipes.parquet.zip', 'reviews.csv.zip'])
+
+    @unittest.skipUnless(Path('/proc/self/fd').is_dir(), "needs the open files of the process in /proc")
+    def test_memory_mapped_member_is_closed(self):
+        zip_file = self.zip('reviews.csv', ZIP_STORED)
+        open_files = len(os.listdir('/proc/self/fd'))
+        for _ in range(3):
+            with open_input(zip_file) as f:
+                pd.read_csv(f)
+        self.assertEqual(len(os.listdir('/proc/self/fd')), open_files)
+
+    def test_compressed_csv_is_streamed(self):
+        with open_input(self.zip('reviews.csv', ZIP_DEFLATED)) as f:
+            pd.testing.assert_frame_equal(pd.read_csv(f), self.data)
+        self.assertFalse((self.path / 'reviews.csv').exists())
+
+    def test_compressed_parquet_is_extracted_once(self):
+        zip_file = self.zip('recipes.parquet', ZIP_DEFLATED)
+        with open_input(zip_file) as f:
+            pd.testing.assert_frame_equal(pd.read_parquet(f), self.data)
+        mtime = (self.path / 'recipes.parquet').stat().st_mtime_ns
+        with open_input(zip_file) as f:
+            pd.testing.assert_frame_equal(pd.read_parquet(f), self.data)
+        self.assertEqual((self.path / 'recipes.parquet').stat().st_mtime_ns, mtime)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from instrumentation import Instrumentation
+
+
+class InstrumentationTest(unittest.TestCase):
+    def test_stage_records(self):
+        instrumentation = Instrumentation()
+        with instrumentation.stage('load reviews', rows_in=10) as record:
+            record['rows_out'] = 9
+        record = instrumentation.records[0]
+        self.assertEqual((record['stage'], record['rows_in'], record['rows_out']), ('load reviews', 10, 9))
+        self.assertGreaterEqual(record['wall_seconds'], 0)
+        self.assertGreaterEqual(record['cpu_seconds'], 0)
+
+    def test_iterate_measures_each_item(self):
+        instrumentation = Instrumentation()
+        chunks = list(instrumentation.iterate('prepare reviews', iter([[1, 2], [3]])))
+        self.assertEqual(chunks, [[1, 2], [3]])
+        self.assertEqual([record['rows_out'] for record in instrumentation.records], [2, 1])
+        self.assertEqual(instrumentation.summary()['prepare reviews']['runs'], 2)
+
+    def test_write_metrics_and_profiles(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            instrumentation = Instrumentation(metrics_file=Path(tmp_dir) / 'etl.prom',
+                                              profile_dir=Path(tmp_dir) / 'profiles', trace_memory=True)
+            for _ in range(2):
+                with instrumentation.stage('load recipes', rows_in=5) as record:
+                    record['bytes_sent'] = 100
+            instrumentation.write_metrics()
+            metrics = (Path(tmp_dir) / 'etl.prom').read_text().splitlines()
+            self.assertIn('etl_stage_runs_total{stage="load recipes"} 2', metrics)
+            self.assertIn('etl_stage_bytes_sent_total{stage="load recipes"} 200', metrics)
+            self.assertIn('# TYPE etl_stage_rows_in_total counter', metrics)
+            self.assertEqual(len(list((Path(tmp_dir) / 'profiles').glob('load_recipes_*.prof'))), 2)
+            self.assertIn('traced_peak_bytes', instrumentation.records[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import configparser
+import tempfile
+import unittest
+from pathlib import Path
+
+import pandas as pd
+
+from etl import ETLProcess
+from key_dictionary import KeyDictionary
+from sql_queries import keywords_table_insert
+
+
+class KeyDictionaryTest(unittest.TestCase):
+    def test_update_assigns_ids_to_new_values(self):
+        keywords = KeyDictionary('KeywordId', 'Keywords')
+        new = keywords.update(pd.Series(['Easy', 'Vegan', None, 'Easy']))
+        self.assertEqual(list(new['KeywordId']), [0, 1])
+        new = keywords.update(pd.Series(['Vegan', 'Healthy']))
+        self.assertEqual(list(new['Keywords']), ['Healthy'])
+        self.assertEqual(list(new['KeywordId']), [2])
+
+    def test_lookup(self):
+        keywords = KeyDictionary('KeywordId', 'Keywords')
+        self.assertTrue(keywords.lookup(pd.Series(['Easy'])).isna().all())
+        keywords.add(pd.DataFrame({'KeywordId': [7, 3], 'Keywords': ['Easy', 'Vegan']}))
+        ids = keywords.lookup(pd.Series(['Vegan', None, 'Unknown', 'Easy'], index=[4, 5, 6, 7]))
+        self.assertEqual(ids.tolist(), [3, pd.NA, pd.NA, 7])
+        self.assertEqual(list(ids.index), [4, 5, 6, 7])
+        self.assertEqual(keywords.next_id(), 8)
+
+    def test_ids_are_kept_across_save_and_load(self):
+        keywords = KeyDictionary('KeywordId', 'Keywords')
+        keywords.update(pd.Series(['Easy', 'Vegan']))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / 'keywords.parquet'
+            keywords.save(path)
+            loaded = KeyDictionary.load(path, 'KeywordId', 'Keywords')
+        new = loaded.update(pd.Series(['Healthy', 'Easy']))
+        self.assertEqual(new.values.tolist(), [[2, 'Healthy']])
+        self.assertEqual(loaded.lookup(pd.Series(['Easy', 'Vegan'])).tolist(), [0, 1])
+
+    def test_matches(self):
+        keywords = KeyDictionary('KeywordId', 'Keywords')
+        keywords.update(pd.Series(['Easy', 'Vegan']))
+        self.assertTrue(keywords.matches(pd.DataFrame({'KeywordId': [1, 0], 'Keywords': ['Vegan', 'Easy']})))
+        self.assertFalse(keywords.matches(pd.DataFrame({'KeywordId': [0, 1], 'Keywords': ['Vegan', 'Easy']})))
+        self.assertFalse(keywords.matches(pd.DataFrame({'KeywordId': [0, 1], 'Keywords': ['Easy', 'Healthy']})))
+        self.assertFalse(keywords.matches(pd.DataFrame({'KeywordId': [0], 'Keywords': ['Easy']})))
+
+    def test_stale_key_store_is_replaced_by_the_table(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            config = configparser.ConfigParser()
+            config.read_dict({'DWH': {'DWH_DB_FILE': str(Path(tmp_dir) / 'dwh.sqlite')},
+                              'ETL': {'BACKEND': 'sqlite', 'KEY_STORE_DIR': str(Path(tmp_dir) / 'keys')}})
+            config_file = Path(tmp_dir) / 'dwh.cfg'
+            with open(config_file, 'w') as f:
+                config.write(f)
+            etl = ETLProcess(config_file, None, None)
+            conn, cur = etl.connect_to_db()
+            etl.drop_tables(cur, conn)
+            etl.create_tables(cur, conn)
+            keywords = pd.DataFrame({'KeywordId': [0, 1], 'Keywords': ['Easy', 'Vegan']})
+            etl.execute_query(conn, cur, keywords_table_insert, keywords)
+            # The store was saved before the tables were reloaded with other ids
+            etl.load_key_dictionaries()
+            etl.keywords.update(pd.Series(['Vegan', 'Easy', 'Healthy']))
+            etl.save_key_dictionaries()
+
+            etl.load_key_dictionaries()
+            etl.load_dimensions(cur)
+            self.assertEqual(etl.keywords.lookup(pd.Series(['Easy', 'Vegan', 'Healthy'])).tolist(), [0, 1, pd.NA])
+            self.assertEqual(etl.keywords.next_id(), 2)
+            etl.release_connection(conn)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,174 @@
+import gzip
+import tempfile
+import unittest
+from pathlib import Path
+
+import pandas as pd
+
+from loader import BatchInserter, CopyLoader, LoadError, parse_insert_query
+from sql_queries import reviews_table_insert
+
+
+class FakeConnection():
+    def __init__(self):
+        self.commits = 0
+        self.rollbacks = 0
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+class FakeCursor():
+    """ Cursor that counts the csv lines sent with COPY as rows of the table, dropping the given number of them """
+
+    def __init__(self, rows=0, dropped_rows=0, s3_client=None):
+        self.rows = rows
+        self.dropped_rows = dropped_rows
+        self.s3_client = s3_client
+        self.queries = []
+
+    def execute(self, query):
+        self.queries.append(query)
+        if 'COPY' in query:
+            for staging_file in self.s3_client.objects.values():
+                self.rows += len(gzip.decompress(staging_file).splitlines()) - self.dropped_rows
+
+    def fetchone(self):
+        return (self.rows,)
+
+    def copy_expert(self, query, f):
+        self.queries.append(query)
+        self.rows += len(f.read().splitlines()) - self.dropped_rows
+
+
+class FakeS3Client():
+    def __init__(self):
+        self.objects = {}
+        self.uploaded = []
+
+    def upload_file(self, filename, bucket, key):
+        self.objects[key] = Path(filename).read_bytes()
+        self.uploaded.append(key)
+
+    def delete_object(self, Bucket, Key):
+        del self.objects[Key]
+
+
+class FailingInserter(BatchInserter):
+    """ Batch inserter that fails for every batch containing a given review id """
+
+    def __init__(self, bad_id, **kwargs):
+        super().__init__(**kwargs)
+        self.bad_id = bad_id
+        self.inserted = []
+
+    def insert_batch(self, cur, query, rows):
+        if any(row[0] == self.bad_id for row in rows):
+            raise ValueError("bad row")
+        self.inserted.extend(rows)
+        return len(rows)
+
+
+class LoaderTest(unittest.TestCase):
+    def setUp(self):
+        self.data = pd.DataFrame({'ReviewId': range(10), 'Review': ['ok'] * 9 + [None]})
+
+    def test_parse_insert_query(self):
+        table, columns = parse_insert_query(reviews_table_insert)
+        self.assertEqual(table, 'reviews')
+        self.assertEqual(columns[0], 'review_id')
+        self.assertEqual(len(columns), 7)
+
+    def test_staging_file(self):
+        data = pd.DataFrame({'ReviewId': pd.array([1, None], dtype=pd.Int64Dtype()), 'Rating': [4.5, None],
+                             'Review': ['Say "hi", then go', ''], 'Category': pd.Categorical(['a', 'b']),
+                             'DateSubmitted': pd.to_datetime(['2020-01-02 03:04:05', None]),
+                             'DatePublished': pd.to_datetime(['2020-01-02 03:04:05.5', '1999-12-31 00:00:00.0'], utc=True)})
+        with tempfile.TemporaryDirectory() as staging_dir:
+            _, staging_files = CopyLoader(staging_dir).write_staging_files('reviews', data)
+            with gzip.open(staging_files[0], 'rt', encoding='utf-8') as f:
+                lines = f.read().splitlines()
+        self.assertEqual(len(staging_files), 1)
+        # Empty strings are NULL like missing values, timestamps have whole seconds and no time zone
+        self.assertEqual(lines, ['1,4.5,"Say ""hi"", then go","a",2020-01-02 03:04:05,2020-01-02 03:04:05',
+                                 ',,,"b",,1999-12-31 00:00:00'])
+
+    def test_staging_files_are_split(self):
+        with tempfile.TemporaryDirectory() as staging_dir:
+            loader = CopyLoader(staging_dir, staging_files=4, min_file_rows=3)
+            staging_path, staging_files = loader.write_staging_files('reviews', self.data)
+            self.assertEqual(sorted(staging_path.iterdir()), staging_files)
+            lines = []
+            for staging_file in staging_files:
+                with gzip.open(staging_file, 'rt', encoding='utf-8') as f:
+                    lines.append(f.read().splitlines())
+        # 10 rows give 3 files of at least 3 rows, in the order of the rows
+        self.assertEqual([len(file_lines) for file_lines in lines], [4, 4, 2])
+        self.assertEqual(lines[0][0], '0,"ok"')
+        self.assertEqual(lines[2][-1], '9,')
+
+    def test_copy_verifies_row_count(self):
+        with tempfile.TemporaryDirectory() as staging_dir:
+            loader = CopyLoader(staging_dir, min_file_rows=4)
+            conn, cur = FakeConnection(), FakeCursor(rows=5)
+            stats = {}
+            self.assertEqual(loader.load(conn, cur, reviews_table_insert, self.data, stats), 10)
+            self.assertEqual(cur.rows, 15)
+            # One COPY per staging file
+            self.assertEqual(sum('COPY reviews (review_id' in query for query in cur.queries), 2)
+            self.assertGreater(stats['bytes_sent'], 0)
+            self.assertEqual(conn.commits, 1)
+
+            # Rows that did not arrive in the table roll back the load
+            conn, cur = FakeConnection(), FakeCursor(dropped_rows=1)
+            with self.assertRaises(LoadError):
+                loader.load(conn, cur, reviews_table_insert, self.data)
+            self.assertEqual((conn.commits, conn.rollbacks), (0, 1))
+            # The staging files are deleted in both cases
+            self.assertEqual(list(Path(staging_dir).iterdir()), [])
+
+    def test_copy_from_s3(self):
+        with tempfile.TemporaryDirectory() as staging_dir:
+            s3_client = FakeS3Client()
+            loader = CopyLoader(staging_dir, s3_client=s3_client, s3_bucket='bucket', iam_role='arn:role',
+                                min_file_rows=4)
+            cur = FakeCursor(s3_client=s3_client)
+            stats = {}
+            self.assertEqual(loader.load(FakeConnection(), cur, reviews_table_insert, self.data, stats), 10)
+            # One COPY loads both staging files under their prefix
+            self.assertEqual(len(s3_client.uploaded), 2)
+            self.assertRegex(cur.queries[1], r"FROM 's3://bucket/staging/reviews_\w+/'")
+            self.assertIn("IAM_ROLE 'arn:role'", cur.queries[1])
+            # The uploaded files are deleted from the bucket
+            self.assertEqual(s3_client.objects, {})
+            self.assertLess(stats['bytes_sent'], 200)
+
+    def test_batches_convert_missing_values(self):
+        batches = list(BatchInserter(batch_size=4).iter_batches(self.data))
+        self.assertEqual([len(rows) for _, rows in batches], [4, 4, 2])
+        self.assertIsNone(batches[-1][1][-1][1])
+        self.assertIs(type(batches[0][1][0][0]), int)
+
+    def test_failed_batch_is_quarantined(self):
+        with tempfile.TemporaryDirectory() as quarantine_dir:
+            inserter = FailingInserter(5, batch_size=4, retries=1, quarantine_dir=quarantine_dir)
+            conn = FakeConnection()
+            stats = {}
+            rows = inserter.load(conn, None, reviews_table_insert, self.data, stats)
+            self.assertEqual(rows, 6)
+            self.assertEqual(stats['bytes_sent'], 6)
+            self.assertEqual(conn.rollbacks, 2)
+            quarantined = pd.concat(pd.read_csv(f) for f in inserter.quarantine_dir.iterdir())
+            self.assertEqual(list(quarantined['ReviewId']), [4, 5, 6, 7])
+
+    def test_failed_batch_rolls_back_table(self):
+        inserter = FailingInserter(5, batch_size=4, commit_per_batch=False)
+        with self.assertRaises(LoadError):
+            inserter.load(FakeConnection(), None, reviews_table_insert, self.data)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+import pandas as pd
+
+from data_parser import DataParser
+from parse_cache import ParseCache
+
+
+class ParseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp_dir.name)
+        self.reviews_file = self.path / 'reviews.csv'
+        pd.DataFrame({'ReviewId': [1, 2], 'RecipeId': [10, 10], 'AuthorId': [5, 6], 'AuthorName': ['Ann ', 'Bo'],
+                      'Rating': [5, 3], 'Review': ["It's good", None],
+                      'DateSubmitted': ['2020-01-01T10:00:00Z', '2020-02-01T10:00:00Z'],
+                      'DateModified': ['2020-01-02T10:00:00Z', '2020-02-01T10:00:00Z']}).to_csv(self.reviews_file, index=False)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_prepared_data_is_cached(self):
+        cache = ParseCache(self.path / 'cache')
+        for compact in [False, True]:
+            expected = DataParser(compact=compact).prepare_reviews(self.reviews_file)
+            parser = DataParser(compact=compact, cache=cache)
+            pd.testing.assert_frame_equal(parser.prepare_reviews(self.reviews_file), expected)
+            parser.parse_reviews = None
+            pd.testing.assert_frame_equal(parser.prepare_reviews(self.reviews_file), expected)
+        self.assertEqual(len(list(cache.cache_dir.iterdir())), 2)
+
+    def test_key(self):
+        cache = ParseCache(self.path / 'cache')
+        key = cache.key(self.reviews_file, 'reviews', 1)
+        self.assertEqual(cache.key(self.reviews_file, 'reviews', 1), key)
+        self.assertNotEqual(cache.key(self.reviews_file, 'reviews', 2), key)
+        with open(self.reviews_file, 'a') as f:
+            f.write('3,10,7,Cy,4,,2020-03-01T10:00:00Z,2020-03-01T10:00:00Z\n')
+        self.assertNotEqual(cache.key(self.reviews_file, 'reviews', 1), key)
+
+    def test_least_recently_used_are_evicted(self):
+        data = pd.DataFrame({'a': range(1000)})
+        cache = ParseCache(self.path / 'cache')
+        for key in ['a', 'b', 'c']:
+            cache.put(key, data)
+        size = cache.path('a').stat().st_size
+        os.utime(cache.path('a'), ns=(1, 1))
+        os.utime(cache.path('b'), ns=(3, 3))
+        os.utime(cache.path('c'), ns=(2, 2))
+        # Reading a frame makes it the most recently used one
+        cache.get('a')
+        cache.max_bytes = 2 * size
+        cache.put('d', data)
+        self.assertEqual(sorted(path.stem for path in cache.cache_dir.iterdir()), ['a', 'd'])
+        self.assertIsNone(cache.get('c'))
+
+
+if __name__ == "__main__":
+    unittest.main()
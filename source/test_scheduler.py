@@ -0,0 +1,60 @@
+import threading
+import time
+import unittest
+
+from scheduler import TableScheduler, table_dependencies
+from sql_queries import foreign_key_query
+
+
+class FakeConnection():
+    def close(self):
+        pass
+
+
+def connect():
+    return FakeConnection(), None
+
+
+def double(values):
+    return [value * 2 for value in values]
+
+
+class SchedulerTest(unittest.TestCase):
+    def test_table_dependencies(self):
+        dependencies = table_dependencies(foreign_key_query)
+        self.assertEqual(dependencies['recipes'], {'categories', 'authors'})
+        self.assertEqual(dependencies['reviews'], {'recipes', 'authors'})
+        self.assertNotIn('authors', dependencies)
+
+    def test_referenced_tables_are_loaded_first(self):
+        dependencies = table_dependencies(foreign_key_query)
+        loaded = []
+        lock = threading.Lock()
+
+        def load(conn, cur, table, data):
+            # Loading the small dimensions slowly must not let the tables referencing them overtake
+            if table in ('authors', 'categories'):
+                time.sleep(0.05)
+            with lock:
+                loaded.append((table, data))
+
+        tasks = {'reviews': (double, ([1],)), 'recipes': [2], 'authors': (double, ([3],)), 'categories': [4]}
+        with TableScheduler(dependencies, connect, transform_workers=2, load_workers=3) as scheduler:
+            scheduler.run(tasks, load)
+        order = [table for table, _ in loaded]
+        self.assertLess(order.index('authors'), order.index('recipes'))
+        self.assertLess(order.index('categories'), order.index('recipes'))
+        self.assertLess(order.index('recipes'), order.index('reviews'))
+        self.assertEqual(dict(loaded), {'reviews': [2], 'recipes': [2], 'authors': [6], 'categories': [4]})
+
+    def test_load_errors_are_raised(self):
+        def load(conn, cur, table, data):
+            raise ValueError(table)
+
+        with TableScheduler({}, connect) as scheduler:
+            with self.assertRaises(ValueError):
+                scheduler.run({'authors': [1]}, load)
+
+
+if __name__ == "__main__":
+    unittest.main()
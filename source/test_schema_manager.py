@@ -0,0 +1,68 @@
+import configparser
+import tempfile
+import unittest
+from pathlib import Path
+
+from backends import SQLiteBackend
+from schema_manager import SchemaManager, split_top_level, table_definitions
+from sql_queries import *
+
+
+class SchemaManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        config = configparser.ConfigParser()
+        config.read_dict({'DWH': {'DWH_DB_FILE': str(Path(self.tmp_dir.name) / 'dwh.sqlite')}})
+        self.backend = SQLiteBackend(config)
+        self.conn, self.cur = self.backend.connect()
+        self.schema = SchemaManager(self.backend)
+
+    def tearDown(self):
+        self.backend.release(self.conn)
+        self.tmp_dir.cleanup()
+
+    def test_table_definitions(self):
+        self.assertEqual(split_top_level("a numeric(10,2), b int"), ['a numeric(10,2)', 'b int'])
+        definitions = table_definitions(create_table_queries)
+        self.assertEqual(list(definitions['reviews'])[:3], ['review_id', 'author_id', 'recipe_id'])
+        self.assertTrue(definitions['reviews']['review_id'].startswith('review_id int PRIMARY KEY'))
+
+    def test_migrate(self):
+        self.schema.migrate(self.cur, self.conn)
+        self.assertEqual(set(self.backend.table_columns(self.cur)), set(self.schema.definitions))
+        self.assertEqual(self.schema.migration_queries(self.cur), [])
+
+        # Loaded rows are kept when a missing column is added
+        self.cur.execute("DROP TABLE reviews;")
+        self.cur.execute("CREATE TABLE reviews (review_id int PRIMARY KEY, rating int);")
+        self.cur.execute("INSERT INTO reviews VALUES (1, 5);")
+        self.conn.commit()
+        queries = self.schema.migration_queries(self.cur)
+        self.assertIn("ALTER TABLE reviews ADD COLUMN author_id int;", queries)
+        self.schema.migrate(self.cur, self.conn)
+        self.cur.execute("SELECT review_id, rating, author_id FROM reviews;")
+        self.assertEqual(self.cur.fetchall(), [(1, 5, None)])
+        self.assertEqual(self.backend.table_columns(self.cur)['reviews'], ['review_id', 'rating'] + [
+            column for column in self.schema.definitions['reviews'] if column not in ('review_id', 'rating')])
+
+    def test_swap_shadow_tables(self):
+        self.schema.migrate(self.cur, self.conn)
+        self.backend.execute(self.cur, "INSERT INTO categories (category_id, category_name) VALUES (1, 'old');")
+        self.conn.commit()
+
+        self.schema.create_shadow_tables(self.cur, self.conn)
+        self.backend.execute(self.cur, self.schema.shadow_query(
+            "INSERT INTO categories (category_id, category_name) VALUES (2, 'new');"))
+        self.conn.commit()
+        # The live table is unchanged until the swap
+        self.cur.execute("SELECT category_name FROM categories;")
+        self.assertEqual(self.cur.fetchall(), [('old',)])
+
+        self.schema.swap_shadow_tables(self.cur, self.conn)
+        self.cur.execute("SELECT category_name FROM categories;")
+        self.assertEqual(self.cur.fetchall(), [('new',)])
+        self.assertEqual(set(self.backend.table_columns(self.cur)), set(self.schema.definitions))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import configparser
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from backends import SQLiteBackend
+from create_tables import create_tables, drop_tables
+from loader import SQLiteInserter
+from search_index import SearchIndex
+from sql_queries import *
+
+
+class SearchIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.recipes = pd.DataFrame({'RecipeId': [30, 10, 20, 40], 'TotalTime': [20.0, 15.0, 45.0, None]})
+        self.ratings = pd.DataFrame({'RecipeId': [10, 20, 30, 99], 'Rating': [4.5, 5.0, 3.0, 1.0]})
+        ingredients = pd.DataFrame({'TermId': [0, 1, 2, 3], 'Term': ['flour', 'sugar', 'eggs', 'salt']})
+        recipe_ingredients = pd.DataFrame({'RecipeId': [10, 10, 10, 20, 20, 30, 30, 40, 10],
+                                           'TermId': [0, 1, 2, 0, 1, 0, 3, 3, 0]})
+        keywords = pd.DataFrame({'TermId': [0, 1], 'Term': ['Easy', 'Vegan']})
+        recipe_keywords = pd.DataFrame({'RecipeId': [10, 20, 40], 'TermId': [0, 0, 1]})
+        categories = pd.DataFrame({'TermId': [0, 1], 'Term': ['Dessert', 'Bread']})
+        recipe_categories = pd.DataFrame({'RecipeId': [10, 20, 30], 'TermId': [0, 0, 1]})
+        self.links = {'ingredients': (recipe_ingredients, ingredients), 'keywords': (recipe_keywords, keywords),
+                      'categories': (recipe_categories, categories)}
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def check_search(self, index):
+        # Recipe 20 misses the sugar, recipe 30 the salt and recipe 10 the sugar and eggs, the best rating comes first
+        found = index.search(ingredients=['Flour'])
+        self.assertEqual(found[['RecipeId', 'MissingIngredients']].values.tolist(), [[20, 1], [30, 1], [10, 2]])
+        found = index.search(ingredients=['flour'], available=['salt'], max_missing=1)
+        self.assertEqual(found[['RecipeId', 'MissingIngredients']].values.tolist(), [[30, 0], [20, 1]])
+        self.assertEqual(index.search(ingredients=['flour'], max_total_time=20, min_rating=4)['RecipeId'].tolist(), [10])
+        self.assertEqual(index.search(keywords=['Easy'], category='Dessert', limit=1)['RecipeId'].tolist(), [20])
+        self.assertEqual(index.search(keywords=['Vegan'])['RecipeId'].tolist(), [40])
+        self.assertTrue(index.search(ingredients=['flour', 'butter']).empty)
+
+    def test_search(self):
+        # Frequent terms are stored as bitmaps, the others as posting lists
+        for bitmap_fraction in [0, 1]:
+            with mock.patch('search_index.BITMAP_FRACTION', bitmap_fraction):
+                index = SearchIndex.build(self.recipes, self.ratings, self.links)
+            self.assertEqual(index.arrays['ingredient_counts'].tolist(), [3, 2, 2, 1])
+            self.check_search(index)
+
+    def test_save_and_load(self):
+        path = Path(self.tmp_dir.name) / 'search.index'
+        SearchIndex.build(self.recipes, self.ratings, self.links).save(path)
+        index = SearchIndex.load(path)
+        self.assertEqual(index.terms['categories'], ['Dessert', 'Bread'])
+        self.assertFalse(index.arrays['recipe_ids'].flags.writeable)
+        self.check_search(index)
+
+    def test_from_database(self):
+        config = configparser.ConfigParser()
+        config.read_dict({'DWH': {'DWH_DB_FILE': str(Path(self.tmp_dir.name) / 'dwh.sqlite')}})
+        backend = SQLiteBackend(config)
+        conn, cur = backend.connect()
+        drop_tables(cur, conn, backend)
+        create_tables(cur, conn, backend)
+        inserter = SQLiteInserter(quarantine_dir=Path(self.tmp_dir.name) / 'quarantine')
+        recipes = pd.DataFrame({'RecipeId': [1, 2], 'Name': ['a', 'b'], 'AuthorId': [1, 1], 'TotalTime': [10.0, 50.0]})
+        cur.executemany("INSERT INTO recipes (recipe_id, name, author_id, total_time, category_id) VALUES (?, ?, ?, ?, NULL)",
+                        recipes.values.tolist())
+        inserter.load(conn, cur, ingredients_table_insert, pd.DataFrame({'IngredientId': [0], 'Name': ['flour']}))
+        inserter.load(conn, cur, recipe_ingredients_table_insert,
+                      pd.DataFrame({'RecipeId': [1, 2], 'IngredientId': [0, 0], 'Quantity': ['1', '2']}))
+        inserter.load(conn, cur, recipe_stats_table_insert,
+                      pd.DataFrame({'RecipeId': [1, 2], 'ReviewCount': [2, 0], 'RatingSum': [9.0, 0.0],
+                                    'MeanRating': [4.5, None], 'BayesianRating': [4.0, 4.5], 'LastReviewDate': [None, None],
+                                    'IngredientCount': [1, 1], 'KeywordCount': [0, 0]}))
+        index = SearchIndex.from_database(backend, cur)
+        backend.release(conn)
+        found = index.search(ingredients=['flour'])
+        self.assertEqual(found['RecipeId'].tolist(), [1, 2])
+        self.assertEqual(found['Rating'].tolist()[0], 4.5)
+        self.assertTrue(np.isnan(found['Rating'].tolist()[1]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+import configparser
+import tempfile
+import unittest
+from pathlib import Path
+
+import pandas as pd
+
+from etl import ETLProcess
+from summary_stats import SummaryStats
+from transforms import RECIPES_TABLE_COLUMNS
+
+
+def reviews(review_ids, recipe_ids, author_ids, ratings, dates):
+    return pd.DataFrame({'ReviewId': review_ids, 'AuthorId': author_ids, 'RecipeId': recipe_ids, 'Rating': ratings,
+                         'Review': '', 'DateSubmitted': pd.to_datetime(dates), 'DateModified': pd.to_datetime(dates)})
+
+
+class SummaryStatsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.recipes = pd.DataFrame({'RecipeId': [1, 2], 'AuthorId': pd.array([7, None], dtype=pd.Int64Dtype()),
+                                     'DatePublished': pd.to_datetime(['2019-01-01', '2019-02-01'])})
+        self.recipe_ingredients = pd.DataFrame({'RecipeId': [1, 1, 1], 'IngredientId': [0, 1, 2],
+                                                'RecipeIngredientQuantities': ['1', '2', '3']})
+        self.reviews = reviews([1, 2, 3], [1, 1, 3], [8, 7, 8], [4, 5, 2], ['2020-01-01', '2020-03-01', '2020-02-01'])
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_stats(self):
+        stats = SummaryStats(prior_reviews=2)
+        # The stats of several chunks are combined
+        stats.add('recipes', self.recipes)
+        stats.add('recipe_ingredients', self.recipe_ingredients)
+        stats.add('reviews', self.reviews[:2])
+        stats.add('reviews', self.reviews[2:])
+        stats.add('authors', pd.DataFrame({'AuthorId': [7], 'AuthorName': ['a']}))
+
+        recipe_stats = stats.recipe_stats().set_index('RecipeId')
+        self.assertEqual(recipe_stats.loc[1, ['ReviewCount', 'RatingSum', 'MeanRating', 'IngredientCount', 'KeywordCount']]
+                         .tolist(), [2, 9.0, 4.5, 3, 0])
+        self.assertEqual(recipe_stats.loc[1, 'LastReviewDate'], pd.Timestamp('2020-03-01'))
+        # Prior mean rating 11 / 3 with the weight of 2 reviews
+        self.assertAlmostEqual(recipe_stats.loc[2, 'BayesianRating'], 11 / 3)
+        self.assertAlmostEqual(recipe_stats.loc[1, 'BayesianRating'], (2 * 11 / 3 + 9) / 4)
+        self.assertTrue(pd.isna(recipe_stats.loc[2, 'MeanRating']))
+        # Recipe 3 is only known from its review
+        self.assertTrue(pd.isna(recipe_stats.loc[3, 'IngredientCount']))
+
+        author_stats = stats.author_stats().set_index('AuthorId')
+        self.assertEqual(author_stats.loc[7, ['RecipeCount', 'ReviewCount', 'RatingSum']].tolist(), [1, 1, 5.0])
+        self.assertEqual(author_stats.loc[8, ['RecipeCount', 'ReviewCount', 'MeanRating']].tolist(), [0, 2, 3.0])
+        self.assertEqual(author_stats.loc[8, 'LastReviewDate'], pd.Timestamp('2020-02-01'))
+
+    def test_replaced_recipes_with_tz_aware_dates(self):
+        stats = SummaryStats()
+        recipes = self.recipes.assign(DatePublished=self.recipes['DatePublished'].dt.tz_localize('UTC'))
+        stats.add('recipes', recipes)
+        stats.add('recipes', recipes[['RecipeId', 'AuthorId']][:1], sign=-1)
+        author_stats = stats.author_stats().set_index('AuthorId')
+        self.assertEqual(author_stats.loc[7, 'RecipeCount'], 0)
+        self.assertEqual(author_stats.loc[7, 'LastRecipeDate'], pd.Timestamp('2019-01-01'))
+
+    def test_incremental_load(self):
+        config = configparser.ConfigParser()
+        config.read_dict({'DWH': {'DWH_DB_FILE': str(Path(self.tmp_dir.name) / 'dwh.sqlite')},
+                          'ETL': {'BACKEND': 'sqlite', 'BAYESIAN_PRIOR_REVIEWS': '2',
+                                  'QUARANTINE_DIR': str(Path(self.tmp_dir.name) / 'quarantine')}})
+        config_file = Path(self.tmp_dir.name) / 'dwh.cfg'
+        with open(config_file, 'w') as f:
+            config.write(f)
+
+        etl = ETLProcess(config_file, None, None)
+        conn, cur = etl.connect_to_db()
+        etl.drop_tables(cur, conn)
+        etl.create_tables(cur, conn)
+        etl.load_table(conn, cur, 'reviews', self.reviews)
+        etl.write_summary_tables(cur, conn)
+
+        # Review 1 was modified and is loaded again with another rating, review 4 is new
+        etl = ETLProcess(config_file, None, None)
+        etl.high_water_marks = {'reviews': pd.Timestamp('2020-03-01')}
+        etl.load_table(conn, cur, 'reviews', reviews([1, 4], [1, 2], [8, 8], [1, 3], ['2020-04-01', '2020-04-02']))
+        etl.write_summary_tables(cur, conn)
+
+        cur.execute("SELECT recipe_id, review_count, rating_sum, mean_rating, bayesian_rating, last_review_date "
+                    "FROM recipe_stats ORDER BY recipe_id;")
+        prior_mean = (1 + 5 + 2 + 3) / 4
+        self.assertEqual(cur.fetchall(), [(1, 2, 6.0, 3.0, (2 * prior_mean + 6) / 4, '2020-04-01 00:00:00'),
+                                          (2, 1, 3.0, 3.0, (2 * prior_mean + 3) / 3, '2020-04-02 00:00:00'),
+                                          (3, 1, 2.0, 2.0, (2 * prior_mean + 2) / 3, '2020-02-01 00:00:00')])
+        cur.execute("SELECT author_id, review_count, rating_sum, mean_rating FROM author_stats ORDER BY author_id;")
+        self.assertEqual(cur.fetchall(), [(7, 1, 5.0, 5.0), (8, 3, 6.0, 2.0)])
+
+        # The recipes of the parquet file have tz-aware dates, recipe 1 is replaced by the next load
+        recipes = pd.DataFrame({'RecipeId': [1, 2], 'AuthorId': pd.array([7, 8], dtype=pd.Int64Dtype()),
+                                'DatePublished': pd.to_datetime(['2019-01-01', '2019-02-01'], utc=True)})
+        recipes = recipes.reindex(columns=RECIPES_TABLE_COLUMNS)
+        etl = ETLProcess(config_file, None, None)
+        etl.high_water_marks = {'reviews': pd.Timestamp('2020-04-02')}
+        etl.load_table(conn, cur, 'recipes', recipes)
+        etl.write_summary_tables(cur, conn)
+        etl = ETLProcess(config_file, None, None)
+        etl.high_water_marks = {'recipes': pd.Timestamp('2019-02-01')}
+        etl.load_table(conn, cur, 'recipes', recipes[:1].assign(AuthorId=pd.array([8], dtype=pd.Int64Dtype()),
+                                                                DatePublished=pd.Timestamp('2019-03-01', tz='UTC')))
+        etl.write_summary_tables(cur, conn)
+        cur.execute("SELECT author_id, recipe_count, last_recipe_date FROM author_stats ORDER BY author_id;")
+        self.assertEqual(cur.fetchall(), [(7, 0, '2019-01-01 00:00:00'), (8, 2, '2019-03-01 00:00:00')])
+        etl.release_connection(conn)
+
+
+if __name__ == "__main__":
+    unittest.main()
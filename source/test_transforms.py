@@ -0,0 +1,76 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from key_dictionary import KeyDictionary
+from transforms import (author_names, build_recipe_images, build_recipe_ingredients, build_recipe_keywords,
+                        distinct_list_values, ingredient_names, lower_ingredient_parts, newest_authors, resolve_authors)
+
+
+class TransformsTest(unittest.TestCase):
+    def setUp(self):
+        self.recipes = pd.DataFrame({
+            'RecipeId': [38, 39, 40, 41],
+            'RecipeIngredientParts': [np.array(['Flour', 'sugar', 'Eggs'], dtype=object), np.array(['flour'], dtype=object),
+                                      None, np.array(['salt', None], dtype=object)],
+            'RecipeIngredientQuantities': [np.array(['2', None], dtype=object), np.array([], dtype=object),
+                                           np.array(['1'], dtype=object), np.array(['1', '2'], dtype=object)]})
+
+    def rows(self, data):
+        return data.astype(object).where(data.notna(), None).values.tolist()
+
+    def build(self, recipes):
+        recipes = lower_ingredient_parts(recipes)
+        ingredients = KeyDictionary('IngredientId', 'RecipeIngredient')
+        ingredients.update(ingredient_names(recipes))
+        return ingredients, build_recipe_ingredients(recipes, ingredients)
+
+    def test_ingredients_are_paired_with_quantities_by_position(self):
+        ingredients, recipe_ingredients = self.build(self.recipes)
+        self.assertEqual(list(ingredients.values), ['flour', 'sugar', 'eggs', 'salt'])
+        # Ingredients without quantity, also with a missing quantity at their position, and missing names are dropped
+        self.assertEqual(self.rows(recipe_ingredients), [[38, 0, '2'], [41, 3, '1']])
+
+    def test_arrow_lists(self):
+        list_type = pd.ArrowDtype(pa.list_(pa.string()))
+        recipes = self.recipes.astype({'RecipeIngredientParts': list_type, 'RecipeIngredientQuantities': list_type})
+        self.assertEqual(self.rows(self.build(recipes)[1]), self.rows(self.build(self.recipes)[1]))
+
+    def test_explode_lists(self):
+        recipes = pd.DataFrame({'RecipeId': [1, 2, 3, 4],
+                                'Keywords': [np.array(['Easy', 'Vegan'], dtype=object), None, np.array([], dtype=object),
+                                             np.array([None, 'Easy'], dtype=object)]})
+        keywords = KeyDictionary('KeywordId', 'Keyword')
+        keywords.update(distinct_list_values(recipes['Keywords']))
+        self.assertEqual(list(keywords.values), ['Easy', 'Vegan'])
+        # Missing lists, empty lists and missing values give no rows
+        self.assertEqual(self.rows(build_recipe_keywords(recipes, keywords)), [[1, 0], [1, 1], [4, 0]])
+        images = build_recipe_images(recipes.rename(columns={'Keywords': 'Images'}))
+        self.assertEqual(self.rows(images), [[1, 'Easy'], [1, 'Vegan'], [4, 'Easy']])
+
+    def test_newest_authors(self):
+        reviews = pd.DataFrame({'AuthorId': [1, 1, 2, 3, 4, 4],
+                                'AuthorName': ['old', 'new', '', 'same date', 'first', 'second'],
+                                'DateModified': pd.to_datetime(['2020-01-01', '2021-01-01', '2022-01-01', None,
+                                                                '2020-01-01', '2020-01-01'])})
+        recipes = pd.DataFrame({'AuthorId': [1, 2, 5, 5],
+                                'AuthorName': ['newest recipe', 'recipe', 'older', 'newer'],
+                                'DatePublished': pd.to_datetime(['2023-01-01', '2019-01-01', '2000-01-01', '2001-01-01'])})
+        authors = newest_authors(reviews, recipes)
+        # Non-empty names from the reviews win over newer ones from the recipes, empty ones lose
+        self.assertEqual(authors.sort_values('AuthorId').values.tolist(),
+                         [[1, 'new'], [2, 'recipe'], [3, 'same date'], [4, 'first'], [5, 'newer']])
+
+        # Resolving chunk by chunk gives the same names
+        resolved = None
+        for data, date_column, preferred in [(reviews[:3], 'DateModified', True), (reviews[3:], 'DateModified', True),
+                                             (recipes[:3], 'DatePublished', False), (recipes[3:], 'DatePublished', False)]:
+            resolved = resolve_authors(pd.concat([resolved, author_names(data, date_column, preferred)], ignore_index=True))
+        self.assertEqual(resolved[['AuthorId', 'AuthorName']].sort_values('AuthorId').values.tolist(),
+                         authors.sort_values('AuthorId').values.tolist())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,217 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+RECIPES_TABLE_COLUMNS = ['RecipeId', 'Name', 'AuthorId', 'CookTime', 'PrepTime', 'TotalTime', 'DatePublished', 'Description',
+    'CategoryId', 'Calories', 'FatContent', 'SaturatedFatContent', 'CholesterolContent', 'SodiumContent', 'CarbohydrateContent',
+    'FiberContent', 'SugarContent', 'ProteinContent', 'RecipeServings', 'RecipeYield', 'RecipeInstructions']
+REVIEWS_TABLE_COLUMNS = ['ReviewId', 'AuthorId', 'RecipeId', 'Rating', 'Review', 'DateSubmitted', 'DateModified']
+
+
+def author_names(data, date_column, preferred=False):
+    """Get the author names of reviews or recipes with the date that decides which name is the most recent
+
+    Args:
+        data (pd.Dataframe): Data with the columns AuthorId, AuthorName and the date column
+        date_column (str): Column that decides which author name is the most recent
+        preferred (bool): Prefer the non-empty names of this data over the names of other data
+            and these over its empty names, see resolve_authors
+
+    Returns:
+        pd.DataFrame: Author names with AuthorId, AuthorName, Date and Priority
+    """
+    dates = data[date_column]
+    if dates.dt.tz is not None:
+        dates = dates.dt.tz_convert(None)
+    names = data['AuthorName'].reset_index(drop=True)
+    priority = np.zeros(len(data), dtype=np.int64)
+    if preferred:
+        priority = np.where((names > "").fillna(False).to_numpy(dtype=bool), 1, -1)
+    return pd.DataFrame({'AuthorId': data['AuthorId'].to_numpy(dtype=np.int64),
+                         'AuthorName': names,
+                         'Date': dates.to_numpy(dtype='datetime64[us]'),
+                         'Priority': priority})
+
+
+def resolve_authors(names):
+    """Keep the newest name of each author in one pass over the names of all sources.
+    A name with a higher priority wins over newer names, and of names with the same date the first one wins.
+    The result has the columns of the names, so that it can be resolved again together with more names.
+
+    Args:
+        names (pd.DataFrame): Author names, see author_names
+
+    Returns:
+        pd.DataFrame: One row per author id
+    """
+    # Rank by a single key, the priority above the date in microseconds and missing dates below all others
+    dates = names['Date'].to_numpy(dtype='datetime64[us]').view(np.int64)
+    key = np.where(names['Date'].isna().to_numpy(), -2**54, dates) + names['Priority'].to_numpy() * np.int64(2**56)
+    # One hash pass over the author ids finds the highest key of each author, the first row with it is the newest name
+    codes, author_ids = pd.factorize(names['AuthorId'])
+    highest = np.full(len(author_ids), np.iinfo(np.int64).min)
+    np.maximum.at(highest, codes, key)
+    candidates = np.flatnonzero(key == highest[codes])
+    newest = candidates[~pd.Index(codes[candidates]).duplicated()]
+    return names.take(newest).reset_index(drop=True)
+
+
+def newest_authors(reviews, recipes):
+    """Build the authors table with the newest name of each author in the reviews and recipes.
+    The newest non-empty name from the reviews is preferred over the names from the recipes. In incremental loads only the new rows are passed,
+    so only the authors in them are touched.
+
+    Args:
+        reviews (pd.DataFrame): Reviews with AuthorId, AuthorName and DateModified
+        recipes (pd.DataFrame): Recipes with AuthorId, AuthorName and DatePublished
+
+    Returns:
+        pd.DataFrame: Authors table with AuthorId and AuthorName
+    """
+    names = pd.concat([author_names(reviews, 'DateModified', preferred=True), author_names(recipes, 'DatePublished')],
+                      ignore_index=True)
+    return resolve_authors(names)[['AuthorId', 'AuthorName']]
+
+
+def build_recipes_table(recipes, categories):
+    """Select the columns of the recipes table and replace the category by its id
+
+    Args:
+        recipes (pd.DataFrame): Prepared recipes
+        categories (KeyDictionary): Category ids
+
+    Returns:
+        pd.DataFrame: Recipes table
+    """
+    recipes = recipes.assign(CategoryId=categories.lookup(recipes['RecipeCategory']))
+    df = recipes[RECIPES_TABLE_COLUMNS]
+    return df.astype({'AuthorId': pd.Int64Dtype(), 'CategoryId': pd.Int64Dtype()})
+
+
+def build_recipe_images(recipes):
+    """ Get one row per recipe and image url """
+    return explode_list(recipes, 'Images')
+
+
+def build_recipe_keywords(recipes, keywords):
+    """Get one row per recipe and keyword id
+
+    Args:
+        recipes (pd.DataFrame): Prepared recipes
+        keywords (KeyDictionary): Keyword ids
+
+    Returns:
+        pd.DataFrame: Recipe keywords table with RecipeId and KeywordId
+    """
+    recipe_keywords = explode_list(recipes, 'Keywords', dictionary_encode=True)
+    recipe_keywords['KeywordId'] = keywords.lookup(recipe_keywords['Keywords'])
+    return recipe_keywords[['RecipeId', 'KeywordId']]
+
+
+def list_array(col):
+    """Get a column of string lists as Arrow list array, for object arrays of lists and Arrow lists
+
+    Args:
+        col (pd.Series): Column of lists, e.g. RecipeIngredientParts
+
+    Returns:
+        pa.ListArray: The lists, missing lists are null
+    """
+    if isinstance(col.dtype, pd.ArrowDtype):
+        array = pa.array(col.array)
+    else:
+        array = pa.array(col, type=pa.list_(pa.string()), from_pandas=True)
+    if isinstance(array, pa.ChunkedArray):
+        array = array.combine_chunks()
+    return array.cast(pa.list_(pa.string()))
+
+
+def explode_list(recipes, column, dictionary_encode=False):
+    """Get one row per recipe and value of a list column from the flattened values and the parent index of each value.
+    The values stay in Arrow, missing values and empty lists give no rows.
+
+    Args:
+        recipes (pd.DataFrame): Prepared recipes with RecipeId and the list column
+        column (str): Name of the list column, e.g. Images
+        dictionary_encode (bool): Return the values as categorical, so that they can be looked up once per distinct value
+
+    Returns:
+        pd.DataFrame: RecipeId and the values
+    """
+    lists = list_array(recipes[column])
+    values = pc.list_flatten(lists)
+    rows = pc.list_parent_indices(lists)
+    valid = pc.is_valid(values)
+    values, rows = values.filter(valid), rows.filter(valid).to_numpy()
+    if dictionary_encode:
+        values = values.dictionary_encode().to_pandas()
+    else:
+        values = pd.arrays.ArrowExtensionArray(values)
+    return pd.DataFrame({'RecipeId': recipes['RecipeId'].to_numpy()[rows], column: values})
+
+
+def distinct_list_values(col):
+    """ Get the distinct values of a list column in the order they appear, e.g. for KeyDictionary.update """
+    values = pc.unique(pc.list_flatten(list_array(col)))
+    return pd.Series(values.to_pandas(), dtype=object)
+
+
+def lower_ingredient_parts(recipes):
+    """Lower case the ingredient parts once for ingredient_names and build_recipe_ingredients
+
+    Args:
+        recipes (pd.DataFrame): Prepared recipes with the columns RecipeId, RecipeIngredientParts and RecipeIngredientQuantities
+
+    Returns:
+        pd.DataFrame: The recipes with the lower case ingredient parts as Arrow lists
+    """
+    parts = list_array(recipes['RecipeIngredientParts'])
+    lengths = pc.list_value_length(parts).fill_null(0).to_numpy()
+    offsets = pa.array(np.concatenate([[0], np.cumsum(lengths)]), pa.int32())
+    lowered = pa.ListArray.from_arrays(offsets, pc.utf8_lower(pc.list_flatten(parts)))
+    return recipes.assign(RecipeIngredientParts=pd.Series(pd.arrays.ArrowExtensionArray(lowered), index=recipes.index))
+
+
+def ingredient_names(recipes):
+    """ Get the distinct ingredient names of all recipes, in the order they appear. See lower_ingredient_parts. """
+    return distinct_list_values(recipes['RecipeIngredientParts'])
+
+
+def build_recipe_ingredients(recipes, ingredients):
+    """Pair the ingredient parts with their quantities by position. Only the ingredients with quantities are kept:
+    parts beyond the end of the quantity list and parts whose quantity is missing are dropped.
+    The lists are paired in one pass over their flattened values and offsets.
+
+    Args:
+        recipes (pd.DataFrame): Prepared recipes with lower case ingredient parts, see lower_ingredient_parts
+        ingredients (KeyDictionary): Ingredient ids of the lower case ingredient names
+
+    Returns:
+        pd.DataFrame: Recipe ingredients table with RecipeId, IngredientId and RecipeIngredientQuantities
+    """
+    parts = list_array(recipes['RecipeIngredientParts'])
+    quantities = list_array(recipes['RecipeIngredientQuantities'])
+    part_lengths = pc.list_value_length(parts).fill_null(0).to_numpy()
+    quantity_lengths = pc.list_value_length(quantities).fill_null(0).to_numpy()
+
+    # Row and position in the list of each pair, there are as many pairs as the shorter list has values
+    pairs = np.minimum(part_lengths, quantity_lengths)
+    rows = np.repeat(np.arange(len(pairs)), pairs)
+    positions = np.arange(pairs.sum()) - np.repeat(np.cumsum(pairs) - pairs, pairs)
+    part_index = (np.cumsum(part_lengths) - part_lengths)[rows] + positions
+    quantity_index = (np.cumsum(quantity_lengths) - quantity_lengths)[rows] + positions
+
+    # The names are looked up once per distinct name
+    names = pc.list_flatten(parts).take(part_index).dictionary_encode().to_pandas()
+    recipe_ingredients = pd.DataFrame({
+        'RecipeId': recipes['RecipeId'].to_numpy()[rows],
+        'IngredientId': ingredients.lookup(names),
+        'RecipeIngredientQuantities': pc.list_flatten(quantities).take(quantity_index).to_pandas(),
+    })
+    return recipe_ingredients.dropna(subset=['IngredientId', 'RecipeIngredientQuantities'])
+
+
+def build_reviews_table(reviews):
+    """ Select the columns of the reviews table """
+    return reviews[REVIEWS_TABLE_COLUMNS]
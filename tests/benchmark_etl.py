@@ -0,0 +1,207 @@
+"""Time each stage of the ETL on synthetic data and store the timings as JSON.
+
+The stages are reading and parsing the input files, building the dimensions and tables
+and loading each table. By default the tables are loaded into a SQLite file, another backend
+can be configured with --config. With --baseline, the timings are compared to an earlier result
+and the script fails if a stage got slower than the tolerance.
+
+Usage (from the source directory):
+    python ../tests/benchmark_etl.py --scale 0.1 --output ../benchmarks/results.json
+    python ../tests/benchmark_etl.py --scale 0.1 --baseline ../benchmarks/results.json
+"""
+import argparse
+import configparser
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from graphlib import TopologicalSorter
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'source'))
+from data_parser import DataParser
+from etl import ETLProcess
+from scheduler import table_dependencies
+from sql_queries import foreign_key_query
+from transforms import *
+
+from generate_data import SyntheticData
+
+
+class StageTimer():
+    """ Collect the wall-clock duration and the number of output rows of named stages """
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        """ Time the block as stage, the block may store its number of rows in the yielded dict """
+        result = {}
+        start_time = time.perf_counter()
+        yield result
+        self.stages[name] = {'seconds': time.perf_counter() - start_time, **result}
+        print(f"{name}: {self.stages[name]['seconds']:.3f} s")
+
+
+def git_version():
+    """ Get the commit of the working tree, empty if it is not a git repository """
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+                              cwd=Path(__file__).resolve().parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def benchmark_config(work_dir):
+    """ Config loading into a SQLite file in the working directory """
+    config = configparser.ConfigParser()
+    config.read_dict({'DWH': {'DWH_DB_FILE': str(work_dir / 'dwh.sqlite')},
+                      'ETL': {'BACKEND': 'sqlite', 'QUARANTINE_DIR': str(work_dir / 'quarantine'),
+                              'STAGING_DIR': str(work_dir / 'staging')}})
+    config_file = work_dir / 'benchmark.cfg'
+    with open(config_file, 'w') as f:
+        config.write(f)
+    return config_file
+
+
+def run_benchmark(recipes_file, reviews_file, config_file):
+    """Run the ETL stage by stage and time each stage
+
+    Args:
+        recipes_file (pathlib.Path): Recipes parquet file
+        reviews_file (pathlib.Path): Reviews csv file
+        config_file (pathlib.Path): Config of the ETL, selects the backend
+
+    Returns:
+        dict: Seconds and output rows per stage
+    """
+    timer = StageTimer()
+    parser = DataParser()
+    etl = ETLProcess(config_file, recipes_file, reviews_file)
+
+    with timer.stage('read recipes') as result:
+        recipes = pd.read_parquet(recipes_file)
+        result['rows'] = len(recipes)
+    with timer.stage('read reviews') as result:
+        reviews = pd.read_csv(reviews_file)
+        result['rows'] = len(reviews)
+    with timer.stage('parse recipes'):
+        recipes = parser.clean_recipes(recipes)
+    with timer.stage('parse reviews'):
+        reviews = parser.clean_reviews(reviews)
+
+    etl.load_key_dictionaries()
+    tables = {}
+    # The dimensions are built with the same calls as in ETLProcess.recipe_tasks and load_data
+    with timer.stage('build authors'):
+        tables['authors'] = newest_authors(reviews[['AuthorId', 'AuthorName', 'DateModified']],
+                                           recipes[['AuthorId', 'AuthorName', 'DatePublished']])
+    with timer.stage('build categories'):
+        tables['categories'] = etl.categories.update(recipes['RecipeCategory'])
+    with timer.stage('build keywords'):
+        tables['keywords'] = etl.keywords.update(distinct_list_values(recipes['Keywords']))
+    with timer.stage('build ingredients'):
+        recipe_ingredients = lower_ingredient_parts(recipes[['RecipeId', 'RecipeIngredientParts', 'RecipeIngredientQuantities']])
+        tables['ingredients'] = etl.ingredients.update(ingredient_names(recipe_ingredients))
+    # The transforms of the tables are taken from the tasks of the ETL, the dimensions have no new values anymore
+    tasks = {**etl.recipe_tasks(recipes), **etl.review_tasks(reviews)}
+    for table, task in tasks.items():
+        if isinstance(task, tuple):
+            transform, transform_args = task
+            with timer.stage(f"build {table}"):
+                tables[table] = transform(*transform_args)
+    for table, data in tables.items():
+        timer.stages[f"build {table}"]['rows'] = len(data)
+
+    conn, cur = etl.connect_to_db()
+    etl.drop_tables(cur, conn)
+    etl.create_tables(cur, conn)
+    order = TopologicalSorter({table: table_dependencies(foreign_key_query).get(table, set()) & tables.keys()
+                               for table in tables})
+    for table in order.static_order():
+        with timer.stage(f"load {table}") as result:
+            etl.load_table(conn, cur, table, tables[table])
+            result['rows'] = len(tables[table])
+    with timer.stage('summary tables'):
+        etl.write_summary_tables(cur, conn)
+    etl.release_connection(conn)
+    etl.backend.close()
+    return timer.stages
+
+
+def compare(stages, baseline, tolerance, min_seconds=0.05):
+    """Find the stages that got slower than the baseline
+
+    Args:
+        stages (dict): Timings of this run, see run_benchmark
+        baseline (dict): Timings of an earlier run
+        tolerance (float): Allowed slowdown, e.g. 0.2 for 20 %
+        min_seconds (float): Stages faster than this in both runs are too noisy to compare
+
+    Returns:
+        list of str: Descriptions of the slower stages
+    """
+    regressions = []
+    for name, timing in stages.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]['seconds'], timing['seconds']
+        if max(before, after) >= min_seconds and after > before * (1 + tolerance):
+            regressions.append(f"{name}: {before:.3f} s -> {after:.3f} s (+{after / before - 1:.0%})")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', type=float, default=0.1, help="Size as multiple of the Kaggle dataset")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', type=Path, default=Path('../data/synthetic'),
+                        help="Directory of the generated data, it is reused for the same scale and seed")
+    parser.add_argument('--config', type=Path, help="ETL config selecting the backend, default a temporary SQLite file")
+    parser.add_argument('--output', type=Path, help="JSON file for the results")
+    parser.add_argument('--baseline', type=Path, help="JSON file of an earlier run to compare with")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed slowdown against the baseline")
+    args = parser.parse_args()
+
+    data_dir = args.data_dir / f"scale{args.scale:g}_seed{args.seed}"
+    recipes_file, reviews_file = data_dir / 'recipes.parquet', data_dir / 'reviews.csv'
+    if not (recipes_file.exists() and reviews_file.exists()):
+        data = SyntheticData(args.scale, args.seed)
+        print(f"Generating {data.num_recipes} recipes and {data.num_reviews} reviews into {data_dir}")
+        data.write(data_dir)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        config_file = args.config or benchmark_config(Path(work_dir))
+        start_time = time.perf_counter()
+        stages = run_benchmark(recipes_file, reviews_file, config_file)
+        total = time.perf_counter() - start_time
+
+    config = configparser.ConfigParser()
+    config.read(config_file)
+    results = {
+        'version': git_version(),
+        'created': pd.Timestamp.now(tz='UTC').isoformat(),
+        'scale': args.scale,
+        'seed': args.seed,
+        'backend': config.get('ETL', 'BACKEND', fallback='sqlite') if args.config else 'sqlite',
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'total_seconds': total,
+        'stages': stages,
+    }
+    print(f"Total: {total:.2f} s")
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(results, indent=2))
+
+    if args.baseline:
+        regressions = compare(stages, json.loads(args.baseline.read_text())['stages'], args.tolerance)
+        for regression in regressions:
+            print("Slower than baseline:", regression)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,56 @@
+"""Compare the duration parsing of prepare_recipes before and after vectorization.
+The results only differ for durations with days or seconds, which the previous implementation ignored.
+
+Usage (from the source directory):
+    python ../tests/benchmark_parse_duration.py ../data/recipes.parquet
+"""
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'source'))
+from data_parser import parse_duration
+
+
+def parse_duration_rowwise(col):
+    """ Previous implementation: two regex passes and a row-wise apply per column """
+    hour_regex = r'PT(\d+)H.*'
+    minute_regex = r'.?(\d+)M'
+    col_hour = col.str.extract(hour_regex).replace(np.nan, 0).astype('float')
+    col_minute = col.str.extract(minute_regex).replace(np.nan, 0).astype('float')
+    duration_df = pd.concat({'hour': col_hour, 'minute': col_minute}, axis=1)
+    duration = duration_df.apply(lambda col: col.iloc[0] * 60 + col.iloc[1], axis=1)
+    return duration
+
+
+def benchmark(parse, durations):
+    start_time = time.perf_counter()
+    result = durations.apply(parse)
+    return time.perf_counter() - start_time, result
+
+
+if __name__ == "__main__":
+    recipes_file = Path(sys.argv[1]) if len(sys.argv) > 1 else Path('../data/recipes.parquet')
+    durations = pd.read_parquet(recipes_file, columns=['CookTime', 'PrepTime', 'TotalTime'])
+    print(f"{len(durations)} recipes, {pd.unique(durations.values.ravel()).size} distinct durations")
+
+    before, expected = benchmark(parse_duration_rowwise, durations)
+    print(f"Before (row-wise apply): {before:.2f} s")
+    after, result = benchmark(parse_duration, durations)
+    print(f"After (vectorized):      {after:.2f} s ({before / after:.0f}x faster)")
+
+    # The row-wise version ignored days and seconds, e.g. P1DT1H30M gave 30 instead of 1530 minutes
+    strings = durations.to_numpy().ravel()
+    differs = ~np.isclose(expected.to_numpy(float).ravel(), result.to_numpy(float).ravel())
+    fixed = pd.DataFrame({'duration': strings, 'before': expected.to_numpy(float).ravel(),
+                          'after': result.to_numpy(float).ravel()})[differs].drop_duplicates('duration')
+    intended = fixed['duration'].str.contains(r'\d+[DS]', regex=True)
+    print("Same results for the durations without days or seconds:", not (~intended).any())
+    print(f"Fixed durations with days or seconds: {differs.sum()} values, {len(fixed)} distinct, the first 20:")
+    print(fixed[intended].sort_values('duration').head(20).to_string(index=False))
+    if (~intended).any():
+        print("Unexpected differences:")
+        print(fixed[~intended].to_string(index=False))
@@ -1,7 +1,7 @@
 from pathlib import Path
 import pandas as pd
-from etl import unzip_file
 from data_parser import DataParser
+from input_files import open_input
 
 # make smaller file with 100 recipes and corresponding reviews
 parser = DataParser()
@@ -9,9 +9,8 @@ data_filepath = Path(r'.\data')
 reviews_file = data_filepath / 'reviews.csv.zip'
 recipes_zip_file = data_filepath / 'recipes.parquet.zip'
 
-recipes_filename = unzip_file(recipes_zip_file, data_filepath)[0]
-recipes_file = data_filepath / recipes_filename
-recipes =  pd.read_parquet(recipes_file)
+with open_input(recipes_zip_file) as f:
+    recipes = pd.read_parquet(f)
 recipes_small = recipes.head(10)
 recipes_small.to_parquet(r'.\data\recipes_small10.parquet', index=False)
 
@@ -0,0 +1,230 @@
+"""Generate synthetic recipes and reviews in the format of the Kaggle food.com dataset.
+
+The sizes are a multiple of the Kaggle dataset, the categories, keywords and ingredients follow
+Zipf distributions and the list columns are arrays like in the original parquet file.
+
+Usage (from the source directory):
+    python ../tests/generate_data.py --scale 0.1 --output ../data/synthetic
+"""
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Number of recipes, reviews and review authors in the Kaggle dataset
+RECIPES_1X = 522517
+REVIEWS_1X = 1401982
+AUTHORS_1X = 271907
+# Share of the authors that also published recipes
+RECIPE_AUTHOR_SHARE = 0.2
+
+NUM_CATEGORIES = 312
+NUM_KEYWORDS = 315
+NUM_INGREDIENTS = 7300
+NUM_INSTRUCTIONS = 2000
+
+# Durations in minutes and their weights, the most common values in the Kaggle dataset
+DURATION_MINUTES = np.array([5, 10, 15, 20, 25, 30, 40, 45, 60, 75, 90, 120, 180, 240, 360, 480, 1440, 2880])
+DURATION_WEIGHTS = np.array([10, 14, 12, 9, 5, 9, 4, 5, 6, 2, 2, 3, 2, 1, 1, 1, 0.5, 0.2])
+QUANTITIES = np.array(['1', '2', '3', '4', '1/2', '1/4', '3/4', '1 1/2', '6', '8', '12', None], dtype=object)
+RECIPE_COLUMNS = ['RecipeId', 'Name', 'AuthorId', 'AuthorName', 'CookTime', 'PrepTime', 'TotalTime', 'DatePublished',
+                  'Description', 'Images', 'RecipeCategory', 'Keywords', 'RecipeIngredientQuantities',
+                  'RecipeIngredientParts', 'AggregatedRating', 'ReviewCount', 'Calories', 'FatContent',
+                  'SaturatedFatContent', 'CholesterolContent', 'SodiumContent', 'CarbohydrateContent', 'FiberContent',
+                  'SugarContent', 'ProteinContent', 'RecipeServings', 'RecipeYield', 'RecipeInstructions']
+
+
+def zipf_weights(size, exponent=1.1):
+    """ Probabilities of the ranks 1 to size in a Zipf distribution """
+    weights = 1 / np.arange(1, size + 1) ** exponent
+    return weights / weights.sum()
+
+
+def vocabulary(prefix, size, rng, lower_share=0.0):
+    """ Names of a vocabulary, a share of them is written in lower case like in the raw data """
+    names = np.array([f"{prefix} {i}" for i in range(size)], dtype=object)
+    lower = rng.random(size) < lower_share
+    names[lower] = [name.lower() for name in names[lower]]
+    return names
+
+
+def random_lists(rng, num_rows, mean_length, pool, weights=None, max_length=40):
+    """Draw one array of pool values per row, the lengths follow a Poisson distribution
+
+    Returns:
+        tuple of (list of np.ndarray, np.ndarray): The arrays and their lengths
+    """
+    lengths = np.minimum(rng.poisson(mean_length, num_rows), max_length)
+    values = pool[rng.choice(len(pool), lengths.sum(), p=weights)]
+    return np.split(values, np.cumsum(lengths)[:-1]), lengths
+
+
+def iso_durations(minutes):
+    """ Format minutes as ISO 8601 durations, e.g. 90 as PT1H30M. Each distinct value is formatted once. """
+    codes, uniques = pd.factorize(minutes)
+    formatted = []
+    for value in uniques:
+        days, rest = divmod(int(value), 24 * 60)
+        hours, mins = divmod(rest, 60)
+        time_part = (f"{hours}H" if hours else '') + (f"{mins}M" if mins else '')
+        # The time designator is only written with a time, e.g. P2D for whole days
+        duration = 'P' + (f"{days}D" if days else '') + (f"T{time_part}" if time_part else '')
+        formatted.append(duration if duration != 'P' else 'PT0M')
+    return np.append(np.array(formatted, dtype=object), None)[codes]
+
+
+def random_dates(rng, num_rows, start, end):
+    """ Uniformly distributed timestamps between two dates, to the second """
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    seconds = rng.integers(0, int((end - start).total_seconds()), num_rows)
+    return start + pd.to_timedelta(seconds, unit='s')
+
+
+class SyntheticData():
+    """ Generate the recipes and reviews chunk by chunk, so that 100x the Kaggle size fits into memory """
+
+    def __init__(self, scale=1.0, seed=0):
+        """
+        Args:
+            scale (float): Size as multiple of the Kaggle dataset
+            seed (int): Seed of the random generator, the same seed generates the same data
+        """
+        self.rng = np.random.default_rng(seed)
+        self.num_recipes = max(1, int(RECIPES_1X * scale))
+        self.num_reviews = max(1, int(REVIEWS_1X * scale))
+        self.num_authors = max(1, int(AUTHORS_1X * scale))
+        self.categories = vocabulary('Category', NUM_CATEGORIES, self.rng)
+        self.keywords = vocabulary('Keyword', NUM_KEYWORDS, self.rng)
+        self.ingredients = vocabulary('Ingredient', NUM_INGREDIENTS, self.rng, lower_share=0.3)
+        self.instructions = vocabulary('Step', NUM_INSTRUCTIONS, self.rng)
+        self.images = np.array([f"https://img.example.com/{i}.jpg" for i in range(10000)], dtype=object)
+
+    def author_names(self, author_ids):
+        """ Author names with trailing spaces and renamed authors, like in the raw data """
+        names = pd.Series(author_ids).map('user{}'.format).to_numpy(dtype=object)
+        renamed = self.rng.random(len(names)) < 0.02
+        names[renamed] = [f"{name} renamed" for name in names[renamed]]
+        padded = self.rng.random(len(names)) < 0.05
+        names[padded] = [f"{name} " for name in names[padded]]
+        return names
+
+    def recipes_chunk(self, first_id, num_rows):
+        """Generate recipes with the ids first_id to first_id + num_rows - 1
+
+        Returns:
+            pd.DataFrame: Recipes with the columns of the Kaggle parquet file
+        """
+        rng = self.rng
+        author_ids = rng.integers(1, max(2, int(self.num_authors * RECIPE_AUTHOR_SHARE)), num_rows)
+        prep_time = DURATION_MINUTES[rng.choice(len(DURATION_MINUTES), num_rows, p=DURATION_WEIGHTS / DURATION_WEIGHTS.sum())]
+        cook_time = DURATION_MINUTES[rng.choice(len(DURATION_MINUTES), num_rows, p=DURATION_WEIGHTS / DURATION_WEIGHTS.sum())]
+        has_cook_time = rng.random(num_rows) > 0.15
+        parts, num_parts = random_lists(rng, num_rows, 8, self.ingredients, zipf_weights(NUM_INGREDIENTS))
+        # A few recipes have less quantities than ingredient parts
+        num_quantities = np.maximum(num_parts - (rng.random(num_rows) < 0.1) * rng.integers(1, 3, num_rows), 0)
+        quantities = QUANTITIES[rng.integers(0, len(QUANTITIES), num_quantities.sum())]
+        quantities = np.split(quantities, np.cumsum(num_quantities)[:-1])
+        keywords, _ = random_lists(rng, num_rows, 5, self.keywords, zipf_weights(NUM_KEYWORDS))
+        images, _ = random_lists(rng, num_rows, 1.2, self.images)
+        instructions, _ = random_lists(rng, num_rows, 6, self.instructions, max_length=30)
+
+        recipes = pd.DataFrame({
+            'RecipeId': np.arange(first_id, first_id + num_rows),
+            'Name': pd.Series(np.arange(first_id, first_id + num_rows)).map("Recipe {}'s dish".format),
+            'AuthorId': author_ids,
+            'AuthorName': self.author_names(author_ids),
+            'CookTime': np.where(has_cook_time, iso_durations(cook_time), None),
+            'PrepTime': iso_durations(prep_time),
+            'TotalTime': iso_durations(prep_time + np.where(has_cook_time, cook_time, 0)),
+            'DatePublished': random_dates(rng, num_rows, '1999-08-01', '2020-12-20').tz_localize('UTC'),
+            'Description': np.where(rng.random(num_rows) < 0.99, "Make this 'easy' dish for dinner.", None),
+            'Images': images,
+            'RecipeCategory': np.where(rng.random(num_rows) < 0.998, self.categories[
+                rng.choice(NUM_CATEGORIES, num_rows, p=zipf_weights(NUM_CATEGORIES))], None),
+            'Keywords': keywords,
+            'RecipeIngredientQuantities': quantities,
+            'RecipeIngredientParts': parts,
+            'AggregatedRating': np.where(rng.random(num_rows) < 0.5, rng.choice([3.0, 4.0, 4.5, 5.0], num_rows), np.nan),
+            'ReviewCount': np.where(rng.random(num_rows) < 0.5, rng.integers(1, 50, num_rows), np.nan),
+            'Calories': rng.gamma(2, 250, num_rows).round(1),
+            'FatContent': rng.gamma(2, 10, num_rows).round(1),
+            'SaturatedFatContent': rng.gamma(2, 4, num_rows).round(1),
+            'CholesterolContent': rng.gamma(2, 40, num_rows).round(1),
+            'SodiumContent': rng.gamma(2, 400, num_rows).round(1),
+            'CarbohydrateContent': rng.gamma(2, 25, num_rows).round(1),
+            'FiberContent': rng.gamma(2, 2, num_rows).round(1),
+            'SugarContent': rng.gamma(2, 12, num_rows).round(1),
+            'ProteinContent': rng.gamma(2, 10, num_rows).round(1),
+            'RecipeServings': np.where(rng.random(num_rows) < 0.65, rng.integers(1, 13, num_rows), np.nan),
+            'RecipeYield': np.where(rng.random(num_rows) < 0.33, '1 9-inch pie', None),
+            'RecipeInstructions': instructions,
+        })
+        return recipes[RECIPE_COLUMNS]
+
+    def reviews_chunk(self, first_id, num_rows):
+        """Generate reviews with the ids first_id to first_id + num_rows - 1. Popular recipes get more reviews.
+
+        Returns:
+            pd.DataFrame: Reviews with the columns of the Kaggle csv file, timestamps as strings
+        """
+        rng = self.rng
+        author_ids = rng.integers(1, self.num_authors + 1, num_rows)
+        date_submitted = random_dates(rng, num_rows, '2000-01-25', '2020-12-27')
+        modified = rng.random(num_rows) < 0.1
+        date_modified = date_submitted + pd.to_timedelta(np.where(modified, rng.integers(0, 10**7, num_rows), 0), unit='s')
+        date_format = '%Y-%m-%dT%H:%M:%SZ'
+        return pd.DataFrame({
+            'ReviewId': np.arange(first_id, first_id + num_rows),
+            'RecipeId': 1 + (self.num_recipes * rng.random(num_rows) ** 2).astype(np.int64),
+            'AuthorId': author_ids,
+            'AuthorName': self.author_names(author_ids),
+            'Rating': rng.choice(6, num_rows, p=[0.05, 0.01, 0.01, 0.04, 0.16, 0.73]),
+            'Review': np.where(rng.random(num_rows) < 0.999, "It's really good, we'll make it again!", None),
+            'DateSubmitted': date_submitted.strftime(date_format),
+            'DateModified': date_modified.strftime(date_format),
+        })
+
+    def write(self, output_dir, chunk_size=100000):
+        """Write the recipes parquet file and the reviews csv file chunk by chunk
+
+        Args:
+            output_dir (pathlib.Path or str): Directory for recipes.parquet and reviews.csv
+            chunk_size (int): Number of rows generated at once, also the row group size of the parquet file
+
+        Returns:
+            tuple of (pathlib.Path, pathlib.Path): Paths to the recipes and reviews file
+        """
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        recipes_file = output_dir / 'recipes.parquet'
+        reviews_file = output_dir / 'reviews.csv'
+
+        writer = None
+        for first_id in range(1, self.num_recipes + 1, chunk_size):
+            table = pa.Table.from_pandas(self.recipes_chunk(first_id, min(chunk_size, self.num_recipes + 1 - first_id)),
+                                         preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(recipes_file, table.schema)
+            writer.write_table(table)
+        writer.close()
+
+        for first_id in range(1, self.num_reviews + 1, chunk_size):
+            reviews = self.reviews_chunk(first_id, min(chunk_size, self.num_reviews + 1 - first_id))
+            reviews.to_csv(reviews_file, index=False, mode='w' if first_id == 1 else 'a', header=first_id == 1)
+        return recipes_file, reviews_file
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', type=float, default=1.0, help="Size as multiple of the Kaggle dataset, e.g. 1, 10 or 100")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunk-size', type=int, default=100000)
+    parser.add_argument('--output', type=Path, default=Path('../data/synthetic'))
+    args = parser.parse_args()
+
+    data = SyntheticData(args.scale, args.seed)
+    print(f"Generating {data.num_recipes} recipes and {data.num_reviews} reviews into {args.output}")
+    data.write(args.output, args.chunk_size)